@@ -11,6 +11,9 @@ cd lambda-deployment
 cp ../roof_adjustment_engine.py .
 cp ../roof_master_macro.csv .
 
+# Precompile the catalog so cold starts load it without parsing the CSV
+python3 roof_adjustment_engine.py --compile-catalog roof_master_macro.csv
+
 # Create Lambda handler
 cat > index.py << 'EOF'
 import json
@@ -8,19 +8,251 @@ apply industry-standard adjustments based on roof geometry and material specific
 Usage:
     python roof_adjustment_engine.py --line-items line_items.json --roof-data roof_data.json
     python roof_adjustment_engine.py --input combined_data.json
+    python roof_adjustment_engine.py --batch claims.jsonl --executor process --output results.jsonl
 """
 
 import json
 import math
 import argparse
+import io
 import sys
 import os
 import traceback
+import time
 import csv
-from typing import Dict, List, Any, Optional
+import re
+import hashlib
+import pickle
+import threading
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Mapping
+from collections.abc import MutableMapping
 from dataclasses import dataclass
 from decimal import Decimal, ROUND_UP
-import copy
+import bisect
+import heapq
+import weakref
+import contextlib
+import difflib
+
+try:
+    import numpy as np
+except ImportError:  # Optional: batch metric evaluation falls back to pure Python
+    np = None
+import itertools
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+# ---------------------------------------------------------------------------
+# Tracing
+# ---------------------------------------------------------------------------
+
+TRACE_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'off': 100}
+
+
+class TraceRecord:
+    """A single trace event; the message is only formatted when read."""
+
+    __slots__ = ('level', 'template', 'args', 'timestamp', 'exc_text')
+
+    def __init__(self, level: str, template: str, args: tuple, exc_text: Optional[str] = None):
+        self.level = level
+        self.template = template
+        self.args = args
+        self.timestamp = time.time()
+        self.exc_text = exc_text
+
+    @property
+    def message(self) -> str:
+        message = self.template.format(*self.args) if self.args else self.template
+        if self.exc_text:
+            message = f"{message}\n{self.exc_text}"
+        return message
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'timestamp': self.timestamp, 'level': self.level, 'message': self.message}
+
+
+class NullTraceSink:
+    """Discards every record."""
+
+    def emit(self, record: TraceRecord) -> None:
+        pass
+
+
+class StreamTraceSink:
+    """Writes formatted messages to a text stream (stderr by default)."""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def emit(self, record: TraceRecord) -> None:
+        stream = self.stream if self.stream is not None else sys.stderr
+        stream.write(record.message + "\n")
+
+
+class JsonlTraceSink:
+    """Appends one JSON object per record to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record: TraceRecord) -> None:
+        line = json.dumps(record.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+class MemoryTraceSink:
+    """Keeps records in memory (unformatted) for tests and on-demand dumps."""
+
+    def __init__(self):
+        self.records: List[TraceRecord] = []
+
+    def emit(self, record: TraceRecord) -> None:
+        self.records.append(record)
+
+    @property
+    def messages(self) -> List[str]:
+        return [record.message for record in self.records]
+
+
+class EngineTrace:
+    """Leveled trace facility with pluggable sinks.
+
+    Messages are str.format templates plus arguments; nothing is formatted
+    unless a record passes the level check, so disabled levels cost one
+    comparison. Expensive dumps should additionally be guarded with
+    debug_enabled / info_enabled.
+    """
+
+    def __init__(self, level: str = 'warning', sinks: Optional[List[Any]] = None):
+        self.sinks = list(sinks) if sinks is not None else [StreamTraceSink()]
+        self.set_level(level)
+
+    def set_level(self, level: str) -> None:
+        if level not in TRACE_LEVELS:
+            raise ValueError(f"Unknown trace level '{level}'. Expected one of: {', '.join(TRACE_LEVELS)}")
+        self.level = level
+        self.threshold = TRACE_LEVELS[level]
+        self.debug_enabled = self.threshold <= TRACE_LEVELS['debug']
+        self.info_enabled = self.threshold <= TRACE_LEVELS['info']
+
+    def _emit(self, level: str, template: str, args: tuple, exc_text: Optional[str] = None) -> None:
+        record = TraceRecord(level, template, args, exc_text)
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def debug(self, template: str, *args) -> None:
+        if self.debug_enabled:
+            self._emit('debug', template, args)
+
+    def info(self, template: str, *args) -> None:
+        if self.info_enabled:
+            self._emit('info', template, args)
+
+    def warning(self, template: str, *args) -> None:
+        if self.threshold <= TRACE_LEVELS['warning']:
+            self._emit('warning', template, args)
+
+    def error(self, template: str, *args) -> None:
+        if self.threshold <= TRACE_LEVELS['error']:
+            self._emit('error', template, args)
+
+    def exception(self, template: str, *args) -> None:
+        """Error record with the current exception's traceback attached."""
+        if self.threshold <= TRACE_LEVELS['error']:
+            self._emit('error', template, args, traceback.format_exc())
+
+
+def _default_trace_level() -> str:
+    level = os.environ.get('ROOF_ENGINE_TRACE_LEVEL', 'warning').lower()
+    return level if level in TRACE_LEVELS else 'warning'
+
+
+# Process-wide default trace; production level is 'warning'
+TRACE = EngineTrace(_default_trace_level())
+
+
+class RuleText:
+    """Human-readable rule text, kept as the rule id, its template and numeric parameters.
+
+    Adjustment reasons, audit explanations and item narratives hold these
+    while a claim is processed; the text is only formatted when str() is
+    taken, i.e. when a result is rendered or serialized.
+    """
+
+    __slots__ = ('rule_id', 'template', 'params')
+
+    def __init__(self, rule_id: str, template: str, params: Dict[str, Any]):
+        self.rule_id = rule_id
+        self.template = template
+        self.params = params
+
+    def __str__(self) -> str:
+        return self.template.format(**self.params)
+
+    def __format__(self, spec: str) -> str:
+        return format(str(self), spec)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, RuleText):
+            return self.template == other.template and self.params == other.params
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.template, tuple(self.params.items())))
+
+    def __repr__(self) -> str:
+        return f"RuleText({self.rule_id!r}, {self.params!r})"
+
+    def __reduce__(self):
+        return (RuleText, (self.rule_id, self.template, self.params))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact form: the rule id and parameters, without the text."""
+        return {'rule_id': self.rule_id, 'params': dict(self.params)}
+
+
+# Result fields that may hold a RuleText, by result section
+RULE_TEXT_FIELDS = {
+    'adjusted_line_items': 'narrative',
+    'audit_log': 'explanation',
+    'adjustments': 'reason',
+}
+
+
+def _rendered_entries(entries: List[Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
+    """entries with a RuleText in field replaced by a copy holding its text; others are shared."""
+    rendered = entries
+    for index, entry in enumerate(entries):
+        value = entry.get(field)
+        if isinstance(value, RuleText):
+            if rendered is entries:
+                rendered = list(entries)
+            rendered[index] = {**entry, field: str(value)}
+    return rendered
+
+
+def render_rule_texts(result: Dict[str, Any]) -> Dict[str, Any]:
+    """A process_claim(render_text=False) result with every RuleText formatted into its text."""
+    rendered = dict(result)
+    for section in ('adjusted_line_items', 'audit_log'):
+        rendered[section] = _rendered_entries(result[section], RULE_TEXT_FIELDS[section])
+    rendered['adjustment_results'] = dict(result['adjustment_results'])
+    rendered['adjustment_results']['adjustments'] = _rendered_entries(
+        result['adjustment_results']['adjustments'], RULE_TEXT_FIELDS['adjustments'])
+    return rendered
+
+
+def rule_text_json(value: Any) -> Any:
+    """json.dumps default= hook rendering RuleText values (results kept with render_text=False)."""
+    if isinstance(value, RuleText):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 
 @dataclass
@@ -74,9 +306,15 @@ class AdjustmentResult:
 
     def add_audit_entry(self, line_number: str, description: str, field: str, 
                        before_value: Any, after_value: Any, action: str, 
-                       explanation: str, rule_applied: str):
-        """Add an audit log entry for tracking changes."""
-        self.audit_log.append({
+                       explanation: str, rule_applied: str,
+                       catalog_match: Optional[Dict[str, Any]] = None):
+        """Add an audit log entry for tracking changes.
+
+        catalog_match (see RoofAdjustmentEngine.match_description) records
+        how a price was found when the description matched no catalog row
+        exactly.
+        """
+        entry = {
             'line_number': line_number,
             'description': description,
             'field': field,
@@ -86,11 +324,15 @@ class AdjustmentResult:
             'explanation': explanation,
             'rule_applied': rule_applied,
             'timestamp': None  # Could add timestamp if needed
-        })
+        }
+        if catalog_match is not None:
+            entry['catalog_match'] = catalog_match
+        self.audit_log.append(entry)
 
     def add_audit_entry_for_item(self, item: Dict[str, Any], field: str, 
                                 before_value: Any, after_value: Any, 
-                                explanation: str, rule_applied: str):
+                                explanation: str, rule_applied: str,
+                                catalog_match: Optional[Dict[str, Any]] = None):
         """Convenience method to add audit entry for a line item."""
         self.add_audit_entry(
             line_number=str(item.get('line_number', 'N/A')),
@@ -100,155 +342,3225 @@ class AdjustmentResult:
             after_value=after_value,
             action='adjusted',
             explanation=explanation,
-            rule_applied=rule_applied
+            rule_applied=rule_applied,
+            catalog_match=catalog_match
+        )
+
+
+def _description_key(item: Dict[str, Any]) -> str:
+    """Key used to match line items by description (exact match, surrounding whitespace ignored)."""
+    return item.get("description", "").strip()
+
+
+class _Missing:
+    """Marker for a model field that was never given (pickles as the module singleton)."""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return '<missing>'
+
+    def __reduce__(self):
+        return '_MISSING'
+
+
+_MISSING = _Missing()
+
+
+def _coerce_number(value: Any) -> Any:
+    """Ingest coercion for numeric fields: finite numeric strings become floats, anything else (ints too) is kept."""
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        return number if math.isfinite(number) else value
+    return value
+
+
+def _coerce_page_number(value: Any) -> Any:
+    """Integral page numbers (3, 3.0, '3', '3.0') become ints; anything else (3.5, 'iv') is kept."""
+    if isinstance(value, (bool, int)):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return value
+    return int(number) if number.is_integer() else value
+
+
+class LineItem(MutableMapping):
+    """Compact line item model (slots instead of a per-item dict).
+
+    Numeric fields are coerced once at construction. Fields that were never
+    given stay absent, and unknown keys are kept in extra, so
+    LineItem.from_dict(d).to_dict() reproduces d (numeric strings aside).
+    It also behaves as a mutable mapping with the JSON keys, so the engine
+    can process LineItem lists directly.
+    """
+
+    FIELDS = ('line_number', 'description', 'quantity', 'unit', 'unit_price', 'RCV',
+              'age_life', 'condition', 'dep_percent', 'depreciation_amount', 'ACV',
+              'location_room', 'category', 'page_number')
+    NUMERIC_FIELDS = frozenset(('quantity', 'unit_price', 'RCV', 'dep_percent', 'depreciation_amount', 'ACV'))
+    _FIELD_SET = frozenset(FIELDS)
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, line_number: Any = _MISSING, description: Any = _MISSING, quantity: Any = _MISSING,
+                 unit: Any = _MISSING, unit_price: Any = _MISSING, RCV: Any = _MISSING,
+                 age_life: Any = _MISSING, condition: Any = _MISSING, dep_percent: Any = _MISSING,
+                 depreciation_amount: Any = _MISSING, ACV: Any = _MISSING, location_room: Any = _MISSING,
+                 category: Any = _MISSING, page_number: Any = _MISSING, extra: Optional[Dict[str, Any]] = None):
+        self.line_number = line_number
+        self.description = description
+        self.quantity = _coerce_number(quantity)
+        self.unit = unit
+        self.unit_price = _coerce_number(unit_price)
+        self.RCV = _coerce_number(RCV)
+        self.age_life = age_life
+        self.condition = condition
+        self.dep_percent = _coerce_number(dep_percent)
+        self.depreciation_amount = _coerce_number(depreciation_amount)
+        self.ACV = _coerce_number(ACV)
+        self.location_room = location_room
+        self.category = category
+        self.page_number = _coerce_page_number(page_number)
+        self.extra = dict(extra) if extra else {}
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> 'LineItem':
+        """Build a LineItem from the JSON dict shape used by the Lambda and API routes."""
+        fields = {key: value for key, value in data.items() if key in cls._FIELD_SET}
+        extra = {key: value for key, value in data.items() if key not in cls._FIELD_SET}
+        return cls(extra=extra, **fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The JSON dict shape: present fields in canonical order, then extra keys."""
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not _MISSING:
+                data[field] = value
+        data.update(self.extra)
+        return data
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return self.extra[key]
+
+    def get(self, key, default=None):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        return self.extra.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        if key in self._FIELD_SET:
+            return getattr(self, key) is not _MISSING
+        return key in self.extra
+
+    def __setitem__(self, key, value) -> None:
+        if key in self._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key) -> None:
+        if key not in self:
+            raise KeyError(key)
+        if key in self._FIELD_SET:
+            setattr(self, key, _MISSING)
+        else:
+            del self.extra[key]
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"LineItem({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state) -> None:
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+
+def as_line_item_dicts(line_items: List[Any]) -> List[Dict[str, Any]]:
+    """line_items with any LineItem models converted to plain dicts (the list itself if there are none)."""
+    if not any(isinstance(item, LineItem) for item in line_items):
+        return line_items
+    return [item.to_dict() if isinstance(item, LineItem) else item for item in line_items]
+
+
+def _numeric_line_number(item: Dict[str, Any]) -> Optional[int]:
+    """An item's line number as an int, or None for 'N/A', None and other non-numeric values."""
+    try:
+        return int(item.get("line_number", 0))
+    except (ValueError, TypeError):
+        return None
+
+
+def _page_number(item: Dict[str, Any]) -> Optional[int]:
+    """An item's page number as an int, or None if it cannot be converted."""
+    try:
+        return int(item.get("page_number", 0))
+    except (ValueError, TypeError):
+        return None
+
+
+def _cost(item: Dict[str, Any], field: str) -> float:
+    """Numeric RCV/ACV value of an item (0 if missing or not numeric)."""
+    try:
+        return float(item.get(field) or 0)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+class IndexedLineItems(list):
+    """List of line item dicts with a maintained description index and aggregates.
+
+    Behaves like a plain list (and serializes like one), but keeps a
+    description -> items map current so exact description lookups are O(1).
+    Several items may share a description; lookups return the first one in
+    list order, exactly like a linear scan would.
+
+    It also keeps the largest numeric line number and the largest page
+    number, updated as items are appended. Call refresh(item) after changing
+    one of those fields on an item in place.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self._rebuild_index()
+
+    @classmethod
+    def wrap(cls, line_items: List[Dict[str, Any]]) -> 'IndexedLineItems':
+        """Return line_items itself if already indexed, otherwise an indexed copy of the list."""
+        if isinstance(line_items, cls):
+            return line_items
+        return cls(line_items)
+
+    def _rebuild_index(self) -> None:
+        self._index: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[int, int] = {}
+        self._aggregates: Dict[int, tuple] = {}
+        self._max_line_number: Optional[int] = None
+        self._max_page_number: Optional[int] = None
+        self._invalid_pages = 0
+        for position, item in enumerate(self):
+            self._index_item(item, position)
+
+    def _index_item(self, item: Dict[str, Any], position: int) -> None:
+        self._positions.setdefault(id(item), position)
+        self._index.setdefault(_description_key(item), []).append(item)
+        if id(item) not in self._aggregates:
+            self._add_aggregates(item)
+
+    def _add_aggregates(self, item: Dict[str, Any]) -> None:
+        line_number, page_number = _numeric_line_number(item), _page_number(item)
+        self._aggregates[id(item)] = (line_number, page_number)
+        if line_number is not None and (self._max_line_number is None or line_number > self._max_line_number):
+            self._max_line_number = line_number
+        if page_number is None:
+            self._invalid_pages += 1
+        elif self._max_page_number is None or page_number > self._max_page_number:
+            self._max_page_number = page_number
+
+    def refresh(self, item: Dict[str, Any]) -> None:
+        """Re-read an item's line number and page number after an in-place change."""
+        old = self._aggregates.pop(id(item), None)
+        if old is None:
+            return
+        line_number, page_number = old
+        if page_number is None:
+            self._invalid_pages -= 1
+        self._add_aggregates(item)
+        new_line_number, new_page_number = self._aggregates[id(item)]
+        # A maximum can only drop if the item that held it changed
+        if line_number is not None and line_number == self._max_line_number and new_line_number != line_number:
+            self._max_line_number = max((a[0] for a in self._aggregates.values() if a[0] is not None), default=None)
+        if page_number is not None and page_number == self._max_page_number and new_page_number != page_number:
+            self._max_page_number = max((a[1] for a in self._aggregates.values() if a[1] is not None), default=None)
+
+    def replace(self, position: int, item: Dict[str, Any]) -> None:
+        """Put item at position in place of the current one, updating the index and aggregates in place."""
+        old = self[position]
+        key = _description_key(old)
+        bucket = self._index.get(key)
+        if bucket is not None:
+            bucket[:] = [other for other in bucket if other is not old]
+            if not bucket:
+                del self._index[key]
+        del self._positions[id(old)]
+        line_number, page_number = self._aggregates.pop(id(old))
+        if page_number is None:
+            self._invalid_pages -= 1
+        # A maximum can only drop if the item that held it goes
+        if line_number is not None and line_number == self._max_line_number:
+            self._max_line_number = max((a[0] for a in self._aggregates.values() if a[0] is not None), default=None)
+        if page_number is not None and page_number == self._max_page_number:
+            self._max_page_number = max((a[1] for a in self._aggregates.values() if a[1] is not None), default=None)
+        super().__setitem__(position, item)
+        self._positions[id(item)] = position
+        bucket = self._index.setdefault(_description_key(item), [])
+        insert_at = len(bucket)
+        for i, other in enumerate(bucket):
+            if self._positions[id(other)] > position:
+                insert_at = i
+                break
+        bucket.insert(insert_at, item)
+        self._add_aggregates(item)
+
+    def seed_aggregates(self, source: 'IndexedLineItems') -> None:
+        """Take the line and page number maxima of a larger collection whose items include these ones.
+
+        Lets a subset stand in for the whole claim when new items are numbered.
+        The source must be non-empty with valid page numbers.
+        """
+        if source._invalid_pages or source._max_page_number is None:
+            raise ValueError("seed_aggregates needs a non-empty source with valid page numbers")
+        if source._max_line_number is not None:
+            self._max_line_number = max(self._max_line_number if self._max_line_number is not None
+                                        else source._max_line_number, source._max_line_number)
+        self._max_page_number = max(self._max_page_number if self._max_page_number is not None
+                                    else source._max_page_number, source._max_page_number)
+
+    @property
+    def next_line_number(self) -> int:
+        """One past the largest numeric line number (1 if there are none)."""
+        return self._max_line_number + 1 if self._max_line_number is not None else 1
+
+    @property
+    def max_page_number(self) -> int:
+        """Largest page number; raises like max(int(...)) does for an empty list or a bad page number."""
+        if self._invalid_pages or self._max_page_number is None:
+            return max(int(item.get("page_number", 0)) for item in self)
+        return self._max_page_number
+
+    def find(self, desc: str) -> Optional[Dict[str, Any]]:
+        """Return the first item whose description matches desc, or None."""
+        bucket = self._index.get(desc.strip())
+        return bucket[0] if bucket else None
+
+    def set_description(self, item: Dict[str, Any], desc: str) -> None:
+        """Rewrite an item's description and move it to its new index bucket."""
+        old_bucket = self._index.get(_description_key(item))
+        if old_bucket is not None:
+            old_bucket[:] = [other for other in old_bucket if other is not item]
+            if not old_bucket:
+                del self._index[_description_key(item)]
+        item["description"] = desc
+        position = self._positions[id(item)]
+        bucket = self._index.setdefault(_description_key(item), [])
+        insert_at = len(bucket)
+        for i, other in enumerate(bucket):
+            if self._positions[id(other)] > position:
+                insert_at = i
+                break
+        bucket.insert(insert_at, item)
+
+    def append(self, item: Dict[str, Any]) -> None:
+        super().append(item)
+        self._index_item(item, len(self) - 1)
+
+    def extend(self, items) -> None:
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def _mutate_and_reindex(name):
+        def mutator(self, *args, **kwargs):
+            result = getattr(super(IndexedLineItems, self), name)(*args, **kwargs)
+            self._rebuild_index()
+            return result
+        mutator.__name__ = name
+        return mutator
+
+    # Less common mutators just rebuild the index
+    insert = _mutate_and_reindex('insert')
+    pop = _mutate_and_reindex('pop')
+    remove = _mutate_and_reindex('remove')
+    clear = _mutate_and_reindex('clear')
+    sort = _mutate_and_reindex('sort')
+    reverse = _mutate_and_reindex('reverse')
+    __setitem__ = _mutate_and_reindex('__setitem__')
+    __delitem__ = _mutate_and_reindex('__delitem__')
+    __imul__ = _mutate_and_reindex('__imul__')
+    del _mutate_and_reindex
+
+
+_DELETED = object()
+
+
+class LineItemOverlay(MutableMapping):
+    """Copy-on-write view of a line item dict.
+
+    Reads fall through to the original item; writes are kept in the overlay so
+    the original is never modified and unmodified fields are never copied.
+    """
+
+    __slots__ = ('base', 'changes')
+
+    def __init__(self, base: Dict[str, Any]):
+        self.base = base
+        self.changes: Dict[str, Any] = {}
+
+    def __getitem__(self, key):
+        changes = self.changes
+        if key in changes:
+            value = changes[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        return self.base[key]
+
+    def get(self, key, default=None):
+        changes = self.changes
+        if key in changes:
+            value = changes[key]
+            return default if value is _DELETED else value
+        return self.base.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        if key in self.changes:
+            return self.changes[key] is not _DELETED
+        return key in self.base
+
+    def __setitem__(self, key, value) -> None:
+        self.changes[key] = value
+
+    def __delitem__(self, key) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.changes[key] = _DELETED
+
+    def __iter__(self):
+        changes = self.changes
+        for key in self.base:
+            if changes.get(key) is not _DELETED:
+                yield key
+        for key, value in changes.items():
+            if key not in self.base and value is not _DELETED:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"LineItemOverlay({self.to_dict()!r})"
+
+    @property
+    def is_modified(self) -> bool:
+        return bool(self.changes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The adjusted item: the original dict itself if untouched, else a merged copy."""
+        if not self.changes:
+            return self.base.to_dict() if isinstance(self.base, LineItem) else self.base
+        return {key: self[key] for key in self}
+
+
+class CopyOnWriteLineItems(IndexedLineItems):
+    """Indexed copy-on-write view over a claim's line items (replaces a deepcopy).
+
+    Original items are wrapped in LineItemOverlay views; items appended while
+    processing are plain dicts.
+    """
+
+    def __init__(self, line_items=()):
+        super().__init__(LineItemOverlay(item) for item in line_items)
+
+    def materialize(self) -> List[Dict[str, Any]]:
+        """Adjusted line items as plain dicts; unmodified originals are shared, not copied."""
+        return [item.to_dict() if isinstance(item, LineItemOverlay) else item for item in self]
+
+    def changed_items(self) -> List[Dict[str, Any]]:
+        """Only the modified and newly added line items, as plain dicts."""
+        return [item.to_dict() if isinstance(item, LineItemOverlay) else item
+                for item in self
+                if not isinstance(item, LineItemOverlay) or item.is_modified]
+
+
+_DASH_PATTERN = re.compile(r'\s*-\s*')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_description(desc: str) -> str:
+    """Normalize a description for matching (dashes become spaces, whitespace collapsed, lowercased)."""
+    normalized = _DASH_PATTERN.sub(' ', desc)  # Replace " - " with " "
+    normalized = _SPACE_PATTERN.sub(' ', normalized)  # Replace multiple spaces with single space
+    return normalized.strip().lower()
+
+
+class _SubstringIndex:
+    """Trigram inverted index answering exact substring containment queries over a fixed key list."""
+
+    GRAM = 3
+
+    def __init__(self, keys: List[str]):
+        self.keys = keys
+        self._postings: Dict[str, set] = {}
+        self._gram_counts: List[int] = []
+        self._short_keys: List[int] = []  # Keys too short to have a trigram
+        for ordinal, key in enumerate(keys):
+            grams = self._grams(key)
+            self._gram_counts.append(len(grams))
+            if not grams:
+                self._short_keys.append(ordinal)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(ordinal)
+
+    def to_state(self) -> tuple:
+        """The index as plain data (keys, postings, gram counts, short keys)."""
+        return self.keys, self._postings, self._gram_counts, self._short_keys
+
+    @classmethod
+    def from_state(cls, state: tuple) -> '_SubstringIndex':
+        index = cls.__new__(cls)
+        index.keys, index._postings, index._gram_counts, index._short_keys = state
+        return index
+
+    @classmethod
+    def _grams(cls, text: str) -> set:
+        return {text[i:i + cls.GRAM] for i in range(len(text) - cls.GRAM + 1)}
+
+    def containing(self, query: str) -> List[int]:
+        """Ordinals of keys that contain query."""
+        grams = self._grams(query)
+        if not grams:
+            return [ordinal for ordinal, key in enumerate(self.keys) if query in key]
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return [ordinal for ordinal in candidates if query in self.keys[ordinal]]
+
+    def contained_in(self, query: str) -> List[int]:
+        """Ordinals of keys that are contained in query."""
+        counts: Dict[int, int] = {}
+        for gram in self._grams(query):
+            for ordinal in self._postings.get(gram, ()):
+                counts[ordinal] = counts.get(ordinal, 0) + 1
+        gram_counts = self._gram_counts
+        matches = [ordinal for ordinal, count in counts.items()
+                   if count == gram_counts[ordinal] and self.keys[ordinal] in query]
+        matches.extend(ordinal for ordinal in self._short_keys if self.keys[ordinal] in query)
+        return matches
+
+
+class CatalogMatcher:
+    """Precompiled description matcher over a Roof Master Macro catalog.
+
+    Built once per catalog. Reproduces the lookup_unit_price priority order:
+    exact description, then normalized containment (same removal/installation
+    operation first, earliest catalog row wins), then case-insensitive
+    containment, using substring indexes instead of scanning the catalog.
+
+    With a fuzzy threshold, a description that has no exact match is first
+    compared by similarity (see _fuzzy_match) and only falls back to
+    containment when no catalog description is similar enough. Resolutions
+    are kept in an LRU cache keyed by the raw description.
+    """
+
+    MAX_CACHED_LOOKUPS = 4096
+    FUZZY_CANDIDATES = 8  # Candidates per query scored by sequence similarity
+    FUZZY_MAX_QUERY = 256  # Longer queries are truncated before fuzzy matching
+    FUZZY_MAX_POSTINGS = 4096  # Trigram postings counted per query, rarest trigrams first
+
+    def __init__(self, catalog: Dict[str, Dict[str, Any]], indexes: Optional[tuple] = None):
+        self.catalog = catalog
+        descriptions = list(catalog.keys())
+        self._descriptions = descriptions
+        self._data = [catalog[desc] for desc in descriptions]
+        self._ordinals = {desc: ordinal for ordinal, desc in enumerate(descriptions)}
+        if indexes is None:
+            indexes = ([desc.lower().startswith('remove') for desc in descriptions],
+                       _SubstringIndex([normalize_description(desc) for desc in descriptions]),
+                       _SubstringIndex([desc.lower() for desc in descriptions]))
+        self._is_removal, self._normalized_index, self._lower_index = indexes
+        self._normalized_ordinals: Dict[str, int] = {}
+        for ordinal, key in enumerate(self._normalized_index.keys):
+            self._normalized_ordinals.setdefault(key, ordinal)
+        self._cache: OrderedDict = OrderedDict()  # (description, fuzzy threshold) -> resolution
+        self._cache_lock = threading.Lock()
+
+    @property
+    def indexes(self) -> tuple:
+        """The prebuilt match indexes (reusable for the same catalog, see CatalogMatcher(catalog, indexes))."""
+        return self._is_removal, self._normalized_index, self._lower_index
+
+    def match_ordinal(self, description: str) -> Optional[int]:
+        """Catalog row ordinal that description resolves to (None if nothing matches)."""
+        resolution = self.resolve(description)
+        return None if resolution is None else resolution[0]
+
+    def resolve(self, description: str, fuzzy_threshold: Optional[float] = None) -> Optional[tuple]:
+        """(ordinal, confidence, method) description resolves to, or None if nothing matches.
+
+        method is 'exact', 'normalized' (equal after normalization), 'fuzzy',
+        'contains' or 'contains_ci'; confidence is 1.0 for the first two, the
+        similarity for 'fuzzy' and the length ratio of the contained text for
+        containment.
+        """
+        key = (description, fuzzy_threshold)
+        with self._cache_lock:
+            resolution = self._cache.get(key, _MISSING)
+            if resolution is not _MISSING:
+                self._cache.move_to_end(key)
+                return resolution
+        resolution = self._resolve(description, fuzzy_threshold)
+        with self._cache_lock:
+            self._cache[key] = resolution
+            if len(self._cache) > self.MAX_CACHED_LOOKUPS:
+                self._cache.popitem(last=False)
+        return resolution
+
+    def _resolve(self, description: str, fuzzy_threshold: Optional[float]) -> Optional[tuple]:
+        ordinal = self._ordinals.get(description)
+        if ordinal is not None:
+            return ordinal, 1.0, 'exact'
+        if fuzzy_threshold is not None:
+            normalized_input = normalize_description(description)
+            ordinal = self._normalized_ordinals.get(normalized_input)
+            if ordinal is not None:
+                return ordinal, 1.0, 'normalized'
+            match = self._fuzzy_match(normalized_input, description.lower().startswith('remove'))
+            if match is not None and match[1] >= fuzzy_threshold:
+                return match[0], match[1], 'fuzzy'
+        return self._match(description)
+
+    def _fuzzy_match(self, normalized_input: str, is_removal_input: bool) -> Optional[tuple]:
+        """Most similar catalog description of the same operation as (ordinal, similarity).
+
+        Catalog descriptions sharing the most character trigrams with the
+        input (by Dice coefficient, from the trigram index) are shortlisted,
+        at most FUZZY_CANDIDATES of them, and the shortlist is ranked by
+        sequence similarity. The query is capped at FUZZY_MAX_QUERY characters
+        and shared trigrams are counted from at most FUZZY_MAX_POSTINGS
+        postings, rarest trigrams first (common trigrams say least about which
+        description is closest), so the cost per query is bounded however
+        large the catalog.
+        """
+        query = normalized_input[:self.FUZZY_MAX_QUERY]
+        index = self._normalized_index
+        grams = index._grams(query)
+        if not grams:
+            return None
+        shared: Dict[int, int] = {}
+        budget = self.FUZZY_MAX_POSTINGS
+        for posting in sorted((index._postings.get(gram, ()) for gram in grams), key=len):
+            if budget <= 0:
+                break
+            for ordinal in itertools.islice(posting, budget):
+                shared[ordinal] = shared.get(ordinal, 0) + 1
+            budget -= len(posting)
+        gram_counts = index._gram_counts
+        is_removal = self._is_removal
+        shortlist = heapq.nlargest(
+            self.FUZZY_CANDIDATES,
+            ((2 * count / (len(grams) + gram_counts[ordinal]), -ordinal)
+             for ordinal, count in shared.items() if is_removal[ordinal] == is_removal_input))
+        best = None
+        for _, negative_ordinal in shortlist:
+            ordinal = -negative_ordinal
+            similarity = difflib.SequenceMatcher(None, query, index.keys[ordinal], autojunk=False).ratio()
+            if best is None or similarity > best[1] or (similarity == best[1] and ordinal < best[0]):
+                best = (ordinal, similarity)
+        return best
+
+    def _match(self, description: str) -> Optional[tuple]:
+        normalized_input = normalize_description(description)
+        candidates = set(self._normalized_index.containing(normalized_input))
+        candidates.update(self._normalized_index.contained_in(normalized_input))
+        if candidates:
+            # Prioritize same operation type (removal matches removal, installation matches installation)
+            is_removal_input = description.lower().startswith('remove')
+            same_operation = [ordinal for ordinal in candidates if self._is_removal[ordinal] == is_removal_input]
+            ordinal = min(same_operation or candidates)
+            return ordinal, _length_ratio(normalized_input, self._normalized_index.keys[ordinal]), 'contains'
+
+        # Fallback to original partial matching (case-insensitive)
+        description_lower = description.lower()
+        candidates = set(self._lower_index.containing(description_lower))
+        candidates.update(self._lower_index.contained_in(description_lower))
+        if not candidates:
+            return None
+        ordinal = min(candidates)
+        return ordinal, _length_ratio(description_lower, self._lower_index.keys[ordinal]), 'contains_ci'
+
+    @property
+    def prices(self) -> List[Mapping[str, Any]]:
+        """The catalog's entries in ordinal order."""
+        return self._data
+
+    def description(self, ordinal: int) -> str:
+        """Catalog description at ordinal."""
+        return self._descriptions[ordinal]
+
+    def lookup(self, description: str, prices: Optional[List[Mapping[str, Any]]] = None,
+               fuzzy_threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Catalog entry for description (from prices, in ordinal order, if given), or None if nothing matches."""
+        ordinal = self._ordinals.get(description)
+        if ordinal is None:
+            resolution = self.resolve(description, fuzzy_threshold)
+            if resolution is None:
+                return None
+            ordinal = resolution[0]
+        return (self._data if prices is None else prices)[ordinal]
+
+
+def _length_ratio(text: str, other: str) -> float:
+    """Length of the shorter of two texts (one containing the other) relative to the longer."""
+    longest = max(len(text), len(other))
+    return min(len(text), len(other)) / longest if longest else 1.0
+
+
+def _default_catalog_paths() -> List[str]:
+    """Locations probed for the Roof Master Macro CSV, in priority order."""
+    return [
+        os.path.join(os.path.dirname(__file__), 'roof_master_macro.csv'),
+        os.path.join(os.path.dirname(__file__), '..', 'public', 'roof_master_macro.csv'),
+        os.path.join('public', 'roof_master_macro.csv'),
+        'roof_master_macro.csv'
+    ]
+
+
+def parse_roof_master_macro(text: str) -> Dict[str, Dict[str, Any]]:
+    """Parse Roof Master Macro CSV text (3 columns: description, unit, unit_price).
+
+    A description listed more than once keeps its last row (see
+    parse_roof_master_rows for every row).
+    """
+    return {description: entry for description, entry, _, _, _ in parse_roof_master_rows(text)}
+
+
+def parse_roof_master_rows(text: str) -> List[tuple]:
+    """Every valid price row of Roof Master Macro CSV text, in file order.
+
+    Rows are (description, entry, line, tier, region): line is the row's line
+    in the file, tier and region come from optional Tier and Region columns
+    (None when absent or blank).
+    """
+    price_rows = []
+    try:
+        # Auto-detect delimiter (tab or comma)
+        sample = text[:1024]
+        try:
+            dialect = csv.Sniffer().sniff(sample)
+            csv_reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+        except:
+            # Fallback to comma delimiter
+            csv_reader = csv.DictReader(io.StringIO(text))
+
+        # Resolve the required columns once (case-insensitive, strip whitespace)
+        columns = {}
+        for field in csv_reader.fieldnames or []:
+            columns[field.strip().lower().replace(' ', '_')] = field
+
+        if csv_reader.fieldnames and not {'description', 'unit', 'unit_price'} <= columns.keys():
+            TRACE.warning("⚠️ CSV file missing required columns. Expected: Description, Unit, Unit Price (or description, unit, unit_price)")
+            TRACE.debug("   Found columns: {}", csv_reader.fieldnames)
+            return price_rows
+        tier_column = columns.get('tier')
+        region_column = columns.get('region')
+
+        for row in csv_reader:
+            try:
+                description = row[columns['description']].strip()
+                unit = row[columns['unit']].strip().upper()
+                unit_price = float(row[columns['unit_price']].strip())
+
+                if description and unit and unit_price > 0:
+                    entry = {
+                        'unit_price': unit_price,
+                        'rcv': unit_price,
+                        'acv': unit_price,
+                        'unit': unit
+                    }
+                    tier = (row.get(tier_column) or '').strip() if tier_column else ''
+                    region = (row.get(region_column) or '').strip() if region_column else ''
+                    price_rows.append((description, entry, csv_reader.line_num, tier or None, region or None))
+            except (ValueError, KeyError) as e:
+                TRACE.warning("⚠️ Skipping invalid row: {} - Error: {}", row, e)
+                continue
+    except Exception as e:
+        TRACE.exception("⚠️ Error loading Roof Master Macro CSV: {}", e)
+
+    return price_rows
+
+
+# Which of a description's price rows the engine prices with: 'last' (file
+# order, the historical behavior), 'first', 'max', 'min', 'tier:<name>' or
+# 'region:<name>' (the last row so tagged, else the last row).
+PRICE_POLICIES = ('last', 'first', 'max', 'min')
+PRICE_POLICY_TAGS = {'tier': 1, 'region': 2}  # tag -> position in a (line, tier, region, entry) row
+
+
+def validate_price_policy(policy: str) -> str:
+    """policy if it is a known price policy, else ValueError."""
+    kind, separator, name = policy.partition(':')
+    if (policy in PRICE_POLICIES if not separator else kind in PRICE_POLICY_TAGS and name):
+        return policy
+    raise ValueError(f"Unknown price policy '{policy}'. Expected one of: "
+                     f"{', '.join(PRICE_POLICIES)}, tier:<name>, region:<name>")
+
+
+def _select_price_row(rows: tuple, policy: str) -> tuple:
+    """The row of a description's (line, tier, region, entry) rows that policy selects."""
+    if policy == 'last':
+        return rows[-1]
+    if policy == 'first':
+        return rows[0]
+    if policy == 'max':
+        return max(reversed(rows), key=lambda row: row[3]['unit_price'])  # Ties: the later row
+    if policy == 'min':
+        return min(reversed(rows), key=lambda row: row[3]['unit_price'])
+    kind, _, name = policy.partition(':')
+    position = PRICE_POLICY_TAGS[kind]
+    return next((row for row in reversed(rows) if row[position] == name), rows[-1])
+
+
+# Compiled catalog artifact: magic, format version byte, then a pickle (of
+# builtin types only) of the source CSV digest, the price rows and the
+# matcher's prebuilt indexes.
+CATALOG_ARTIFACT_MAGIC = b'RMMCATALOG'
+CATALOG_ARTIFACT_FORMAT = 2
+CATALOG_ARTIFACT_SUFFIX = '.catalog'
+CATALOG_ARTIFACT_PICKLE_PROTOCOL = 4
+
+
+class _ArtifactUnpickler(pickle.Unpickler):
+    """Unpickler for catalog artifacts: builtin containers and scalars only.
+
+    Every class or function reference is refused, so an artifact cannot
+    import or call anything while it is loaded.
+    """
+
+    def find_class(self, module: str, name: str):
+        raise pickle.UnpicklingError(f"Catalog artifacts may not reference {module}.{name}")
+
+
+class RoofMasterCatalog:
+    """Immutable Roof Master Macro catalog shared by every engine instance.
+
+    entries is a read-only description -> entry mapping (entries are read-only
+    too) and matcher is the CatalogMatcher compiled for it. indexes are
+    prebuilt matcher indexes for these entries (from a compiled artifact).
+
+    rows keeps every price row of a description as (line, tier, region,
+    entry) tuples in file order; entries holds the last one. prices(policy)
+    selects one row per description, once per policy.
+    """
+
+    def __init__(self, entries: Dict[str, Dict[str, Any]], path: Optional[str] = None,
+                 digest: Optional[str] = None, indexes: Optional[tuple] = None,
+                 rows: Optional[Dict[str, List[tuple]]] = None):
+        self.path = path
+        self.digest = digest
+        if rows is None:
+            rows = {desc: [(None, None, None, entry)] for desc, entry in entries.items()}
+        self.rows: Mapping[str, tuple] = MappingProxyType({
+            desc: tuple((line, tier, region, MappingProxyType(dict(entry))) for line, tier, region, entry in desc_rows)
+            for desc, desc_rows in rows.items()
+        })
+        self.entries: Mapping[str, Mapping[str, Any]] = MappingProxyType(
+            {desc: desc_rows[-1][3] for desc, desc_rows in self.rows.items()}
         )
+        self.matcher = CatalogMatcher(self.entries, indexes)
+        self._prices: Dict[str, List[Mapping[str, Any]]] = {'last': self.matcher.prices}
+        self._footprint: Optional[int] = None
+
+    @classmethod
+    def from_rows(cls, price_rows: List[tuple], path: Optional[str] = None,
+                  digest: Optional[str] = None) -> 'RoofMasterCatalog':
+        """Catalog from parse_roof_master_rows output."""
+        rows: Dict[str, List[tuple]] = {}
+        for description, entry, line, tier, region in price_rows:
+            rows.setdefault(description, []).append((line, tier, region, entry))
+        return cls({}, path, digest, rows=rows)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def prices(self, policy: str) -> List[Mapping[str, Any]]:
+        """The entry policy selects for each description, in matcher ordinal order."""
+        prices = self._prices.get(policy)
+        if prices is None:
+            validate_price_policy(policy)
+            prices = [_select_price_row(desc_rows, policy)[3] for desc_rows in self.rows.values()]
+            self._prices[policy] = prices
+        return prices
+
+    def footprint(self) -> int:
+        """Approximate memory held by the catalog and its indexes, in bytes (computed once)."""
+        if self._footprint is None:
+            is_removal, normalized_index, lower_index = self.matcher.indexes
+            self._footprint = _deep_sizeof((self.rows, self.matcher._ordinals, self.matcher._normalized_ordinals,
+                                            is_removal, normalized_index.to_state(), lower_index.to_state()))
+        return self._footprint
+
+    def price_rows(self, description: str) -> List[Dict[str, Any]]:
+        """Every price row listed for description, tagged with its line, tier and region."""
+        return [{'line': line, 'tier': tier, 'region': region, **entry}
+                for line, tier, region, entry in self.rows.get(description, ())]
+
+    def to_artifact(self) -> bytes:
+        """The catalog as a compiled artifact (see load_artifact)."""
+        is_removal, normalized_index, lower_index = self.matcher.indexes
+        rows = {desc: [(line, tier, region, dict(entry)) for line, tier, region, entry in desc_rows]
+                for desc, desc_rows in self.rows.items()}
+        payload = (self.digest, rows, is_removal, normalized_index.to_state(), lower_index.to_state())
+        return (CATALOG_ARTIFACT_MAGIC + bytes([CATALOG_ARTIFACT_FORMAT])
+                + pickle.dumps(payload, protocol=CATALOG_ARTIFACT_PICKLE_PROTOCOL))
+
+    @classmethod
+    def load_artifact(cls, data: bytes, path: Optional[str] = None,
+                      digest: Optional[str] = None) -> Optional['RoofMasterCatalog']:
+        """Catalog from a compiled artifact, or None if it is from another format or (given digest) another CSV.
+
+        The payload is read with _ArtifactUnpickler, which loads plain data
+        only; an artifact that references any class raises UnpicklingError.
+        """
+        header = len(CATALOG_ARTIFACT_MAGIC)
+        if data[:header] != CATALOG_ARTIFACT_MAGIC or data[header:header + 1] != bytes([CATALOG_ARTIFACT_FORMAT]):
+            return None
+        payload = _ArtifactUnpickler(io.BytesIO(data[header + 1:])).load()
+        source_digest, rows, is_removal, normalized_state, lower_state = payload
+        if digest is not None and source_digest != digest:
+            return None
+        indexes = (is_removal, _SubstringIndex.from_state(normalized_state), _SubstringIndex.from_state(lower_state))
+        return cls({}, path, source_digest, indexes, rows)
+
+
+def _deep_sizeof(obj: Any) -> int:
+    """sys.getsizeof of obj and everything it contains (each object counted once)."""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (dict, MappingProxyType)):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return total
+
+
+def catalog_artifact_path(path: str) -> str:
+    """Location of the compiled artifact for a catalog CSV (same name, .catalog suffix)."""
+    return os.path.splitext(path)[0] + CATALOG_ARTIFACT_SUFFIX
+
+
+def compile_catalog_artifact(path: str, artifact_path: Optional[str] = None) -> str:
+    """Compile a Roof Master Macro CSV into its binary artifact; returns the artifact path.
+
+    The artifact holds the parsed entries, the normalized match keys and the
+    matcher indexes, so loading it skips CSV parsing and index building. It
+    records the CSV's content hash and is ignored once the CSV changes.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    catalog = RoofMasterCatalog.from_rows(parse_roof_master_rows(content.decode('utf-8')), os.path.abspath(path),
+                                          hashlib.sha256(content).hexdigest())
+    artifact_path = artifact_path or catalog_artifact_path(path)
+    temporary = f"{artifact_path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(catalog.to_artifact())
+    os.replace(temporary, artifact_path)
+    return artifact_path
+
+
+class CatalogRegistry:
+    """Process-wide cache of parsed catalogs keyed by file path.
+
+    A catalog file is parsed once and then shared across engines and threads.
+    It is only re-parsed when its mtime/size change and its content hash
+    differs from the cached copy. A compiled artifact next to the CSV (see
+    compile_catalog_artifact) is loaded instead of parsing when it was
+    compiled from the CSV's current content. Checking that means reading
+    and hashing the CSV, so such a load reads both files: the artifact
+    saves the parsing and index building, not the CSV read. Staleness is
+    decided by content rather than mtime, which packaging (e.g. zip) does
+    not preserve exactly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalogs: Dict[str, RoofMasterCatalog] = {}
+        self._stats: Dict[str, tuple] = {}
+
+    def get(self, path: Optional[str] = None) -> RoofMasterCatalog:
+        """Shared catalog for path (default: the first Roof Master Macro CSV found)."""
+        if path is None:
+            path = next((candidate for candidate in _default_catalog_paths() if os.path.exists(candidate)), None)
+            if path is None:
+                TRACE.warning("⚠️ Roof Master Macro CSV file not found in any of these locations:")
+                for candidate in _default_catalog_paths():
+                    TRACE.debug("   - {}", candidate)
+                return EMPTY_CATALOG
+        key = os.path.abspath(path)
+        try:
+            stat = os.stat(key)
+        except OSError as e:
+            TRACE.warning("⚠️ Error loading Roof Master Macro CSV: {}", e)
+            return EMPTY_CATALOG
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+
+        catalog = self._catalogs.get(key)
+        if catalog is not None and self._stats.get(key) == stat_key:
+            return catalog
+
+        with self._lock:
+            catalog = self._catalogs.get(key)
+            if catalog is not None and self._stats.get(key) == stat_key:
+                return catalog
+            with open(key, 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if catalog is None or catalog.digest != digest:
+                catalog = self.build(key, content, digest)
+                self._catalogs[key] = catalog
+            self._stats[key] = stat_key
+            return catalog
+
+    @classmethod
+    def build(cls, key: str, content: bytes, digest: str) -> RoofMasterCatalog:
+        """Catalog for the CSV content read from key: its current compiled artifact (read too), else parsed."""
+        catalog = cls._load_artifact(key, digest)
+        if catalog is None:
+            TRACE.info("📂 Loading Roof Master Macro from: {}", key)
+            catalog = RoofMasterCatalog.from_rows(parse_roof_master_rows(content.decode('utf-8')), key, digest)
+            TRACE.info("✅ Loaded {} items from Roof Master Macro CSV", len(catalog))
+        return catalog
+
+    @staticmethod
+    def _load_artifact(key: str, digest: str) -> Optional[RoofMasterCatalog]:
+        """The CSV's compiled artifact if present and current, else None (parse the CSV)."""
+        artifact_path = catalog_artifact_path(key)
+        try:
+            with open(artifact_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            catalog = RoofMasterCatalog.load_artifact(data, key, digest)
+        except Exception as e:
+            TRACE.warning("⚠️ Ignoring unreadable catalog artifact {}: {}", artifact_path, e)
+            return None
+        if catalog is None:
+            TRACE.info("📂 Catalog artifact {} is stale, parsing the CSV", artifact_path)
+            return None
+        TRACE.info("✅ Loaded {} items from compiled catalog {}", len(catalog), artifact_path)
+        return catalog
+
+    def clear(self) -> None:
+        """Drop every cached catalog (the next get re-reads from disk)."""
+        with self._lock:
+            self._catalogs.clear()
+            self._stats.clear()
+
+
+EMPTY_CATALOG = RoofMasterCatalog({})
+CATALOG_REGISTRY = CatalogRegistry()
+
+
+def get_roof_master_catalog(path: Optional[str] = None) -> RoofMasterCatalog:
+    """Shared Roof Master Macro catalog from the process-wide registry."""
+    return CATALOG_REGISTRY.get(path)
+
+
+class CatalogVersion:
+    """A catalog as swapped in by a CatalogManager, under its version number."""
+
+    __slots__ = ('version', 'catalog', 'loaded_at')
+
+    def __init__(self, version: int, catalog: RoofMasterCatalog, loaded_at: float):
+        self.version = version
+        self.catalog = catalog
+        self.loaded_at = loaded_at
+
+    def __repr__(self) -> str:
+        return f"CatalogVersion({self.version}, {len(self.catalog)} items, digest {(self.catalog.digest or '')[:12]})"
+
+
+class CatalogManager:
+    """Hot-reloadable Roof Master Macro catalog for long-lived engines.
+
+    Holds the current CatalogVersion. reload() re-reads the source (a cheap
+    mtime/size check, then a content hash, via the registry) and, if the
+    catalog changed, swaps the new one in under the next version number with
+    a single reference assignment. start() runs reload() every poll_interval
+    seconds on a daemon thread, so catalogs and indexes are built off the
+    request path. Readers never block: current() returns whichever version
+    is swapped in, and claims keep the version they started with (see
+    RoofAdjustmentEngine.using_catalog).
+
+    A source that parses to an empty catalog (e.g. a broken upload) is not
+    swapped in over a non-empty one.
+    """
+
+    def __init__(self, path: Optional[str] = None, poll_interval: float = 5.0,
+                 registry: Optional[CatalogRegistry] = None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.registry = registry if registry is not None else CATALOG_REGISTRY
+        self._lock = threading.Lock()  # Serializes reloads; readers never take it
+        self._current = CatalogVersion(1, self.registry.get(path), time.time())
+        self._rejected_digest: Optional[str] = None
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def current(self) -> CatalogVersion:
+        return self._current
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    def reload(self) -> bool:
+        """Load the source now and swap it in if it changed; returns whether a new version was swapped in."""
+        with self._lock:
+            current = self._current
+            catalog = self.registry.get(self.path)
+            if catalog is current.catalog or catalog.digest == current.catalog.digest:
+                return False
+            if not len(catalog) and len(current.catalog):
+                if catalog.digest == self._rejected_digest:
+                    return False
+                self._rejected_digest = catalog.digest
+                TRACE.warning("⚠️ Catalog source {} has no valid items; keeping version {}",
+                              catalog.path or self.path, current.version)
+                return False
+            self._current = CatalogVersion(current.version + 1, catalog, time.time())
+            TRACE.info("🔄 Roof Master Macro catalog version {} ({} items) swapped in",
+                       self._current.version, len(catalog))
+            return True
+
+    def sync(self, version: int, digest: str) -> CatalogVersion:
+        """Catch up with another process's manager of the same source, which is at version with digest.
+
+        Reloads if this manager's catalog differs; once the catalogs match it
+        takes over version's number, so both processes label results alike.
+        Returns the current version (a newer one if the source changed again).
+        """
+        if self._current.catalog.digest != digest:
+            self.reload()
+        with self._lock:
+            current = self._current
+            if current.catalog.digest == digest and current.version != version:
+                current = self._current = CatalogVersion(version, current.catalog, current.loaded_at)
+            return current
+
+    def start(self) -> 'CatalogManager':
+        """Start polling the source on a background thread (idempotent)."""
+        with self._lock:
+            if self._watcher is None:
+                self._stop.clear()
+                self._watcher = threading.Thread(target=self._watch, name='catalog-manager', daemon=True)
+                self._watcher.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the polling thread."""
+        self._stop.set()
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.join()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                TRACE.warning("⚠️ Catalog reload failed: {}", e)
+
+
+CATALOG_KEY_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*(/[A-Za-z0-9][A-Za-z0-9_.-]*)*$')
+
+
+class CatalogShards:
+    """Per-carrier / per-region catalogs loaded on demand from a directory.
+
+    The catalog for key 'acme' is directory/acme.csv ('acme/tx' is
+    directory/acme/tx.csv), loaded from its compiled artifact when current.
+    Catalogs stay resident in LRU order while their combined footprint fits
+    max_bytes; the least recently used ones are evicted beyond that (the
+    most recent one always stays). A file that changes on disk is reloaded
+    on its next use, under the key's next version number.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._resident: OrderedDict = OrderedDict()  # key -> (CatalogVersion, stat key, footprint)
+        self._versions: Dict[str, tuple] = {}  # key -> (digest, version), kept across evictions
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key: str) -> str:
+        """The catalog file for key (ValueError for keys that are not plain names)."""
+        if not isinstance(key, str) or not CATALOG_KEY_PATTERN.match(key):
+            raise ValueError(f"Invalid catalog key '{key}'")
+        return os.path.join(self.directory, *key.split('/')) + '.csv'
+
+    def get(self, key: str) -> CatalogVersion:
+        """The catalog version for key, loading it if it is not resident (FileNotFoundError if there is none).
+
+        The file is read, hashed, loaded and sized outside the lock, so a slow
+        load does not hold up lookups of other keys; if another thread made
+        the key resident meanwhile, its catalog is used instead.
+        """
+        path = self.path(key)
+        stat = os.stat(path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            resident = self._resident.get(key)
+            if resident is not None and resident[1] == stat_key:
+                self._resident.move_to_end(key)
+                self.hits += 1
+                return resident[0]
+            self.misses += 1
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if resident is not None and resident[0].catalog.digest == digest:
+            catalog = resident[0].catalog
+        else:
+            catalog = CatalogRegistry.build(os.path.abspath(path), content, digest)
+        footprint = catalog.footprint()
+        with self._lock:
+            resident = self._resident.get(key)
+            if resident is not None and resident[1] == stat_key:
+                self._resident.move_to_end(key)
+                return resident[0]
+            if resident is not None and resident[0].catalog.digest == digest:
+                version = resident[0]
+            else:
+                version = self._version(key, catalog, digest)
+            if resident is not None:
+                self.resident_bytes -= resident[2]
+            self._resident[key] = (version, stat_key, footprint)
+            self._resident.move_to_end(key)
+            self.resident_bytes += footprint
+            self._evict()
+            return version
+
+    def _version(self, key: str, catalog: RoofMasterCatalog, digest: str) -> CatalogVersion:
+        known_digest, version = self._versions.get(key, (None, 0))
+        if known_digest != digest:
+            version += 1
+            self._versions[key] = (digest, version)
+        return CatalogVersion(version, catalog, time.time())
+
+    def _evict(self) -> None:
+        while self.resident_bytes > self.max_bytes and len(self._resident) > 1:
+            key, (_, _, footprint) = self._resident.popitem(last=False)
+            self.resident_bytes -= footprint
+            self.evictions += 1
+            TRACE.debug("🗑️  Evicted catalog '{}' ({} bytes)", key, footprint)
+
+    def stats(self) -> Dict[str, Any]:
+        """Residency counters: hits, misses, evictions, resident catalogs and bytes."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'resident': list(self._resident), 'resident_bytes': self.resident_bytes,
+                    'max_bytes': self.max_bytes}
+
+
+# Carrier -> Roof Master Macro line item replacement rules: (carrier_patterns, roof_master_description).
+# Rules are evaluated in order; each pattern replaces the first line item it matches.
+REPLACEMENT_RULES = [
+    # Ridge vents
+    (["Detach & Reset Continuous ridge vent - shingle-over", "Install Continuous ridge vent - shingle-over style"], 
+     "Continuous ridge vent - shingle-over style"),
+    (["Detach & Reset Continuous ridge vent - aluminum", "Install Continuous ridge vent - aluminum"], 
+     "Continuous ridge vent - aluminum"),
+
+    # Turtle vents
+    (["Detach & Reset Roof vent - turtle type - Plastic", "Install Roof vent - turtle type - Plastic"], 
+     "Roof vent - turtle type - Plastic"),
+    (["Detach & Reset Roof vent - turtle type - Metal", "Install Roof vent - turtle type - Metal"], 
+     "Roof vent - turtle type - Metal"),
+
+    # Off ridge vents
+    (["Detach & Reset Roof vent - off ridge type - 8'", "Install Roof vent - off ridge type - 8'"], 
+     "Roof vent - off ridge type - 8'"),
+    (["Detach & Reset Roof vent - off ridge type - 6'", "Install Roof vent - off ridge type - 6'"], 
+     "Roof vent - off ridge type - 6'"),
+    (["Detach & Reset Roof vent - off ridge type - 4'", "Install Roof vent - off ridge type - 4'"], 
+     "Roof vent - off ridge type - 4'"),
+    (["Detach & Reset Roof vent - off ridge type - 2'", "Install Roof vent - off ridge type - 2'"], 
+     "Roof vent - off ridge type - 2'"),
+
+    # Dormer and turbine vents
+    (["Detach & Reset Roof vent - dormer type - Metal", "Install Roof vent - dormer type - Metal"], 
+     "Roof vent - dormer type - Metal"),
+    (["Detach & Reset Roof vent - turbine type", "Install Roof vent - turbine type"], 
+     "Roof vent - turbine type"),
+
+    # Power attic vents
+    (["Detach & Reset Roof mount power attic vent - Large", "Install Roof mount power attic vent - Large"], 
+     "Roof mount power attic vent - Large"),
+    (["Detach & Reset Roof mount power attic vent", "Install Roof mount power attic vent"], 
+     "Roof mount power attic vent"),
+
+    # Exhaust caps
+    (["Detach & Reset Exhaust cap - through roof - up to 4\"", "Install Exhaust cap - through roof - up to 4\""], 
+     "Exhaust cap - through roof - up to 4\""),
+    (["Detach & Reset Exhaust cap - through roof - 6\" to 8\"", "Install Exhaust cap - through roof - 6\" to 8\""], 
+     "Exhaust cap - through roof - 6\" to 8\""),
+
+    # Power attic vent covers
+    (["Detach & Reset Power attic vent cover only - metal", "Install Power attic vent cover only - metal"], 
+     "Power attic vent cover only - metal"),
+    (["Detach & Reset Power attic vent cover only - plastic", "Install Power attic vent cover only - plastic"], 
+     "Power attic vent cover only - plastic"),
+
+    # Skylights - flat fixed
+    (["Detach & Reset Skylight - flat fixed, 9.1 - 10 sf", "Install Skylight - flat fixed, 9.1 - 10 sf"], 
+     "Skylight - flat fixed 9.1 - 10 sf"),
+    (["Detach & Reset Roof window (skylight), 12.1 - 15 sf", "Install Roof window (skylight), 12.1 - 15 sf"], 
+     "Roof window (skylight) 12.1 - 15 sf"),
+
+    # Skylights - double dome fixed
+    (["Detach & Reset Skylight - double dome fixed, 6.6 - 9"], 
+     "Skylight - double dome fixed 6.6 - 9 sf"),
+    (["Detach & Reset Skylight - double dome fixed, 4 - 6.5"], 
+     "Skylight - double dome fixed 4 - 6.5 sf"),
+    (["Detach & Reset Skylight - double dome fixed, 9.1 -"], 
+     "Skylight - double dome fixed 9.1 - 12.5 sf"),
+    (["Detach & Reset Skylight - double dome fixed, 12.6 -"], 
+     "Skylight - double dome fixed 12.6 - 15.5 sf"),
+
+    # Skylights - double dome venting
+    (["Detach & Reset Skylight - double dome venting, 6.6 -"], 
+     "Skylight - double dome venting 6.6 - 9 sf"),
+    (["Detach & Reset Skylight - double dome venting, 4 -"], 
+     "Skylight - double dome venting 4 - 6.5 sf"),
+    (["Detach & Reset Skylight - double dome venting, 9.1 -"], 
+     "Skylight - double dome venting 9.1 - 12.5 sf"),
+    (["Detach & Reset Skylight - double dome venting, 12."], 
+     "Skylight - double dome venting 12.6 - 15.5 sf"),
+
+    # Skylights - single dome fixed
+    (["Detach & Reset Skylight - single dome fixed, 6.6 - 9"], 
+     "Skylight - single dome fixed 6.6 - 9 sf"),
+    (["Detach & Reset Skylight - single dome fixed, 4 - 6.5"], 
+     "Skylight - single dome fixed 4 - 6.5 sf"),
+    (["Detach & Reset Skylight - single dome fixed, 9.1 -"], 
+     "Skylight - single dome fixed 9.1 - 12.5 sf"),
+    (["Detach & Reset Skylight - single dome fixed, 12.6 -"], 
+     "Skylight - single dome fixed 12.6 - 15.5 sf"),
+
+    # Skylights - single dome venting
+    (["Detach & Reset Skylight - single dome venting, 6.6 -"], 
+     "Skylight - single dome venting 6.6 - 9 sf"),
+    (["Detach & Reset Skylight - single dome venting, 4 - 6."], 
+     "Skylight - single dome venting 4 - 6.5 sf"),
+    (["Detach & Reset Skylight - single dome venting, 9.1 -"], 
+     "Skylight - single dome venting 9.1 - 12.5 sf"),
+    (["Detach & Reset Skylight - single dome venting, 12.6 -"], 
+     "Skylight - single dome venting 12.6 - 15.5 sf"),
+
+    # Skylights - flat fixed variations
+    (["Detach & Reset Skylight - flat fixed, 6.1 - 9 sf", "Install Skylight - flat fixed, 6.1 - 9 sf"], 
+     "Skylight - flat fixed 6.1 - 9 sf"),
+    (["Detach & Reset Skylight - flat fixed, up to 6 sf", "Install Skylight - flat fixed, up to 6 sf"], 
+     "Skylight - flat fixed up to 6 sf"),
+    (["Detach & Reset Skylight - flat fixed, 10.1 - 12 sf", "Install Skylight - flat fixed, 10.1 - 12 sf"], 
+     "Skylight - flat fixed 10.1 - 12 sf"),
+    (["Detach & Reset Skylight - flat fixed, 12.1 - 15 sf", "Install Skylight - flat fixed, 12.1 - 15 sf"], 
+     "Skylight - flat fixed 12.1 - 15 sf"),
+
+    # Roof windows (skylights)
+    (["Detach & Reset Roof window (skylight), 6.1 - 9 sf", "Install Roof window (skylight), 6.1 - 9 sf"], 
+     "Roof window (skylight) 6.1 - 9 sf"),
+    (["Detach & Reset Roof window (skylight), up to 6 sf", "Install Roof window (skylight), up to 6 sf"], 
+     "Roof window (skylight) up to 6 sf"),
+    (["Detach & Reset Roof window (skylight), 10.1 - 12 sf", "Install Roof window (skylight), 10.1 - 12 sf"], 
+     "Roof window (skylight) 10.1 - 12 sf"),
+
+    # Gutter items
+    (["Detach & Reset Gutter guard/screen", "Install Gutter guard/screen"], 
+     "Gutter guard/screen"),
+    (["Install Gutter / downspout - Detach & reset"], 
+     "Gutter / downspout - Detach & reset"),
+    (["Install Drip edge/gutter apron"], 
+     "Drip edge/gutter apron"),
+    (["Install Drip edge"], 
+     "Drip edge"),
+    (["Install Drip edge - copper"], 
+     "Drip edge - copper"),
+
+    # Flashing items
+    (["Install Counterflashing - Apron flashing"], 
+     "Counterflashing - Apron flashing"),
+    (["Install Valley metal"], 
+     "Valley metal"),
+    (["Install Valley metal - (W) profile"], 
+     "Valley metal - (W) profile"),
+    (["Install Furnace vent - rain cap and storm collar, 6\""], 
+     "Furnace vent - rain cap and storm collar 6\""),
+    (["Install Flashing - rain diverter"], 
+     "Flashing - rain diverter"),
+    (["Install Flashing - kick-out diverter"], 
+     "Flashing - kick-out diverter"),
+    (["Install Flashing - pipe jack - copper"], 
+     "Flashing - pipe jack - copper"),
+    (["Install Flashing - pipe jack - lead"], 
+     "Flashing - pipe jack - lead"),
+    (["Install Flashing - pipe jack - 6\""], 
+     "Flashing - pipe jack - 6\""),
+    (["Install Flashing - pipe jack - 8\""], 
+     "Flashing - pipe jack - 8\""),
+    (["Install Flashing - pipe jack - split boot"], 
+     "Flashing - pipe jack - split boot"),
+    (["Install Flashing - pipe jack"], 
+     "Flashing - pipe jack"),
+
+    # Rain caps
+    (["Install Rain cap - 10\""], 
+     "Rain cap - 10\""),
+    (["Install Rain cap - 12\""], 
+     "Rain cap - 12\""),
+    (["Install Rain cap - 4\" to 5\""], 
+     "Rain cap - 4\" to 5\""),
+    (["Install Rain cap - 6\""], 
+     "Rain cap - 6\""),
+    (["Install Rain cap - 8\""], 
+     "Rain cap - 8\""),
+
+    # Step flashing and aluminum
+    (["Install Step flashing"], 
+     "Step flashing"),
+    (["Install Aluminum sidewall/endwall flashing - mill"], 
+     "Aluminum sidewall/endwall flashing - mill finish"),
+    (["Install Flashing, 14\" wide"], 
+     "Flashing 14\" wide"),
+    (["Install Flashing, 14\" wide - copper"], 
+     "Flashing 14\" wide - copper"),
+    (["Install Flashing, 20\" wide"], 
+     "Flashing 20\" wide"),
+
+    # Evaporative cooler
+    (["Install Evaporative cooler - Detach & reset"], 
+     "Evaporative cooler - Detach & reset"),
+
+    # Chimney flashing
+    (["Install Chimney flashing - small (24\" x 24\")"], 
+     "Chimney flashing - small (24\" x 24\")"),
+    (["Install Saddle or cricket - up to 25 SF"], 
+     "Saddle or cricket - up to 25 SF"),
+    (["Install Saddle or cricket - 26 to 50 SF"], 
+     "Saddle or cricket - 26 to 50 SF"),
+    (["Install Chimney flashing - average (32\" x 36\")"], 
+     "Chimney flashing - average (32\" x 36\")"),
+    (["Install Chimney flashing - large (32\" x 60\")"], 
+     "Chimney flashing - large (32\" x 60\")"),
+
+    # Skylight flashing kits
+    (["Install Skylight flashing kit - dome"], 
+     "Skylight flashing kit - dome"),
+    (["Install Skylight flashing kit - dome - High grade"], 
+     "Skylight flashing kit - dome - High grade"),
+    (["Install Skylight flashing kit - dome - Large - High"], 
+     "Skylight flashing kit - dome - Large - High grade"),
+    (["Install Skylight flashing kit - dome - Large"], 
+     "Skylight flashing kit - dome - Large"),
+    (["Install Roof window step flashing kit"], 
+     "Roof window step flashing kit"),
+    (["Install Roof window step flashing kit - Large"], 
+     "Roof window step flashing kit - Large"),
+
+    # Additional skylight installations
+    (["Install Skylight - double dome fixed, 6.6 - 9 sf"], 
+     "Skylight - double dome fixed 6.6 - 9 sf"),
+    (["Install Skylight - double dome fixed, 4 - 6.5 sf"], 
+     "Skylight - double dome fixed 4 - 6.5 sf"),
+    (["Install Skylight - double dome fixed, 9.1 - 12.5 sf"], 
+     "Skylight - double dome fixed 9.1 - 12.5 sf"),
+    (["Install Skylight - double dome fixed, 12.6 - 15.5 sf"], 
+     "Skylight - double dome fixed 12.6 - 15.5 sf"),
+    (["Install Skylight - double dome venting, 6.6 - 9 sf"], 
+     "Skylight - double dome venting 6.6 - 9 sf"),
+    (["Install Skylight - double dome venting, 4 - 6.5 sf"], 
+     "Skylight - double dome venting 4 - 6.5 sf"),
+    (["Install Skylight - double dome venting, 9.1 - 12.5 sf"], 
+     "Skylight - double dome venting 9.1 - 12.5 sf"),
+    (["Install Skylight - double dome venting, 12.6 - 15.5"], 
+     "Skylight - double dome venting 12.6 - 15.5 sf"),
+    (["Install Skylight - single dome fixed, 6.6 - 9 sf"], 
+     "Skylight - single dome fixed 6.6 - 9 sf"),
+    (["Install Skylight - single dome fixed, 4 - 6.5 sf"], 
+     "Skylight - single dome fixed 4 - 6.5 sf"),
+    (["Install Skylight - single dome fixed, 9.1 - 12.5 sf"], 
+     "Skylight - single dome fixed 9.1 - 12.5 sf"),
+    (["Install Skylight - single dome fixed, 12.6 - 15.5 sf"], 
+     "Skylight - single dome fixed 12.6 - 15.5 sf"),
+    (["Install Skylight - single dome venting, 6.6 - 9 sf"], 
+     "Skylight - single dome venting 6.6 - 9 sf"),
+    (["Install Skylight - single dome venting, 4 - 6.5 sf"], 
+     "Skylight - single dome venting 4 - 6.5 sf"),
+    (["Install Skylight - single dome venting, 9.1 - 12.5 sf"], 
+     "Skylight - single dome venting 9.1 - 12.5 sf"),
+    (["Install Skylight - single dome venting, 12.6 - 15.5 sf"], 
+     "Skylight - single dome venting 12.6 - 15.5 sf"),
+
+    # Chimney flashing
+    (["Install Chimney flashing - small (24\" x 24\")"], 
+     "R&R Chimney flashing - small (24\" x 24\")"),
+    (["Install Chimney flashing - average (32\" x 36\")"], 
+     "R&R Chimney flashing - average (32\" x 36\")"),
+    (["Install Chimney flashing - large (32\" x 60\")"], 
+     "R&R Chimney flashing - large (32\" x 60\")"),
+
+    # Saddle/cricket
+    (["Install Saddle or cricket - up to 25 SF"], 
+     "Saddle or cricket - up to 25 SF"),
+    (["Install Saddle or cricket - 26 to 50 SF"], 
+     "Saddle or cricket - 26 to 50 SF"),
+
+    # Skylight flashing kits
+    (["Install Skylight flashing kit - dome"], 
+     "R&R Skylight flashing kit - dome"),
+    (["Install Skylight flashing kit - dome - High grade"], 
+     "R&R Skylight flashing kit - dome - High grade"),
+    (["Install Skylight flashing kit - dome - Large - High"], 
+     "R&R Skylight flashing kit - dome - Large - High grade"),
+    (["Install Skylight flashing kit - dome - Large"], 
+     "R&R Skylight flashing kit - dome - Large"),
+    (["Install Roof window step flashing kit"], 
+     "R&R Roof window step flashing kit"),
+    (["Install Roof window step flashing kit - Large"], 
+     "R&R Roof window step flashing kit - Large"),
+
+    # Gutter and drip edge
+    (["Install Gutter / downspout - Detach & reset"], 
+     "Gutter / downspout - Detach & reset"),
+    (["Install Drip edge/gutter apron"], 
+     "R&R Drip edge/gutter apron"),
+    (["Install Drip edge"], 
+     "R&R Drip edge"),
+    (["Install Drip edge - copper"], 
+     "R&R Drip edge - copper"),
+]
+
+class _AhoCorasick:
+    """Multi-pattern automaton reporting which patterns occur inside a text."""
+
+    def __init__(self, patterns: List[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # Breadth-first construction of failure links
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> set:
+        """Ids of every pattern that occurs in text."""
+        found = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class CompiledReplacementRules:
+    """REPLACEMENT_RULES compiled into a dispatcher.
+
+    Each (rule, carrier pattern) pair matches a line item description when the
+    description equals the pattern, contains it, or is contained in it. Patterns
+    found inside a description come from an Aho-Corasick automaton; descriptions
+    found inside a pattern come from a sorted suffix index over the patterns.
+    The pairs a description matches are cached by description.
+    """
+
+    MAX_CACHED_DESCRIPTIONS = 8192
+
+    def __init__(self, rules):
+        self.rules = [(tuple(patterns), target) for patterns, target in rules]
+        # Flatten to (rule index, pattern) pairs in evaluation order
+        self.pairs = [(rule_index, pattern)
+                      for rule_index, (patterns, _) in enumerate(self.rules)
+                      for pattern in patterns]
+        patterns = sorted({pattern for _, pattern in self.pairs})
+        pattern_ids = {pattern: pattern_id for pattern_id, pattern in enumerate(patterns)}
+        self._pairs_by_pattern: List[List[int]] = [[] for _ in patterns]
+        for pair_id, (_, pattern) in enumerate(self.pairs):
+            self._pairs_by_pattern[pattern_ids[pattern]].append(pair_id)
+        self._automaton = _AhoCorasick(patterns)
+        suffixes = sorted((pattern[start:], pattern_id)
+                          for pattern_id, pattern in enumerate(patterns)
+                          for start in range(len(pattern) + 1))
+        self._suffixes = [suffix for suffix, _ in suffixes]
+        self._suffix_patterns = [pattern_id for _, pattern_id in suffixes]
+        self.version = hashlib.sha256(repr(self.rules).encode('utf-8')).hexdigest()[:16]
+        self._matches: Dict[str, frozenset] = {}
+        self._resolved = weakref.WeakKeyDictionary()
+        self._resolved_lock = threading.Lock()
+
+    def matching_pairs(self, description: str) -> frozenset:
+        """Ids of the (rule, pattern) pairs that match a (stripped) description."""
+        pairs = self._matches.get(description)
+        if pairs is None:
+            pattern_ids = self._automaton.search(description)
+            # Patterns that contain the description: suffixes starting with it
+            position = bisect.bisect_left(self._suffixes, description)
+            while position < len(self._suffixes) and self._suffixes[position].startswith(description):
+                pattern_ids.add(self._suffix_patterns[position])
+                position += 1
+            pairs = frozenset(pair_id for pattern_id in pattern_ids for pair_id in self._pairs_by_pattern[pattern_id])
+            if len(self._matches) >= self.MAX_CACHED_DESCRIPTIONS:
+                self._matches.clear()
+            self._matches[description] = pairs
+        return pairs
+
+    def resolve_targets(self, matcher: CatalogMatcher, lookup,
+                        lookup_options: tuple = ()) -> List[Optional[Mapping[str, Any]]]:
+        """Macro data per rule for a catalog (None for rules whose target has no price).
+
+        Cached per matcher and lookup_options, the settings lookup depends on.
+        """
+        with self._resolved_lock:
+            resolved = self._resolved.get(matcher)
+            if resolved is None:
+                resolved = self._resolved[matcher] = {}
+            targets = resolved.get(lookup_options)
+            if targets is None:
+                targets = []
+                for _, roof_master_desc in self.rules:
+                    macro_data = lookup(roof_master_desc)
+                    targets.append(macro_data if macro_data['unit_price'] > 0 else None)
+                resolved[lookup_options] = targets
+        return targets
+
+    def dispatch(self, line_items: List[Dict[str, Any]], targets: List[Optional[Mapping[str, Any]]]):
+        """Yield (item, roof_master_desc, macro_data) for each replacement to apply, in rule order.
+
+        Equivalent to evaluating every pair in order and replacing the first
+        line item that currently matches it. The caller applies each
+        replacement before resuming, so renamed items are matched by later
+        pairs exactly as in the sequential evaluation.
+        """
+        pending: Dict[int, List[int]] = {}  # pair id -> heap of candidate item positions
+        for position, item in enumerate(line_items):
+            for pair_id in self.matching_pairs(_description_key(item)):
+                if targets[self.pairs[pair_id][0]] is not None:
+                    pending.setdefault(pair_id, []).append(position)
+        pair_queue = list(pending)
+        heapq.heapify(pair_queue)
+
+        while pair_queue:
+            pair_id = heapq.heappop(pair_queue)
+            candidates = pending.pop(pair_id)
+            heapq.heapify(candidates)
+            while candidates:
+                position = heapq.heappop(candidates)
+                item = line_items[position]
+                if pair_id not in self.matching_pairs(_description_key(item)):
+                    continue  # Renamed by an earlier replacement
+                rule_index = self.pairs[pair_id][0]
+                roof_master_desc = self.rules[rule_index][1]
+                yield item, roof_master_desc, targets[rule_index]
+
+                # Queue the renamed item for the later pairs its new description matches
+                for next_pair_id in self.matching_pairs(_description_key(item)):
+                    if next_pair_id > pair_id and targets[self.pairs[next_pair_id][0]] is not None:
+                        if next_pair_id not in pending:
+                            pending[next_pair_id] = []
+                            heapq.heappush(pair_queue, next_pair_id)
+                        heapq.heappush(pending[next_pair_id], position)
+                break  # Only replace first match for this pattern
+
+
+COMPILED_REPLACEMENT_RULES = CompiledReplacementRules(REPLACEMENT_RULES)
+
+
+# Roof report metrics read by the adjustment rules: (name, report key), extracted in this order.
+ROOF_METRICS = [
+    ('total_roof_area', "Total Roof Area"),
+    ('total_eaves_length', "Total Eaves Length"),
+    ('total_rakes_length', "Total Rakes Length"),
+    ('area_pitch_1', "Area for Pitch 1/12 (sq ft)"),
+    ('area_pitch_2', "Area for Pitch 2/12 (sq ft)"),
+    ('area_pitch_3', "Area for Pitch 3/12 (sq ft)"),
+    ('area_pitch_4', "Area for Pitch 4/12 (sq ft)"),
+    ('area_pitch_5', "Area for Pitch 5/12 (sq ft)"),
+    ('area_pitch_6', "Area for Pitch 6/12 (sq ft)"),
+    ('area_pitch_7', "Area for Pitch 7/12 (sq ft)"),
+    ('area_pitch_8', "Area for Pitch 8/12 (sq ft)"),
+    ('area_pitch_9', "Area for Pitch 9/12 (sq ft)"),
+    ('area_pitch_10', "Area for Pitch 10/12 (sq ft)"),
+    ('area_pitch_11', "Area for Pitch 11/12 (sq ft)"),
+    ('area_pitch_12', "Area for Pitch 12/12 (sq ft)"),
+    ('area_pitch_12_plus', "Area for Pitch 12/12+ (sq ft)"),
+    ('total_ridges_hips_length', "Total Ridges/Hips Length"),
+    ('total_line_lengths_ridges', "Total Line Lengths (Ridges)"),
+    ('total_valleys_length', "Total Valleys Length"),
+    ('total_step_flashing_length', "Total Step Flashing Length"),
+    ('total_flashing_length', "Total Flashing Length"),
+]
+
+# Quantities derived from the metrics: (name, summed values, divisor or None), computed in this order.
+DERIVED_QUANTITIES = [
+    ('steep_7_9_total', ('area_pitch_7', 'area_pitch_8', 'area_pitch_9'), None),
+    ('steep_10_12_total', ('area_pitch_10', 'area_pitch_11', 'area_pitch_12'), None),
+    ('drip_edge_length', ('total_eaves_length', 'total_rakes_length'), None),
+    ('total_squares', ('total_roof_area',), 100.0),
+    ('starter_qty', ('drip_edge_length',), 100.0),
+    ('steep_7_9_qty', ('steep_7_9_total',), 100.0),
+    ('steep_10_12_qty', ('steep_10_12_total',), 100.0),
+    ('steep_12_plus_qty', ('area_pitch_12_plus',), 100.0),
+    ('ridges_hips_qty', ('total_ridges_hips_length',), 100.0),
+    ('ridges_qty', ('total_line_lengths_ridges',), 100.0),
+    ('valleys_qty', ('total_valleys_length',), 100.0),
+    ('step_flashing_qty', ('total_step_flashing_length',), 100.0),
+    ('flashing_qty', ('total_flashing_length',), 100.0),
+    ('low_slope_area', ('area_pitch_1', 'area_pitch_2', 'area_pitch_3', 'area_pitch_4'), None),
+    ('medium_slope_area', ('area_pitch_5', 'area_pitch_6', 'area_pitch_7', 'area_pitch_8'), None),
+    ('steep_slope_area', ('area_pitch_9', 'area_pitch_10', 'area_pitch_11', 'area_pitch_12', 'area_pitch_12_plus'), None),
+    ('low_slope_qty', ('low_slope_area',), 100.0),
+    ('medium_slope_qty', ('medium_slope_area',), 100.0),
+    ('steep_slope_qty', ('steep_slope_area',), 100.0),
+]
+
+STARTER_DESCRIPTIONS = (
+    "Asphalt starter - universal starter course",
+    "Asphalt starter - peel and stick",
+    "Asphalt starter - laminated double layer starter",
+)
+HIP_RIDGE_CAP_DESCRIPTIONS = (
+    "Hip / Ridge cap - High profile - composition shingles",
+    "Hip / Ridge cap - cut from 3 tab - composition shingles",
+    "Hip / Ridge cap - Standard profile - composition shingles",
+)
+HIP_RIDGE_REASON = "Hip/Ridge cap quantity should equal Total Ridges/Hips Length / 100 ({quantity:.2f})"
+RIDGE_LINE_REASON = "Hip/Ridge cap quantity should equal Total Line Lengths (Ridges) / 100 ({quantity:.2f})"
+STARTER_REASON = "Starter strip quantity should equal (Total Eaves + Total Rakes) / 100 ({quantity:.2f})"
+SQUARES_REASON = "Quantity should equal Total Roof Area / 100 ({quantity:.2f})"
+STEEP_REASON = "Steep roof charge should equal calculated area / 100 ({quantity:.2f})"
+NARRATIVE_PREFIX = "Field Changed: quantity |Explanation: "
+UNIT_PRICE_EXPLANATION = "Unit price increased to match Roof Master Macro maximum (${new_price:.2f})"
+
+# Quantity adjustment rules, evaluated in order. Each rule visits its target
+# descriptions (only while its 'when' guard holds) and updates the quantity of
+# each item found towards 'quantity' (a metric or derived quantity name, or a
+# constant). Keys:
+#   update       'raise' (to the target when below it), 'max_unless_close',
+#                'set_unless_close', 'set', 'round_quarter', 'round_third',
+#                or None to only add missing items
+#   when         guard: ('all_nonzero'|'any_nonzero', *values) or
+#                ('present'|'any_present'|'none_present'|'each_present', *descriptions);
+#                each_present runs the rule once per present description
+#   add          add missing targets with add_new_item (dict of its keyword arguments)
+#   first_only   stop after the first target found
+#   explanation  audit explanation (also the item narrative when 'narrative' is set)
+ADJUSTMENT_RULES = [
+    {
+        'id': 'shingle_removal',
+        'name': "Rule 1-4: Shingle Removal Quantity Adjustments",
+        'targets': (
+            "Remove Laminated - comp. shingle rfg. - w/out felt",
+            "Remove 3 tab - 25 yr. - comp. shingle roofing - w/out felt",
+            "Remove 3 tab - 25 yr. - composition shingle roofing - incl. felt",
+            "Remove Laminated - comp. shingle rfg. - w/ felt",
+        ),
+        'quantity': 'total_squares',
+        'update': 'max_unless_close',
+        'require_change': True,
+        'when': ('all_nonzero', 'total_roof_area', 'total_squares'),
+        'skip_trace': "  ⚠️  WARNING: Total Roof Area is 0 - skipping shingle quantity adjustments!",
+        'skip_warning': ("Shingle Quantity Adjustments",
+                         "Total Roof Area is 0 - cannot adjust shingle quantities. Please verify roof measurements are loaded correctly."),
+        'reason': SQUARES_REASON,
+        'explanation': "Shingle removal quantity adjusted to match roof area calculation (Total Roof Area / 100 = {quantity:.2f} SQ)",
+        'narrative': True,
+    },
+    {
+        'id': 'shingle_installation',
+        'name': "Rule 5-8: Shingle Installation Quantity Adjustments",
+        'targets': (
+            "Laminated - comp. shingle rfg. - w/out felt",
+            "3 tab - 25 yr. - comp. shingle roofing - w/out felt",
+            "3 tab - 25 yr. - composition shingle roofing - incl. felt",
+            "Laminated - comp. shingle rfg. - w/ felt",
+        ),
+        'quantity': 'total_squares',
+        'update': 'max_unless_close',
+        'when': ('all_nonzero', 'total_roof_area', 'total_squares'),
+        'skip_trace': "  ⚠️  WARNING: Total Roof Area is 0 - skipping shingle quantity adjustments!",
+        'reason': SQUARES_REASON,
+        'explanation': "Shingle installation quantity adjusted to match roof area calculation (Total Roof Area / 100 = {quantity:.2f} SQ)",
+        'narrative': True,
+    },
+    {
+        'id': 'laminated_rounding',
+        'name': "Rule: Laminated Shingle Rounding",
+        'targets': (
+            "Remove Laminated - comp. shingle rfg. - w/out felt",
+            "Laminated - comp. shingle rfg. - w/out felt",
+            "Remove Laminated - comp. shingle rfg. - w/ felt",
+            "Laminated - comp. shingle rfg. - w/ felt",
+        ),
+        'update': 'round_quarter',
+        'reason': "Laminated shingles should be rounded up to nearest 0.25",
+        'explanation': "Laminated shingle quantity rounded up to nearest 0.25 (standard roofing practice)",
+        'narrative': True,
+    },
+    {
+        'id': 'three_tab_rounding',
+        'name': "Rule: 3-Tab Shingle Rounding",
+        'targets': (
+            "Remove 3 tab - 25 yr. - comp. shingle roofing - w/out felt",
+            "3 tab - 25 yr. - comp. shingle roofing - w/out felt",
+            "Remove 3 tab - 25 yr. - composition shingle roofing - incl. felt",
+            "3 tab - 25 yr. - composition shingle roofing - incl. felt",
+        ),
+        'update': 'round_third',
+        'reason': "3-tab shingles should be rounded up to nearest 0.33",
+        'explanation': "3-tab shingle quantity rounded up to nearest 0.33 (standard roofing practice)",
+        'narrative': True,
+    },
+    {
+        'id': 'removal_starter',
+        'name': "Rule: Starter Strip Quantity Adjustments",
+        'targets': STARTER_DESCRIPTIONS,
+        'quantity': 'starter_qty',
+        'update': 'raise',
+        'when': ('each_present', "Remove Laminated - comp. shingle rfg. - w/out felt",
+                 "Remove 3 tab - 25 yr. - comp. shingle roofing - w/out felt"),
+        'reason': STARTER_REASON,
+        'explanation': "Starter strip quantity adjusted to match roof perimeter calculation ((Eaves + Rakes) / 100 = {quantity:.2f} SQ)",
+        'narrative': True,
+    },
+    {
+        'id': 'steep_7_9',
+        'name': "Rule: Steep Roof 7/12-9/12 Charges",
+        'targets': ("Remove Additional charge for steep roof - 7/12 to 9/12 slope",
+                    "Additional charge for steep roof - 7/12 to 9/12 slope"),
+        'quantity': 'steep_7_9_qty',
+        'round': 2,
+        'update': 'raise',
+        'when': ('any_nonzero', 'area_pitch_7', 'area_pitch_8', 'area_pitch_9'),
+        'add': {},
+        'reason': "Steep roof charge should equal (Area 7/12 + 8/12 + 9/12) / 100 ({quantity:.2f})",
+        'explanation': "Steep roof charge adjusted to match steep roof area calculation (7/12-9/12 slopes = {quantity:.2f} SQ)",
+        'narrative': True,
+    },
+    {
+        'id': 'steep_10_12',
+        'name': "Rule: Steep Roof 10/12-12/12 Charges",
+        'targets': ("Remove Additional charge for steep roof - 10/12 - 12/12 slope",
+                    "Additional charge for steep roof - 10/12 - 12/12 slope"),
+        'quantity': 'steep_10_12_qty',
+        'update': 'raise',
+        'when': ('any_nonzero', 'area_pitch_10', 'area_pitch_11', 'area_pitch_12'),
+        'add': {},
+        'reason': "Steep roof charge should equal (Area 10/12 + 11/12 + 12/12) / 100 ({quantity:.2f})",
+    },
+    {
+        'id': 'steep_12_plus',
+        'name': "Rule: Steep Roof 12/12+ Charges",
+        'targets': ("Remove Additional charge for steep roof greater than 12/12 slope",
+                    "Additional charge for steep roof greater than 12/12 slope"),
+        'quantity': 'steep_12_plus_qty',
+        'update': 'raise',
+        'when': ('any_nonzero', 'area_pitch_12_plus'),
+        'add': {},
+        'reason': "Steep roof charge should equal Area 12/12+ / 100 ({quantity:.2f})",
+    },
+    # The starter and ridge vent pairs below are if/else branches; the
+    # "present" branch comes first so the "missing" branch's addition is not
+    # then adjusted by it.
+    {
+        'id': 'starter',
+        'name': "Rule: Starter Strip Quantity",
+        'targets': STARTER_DESCRIPTIONS,
+        'quantity': 'starter_qty',
+        'update': 'raise',
+        'when': ('any_present',) + STARTER_DESCRIPTIONS,
+        'reason': STARTER_REASON,
+    },
+    {
+        'id': 'starter_missing',
+        'name': "Rule: Add Missing Starter Strip",
+        'targets': ("Asphalt starter - universal starter course",),
+        'quantity': 'starter_qty',
+        'update': None,
+        'when': ('none_present',) + STARTER_DESCRIPTIONS,
+        'add': {},
+    },
+    {
+        'id': 'hip_ridge_cap_present',
+        'name': "Rule: Hip/Ridge Cap Quantity",
+        'targets': ("Hip / Ridge cap - High profile - composition shingles",
+                    "Hip / Ridge cap - Standard profile - composition shingles"),
+        'quantity': 'ridges_hips_qty',
+        'update': 'raise',
+        'when': ('any_present', "Hip / Ridge cap - High profile - composition shingles",
+                 "Hip / Ridge cap - Standard profile - composition shingles"),
+        'reason': HIP_RIDGE_REASON,
+    },
+    {
+        'id': 'ridge_vent_without_cap',
+        'name': "Rule: Ridge Vent Without Hip/Ridge Cap",
+        'targets': ("Continuous ridge vent - Detach & reset",),
+        'quantity': 'ridges_hips_qty',
+        'update': 'raise',
+        'when': ('none_present', "Hip / Ridge cap - High profile - composition shingles",
+                 "Hip / Ridge cap - Standard profile - composition shingles"),
+        'add': {'unit': "LF"},
+        'reason': "Ridge vent quantity should equal Total Ridges/Hips Length / 100 ({quantity:.2f})",
+    },
+    {
+        'id': 'steep_7_9_max',
+        'name': "Rule: Max for Steep 7/12-9/12",
+        'targets': ("Remove Additional charge for steep roof - 7/12 to 9/12 slope",
+                    "Additional charge for steep roof - 7/12 to 9/12 slope"),
+        'quantity': 'steep_7_9_qty',
+        'update': 'raise',
+        'reason': STEEP_REASON,
+    },
+    {
+        'id': 'steep_10_12_max',
+        'name': "Rule: Max for Steep 10/12-12/12",
+        'targets': ("Remove Additional charge for steep roof - 10/12 - 12/12 slope",
+                    "Additional charge for steep roof - 10/12 - 12/12 slope"),
+        'quantity': 'steep_10_12_qty',
+        'update': 'raise',
+        'reason': STEEP_REASON,
+    },
+    {
+        'id': 'steep_12_plus_max',
+        'name': "Rule: Max for Steep 12/12+",
+        'targets': ("Remove Additional charge for steep roof greater than 12/12 slope",
+                    "Additional charge for steep roof greater than 12/12 slope"),
+        'quantity': 'steep_12_plus_qty',
+        'update': 'raise',
+        'reason': STEEP_REASON,
+    },
+    {
+        'id': 'ridge_vent',
+        'name': "Rule: Continuous Ridge Vent",
+        'targets': ("Continuous ridge vent - aluminum", "Continuous ridge vent - shingle-over style"),
+        'quantity': 'ridges_qty',
+        'update': 'raise',
+        'reason': "Ridge vent quantity should equal Total Line Lengths (Ridges) / 100 ({quantity:.2f})",
+    },
+    {
+        'id': 'hip_ridge_cap',
+        'name': "Rule: Hip/Ridge Cap",
+        'targets': HIP_RIDGE_CAP_DESCRIPTIONS,
+        'quantity': 'ridges_hips_qty',
+        'update': 'raise',
+        'reason': HIP_RIDGE_REASON,
+    },
+    {
+        'id': 'drip_edge',
+        'name': "Rule: Drip Edge Adjustments",
+        'targets': ("Drip edge/gutter apron", "Drip edge", "Drip Edge"),
+        'quantity': 'drip_edge_length',
+        'update': 'max_unless_close',
+        'first_only': True,
+        'reason': "Drip edge quantity should equal (Total Eaves + Total Rakes) = {quantity:.2f} LF",
+        'explanation': "Drip edge quantity adjusted to match roof perimeter calculation (Eaves + Rakes = {quantity:.2f} LF)",
+    },
+    {
+        'id': 'step_flashing',
+        'name': "Rule: Step Flashing Adjustments",
+        'targets': ("Step flashing",),
+        'quantity': 'total_step_flashing_length',
+        'update': 'set_unless_close',
+        'reason': "Step flashing quantity should equal Total Step Flashing Length = {quantity:.2f} LF",
+    },
+    {
+        'id': 'aluminum_flashing',
+        'name': "Rule: Aluminum Flashing Adjustments",
+        'targets': ("Aluminum sidewall/endwall flashing - mill finish",),
+        'quantity': 'total_flashing_length',
+        'update': 'raise',
+        'reason': "Aluminum flashing quantity should equal Total Flashing Length = {quantity:.2f} LF",
+    },
+    {
+        'id': 'shingle_over_vent_cap',
+        'name': "Rule: Hip/Ridge Cap with Shingle-Over Ridge Vent",
+        'targets': HIP_RIDGE_CAP_DESCRIPTIONS,
+        'quantity': 'ridges_hips_qty',
+        'update': 'raise',
+        'when': ('present', "Continuous ridge vent - shingle-over style"),
+        'reason': HIP_RIDGE_REASON,
+    },
+    {
+        'id': 'aluminum_vent_cap',
+        'name': "Rule: Hip/Ridge Cap with Aluminum Ridge Vent",
+        'targets': HIP_RIDGE_CAP_DESCRIPTIONS,
+        'quantity': 'ridges_hips_qty',
+        'update': 'set',  # Set directly as per some rules
+        'when': ('present', "Continuous ridge vent - aluminum"),
+        'reason': HIP_RIDGE_REASON,
+    },
+    {
+        'id': 'shingle_over_three_tab_cap',
+        'name': "Rule: 3 Tab Cap with Shingle-Over Ridge Vent",
+        'targets': ("Hip / Ridge cap - cut from 3 tab - composition shingles",),
+        'quantity': 'ridges_qty',
+        'update': 'raise',
+        'when': ('present', "Continuous ridge vent - shingle-over style",
+                 "3 tab - 25 yr. - composition shingle roofing - incl. felt"),
+        'add': {},
+        'reason': RIDGE_LINE_REASON,
+    },
+    {
+        'id': 'shingle_over_laminated_cap',
+        'name': "Rule: Standard Cap with Shingle-Over Ridge Vent (w/out felt)",
+        'targets': ("Hip / Ridge cap - Standard profile - composition shingles",),
+        'quantity': 'ridges_qty',
+        'update': 'raise',
+        'when': ('present', "Continuous ridge vent - shingle-over style",
+                 "Remove Laminated - comp. shingle rfg. - w/out felt"),
+        'add': {},
+        'reason': RIDGE_LINE_REASON,
+    },
+    {
+        'id': 'shingle_over_laminated_felt_cap',
+        'name': "Rule: Standard Cap with Shingle-Over Ridge Vent (w/ felt)",
+        'targets': ("Hip / Ridge cap - Standard profile - composition shingles",),
+        'quantity': 'ridges_qty',
+        'update': 'raise',
+        'when': ('present', "Continuous ridge vent - shingle-over style",
+                 "Remove Laminated - comp. shingle rfg. - w/ felt"),
+        'add': {},
+        'reason': RIDGE_LINE_REASON,
+    },
+    {
+        'id': 'valley_metal',
+        'name': "Rule: Valley Metal Adjustments",
+        'targets': ("Valley metal", "Valley metal - (W) profile"),
+        'quantity': 'total_valleys_length',
+        'update': 'raise',
+        'first_only': True,
+        'reason': "Valley metal quantity should equal Total Valleys Length = {quantity:.2f} LF",
+    },
+    {
+        'id': 'low_slope_felt',
+        'name': "Rule: Low Slope Roofing Felt",
+        'targets': ("Roofing felt - 15 lb. double coverage/low slope",),
+        'quantity': 'low_slope_qty',
+        'update': 'raise',
+        'update_costs': True,
+        'when': ('any_nonzero', 'low_slope_area'),
+        'add': {},
+        'reason': "Quantity should equal (Area 1/12 + 2/12 + 3/12 + 4/12) / 100 ({quantity:.2f})",
+    },
+    {
+        'id': 'medium_slope_felt',
+        'name': "Rule: Medium Slope Roofing Felt",
+        'targets': ("Roofing felt - 15 lb.",),
+        'quantity': 'medium_slope_qty',
+        'update': 'raise',
+        'update_costs': True,
+        'when': ('any_nonzero', 'medium_slope_area'),
+        'add': {},
+        'reason': "Quantity should equal (Area 5/12 + 6/12 + 7/12 + 8/12) / 100 ({quantity:.2f})",
+    },
+    {
+        'id': 'steep_slope_felt',
+        'name': "Rule: Steep Slope Roofing Felt",
+        'targets': ("Roofing felt - 30 lb.",),
+        'quantity': 'steep_slope_qty',
+        'update': 'raise',
+        'update_costs': True,
+        'when': ('any_nonzero', 'steep_slope_area'),
+        'add': {},
+        'reason': "Quantity should equal (Area 9/12 + 10/12 + 11/12 + 12/12 + 12/12+) / 100 ({quantity:.2f})",
+    },
+    {
+        'id': 'chimney_saddle_25',
+        'name': "Rule: Chimney Saddle/Cricket up to 25 SF",
+        'targets': ("Saddle or cricket up to 25 SF",),
+        'quantity': 1.0,
+        'update': None,
+        'when': ('present', "Chimney flashing average (32\" x 36\")"),
+        'add': {'unit': "EA", 'location_room': "Roof", 'category': "Roof"},
+    },
+    {
+        'id': 'chimney_saddle_50',
+        'name': "Rule: Chimney Saddle/Cricket 26 to 50 SF",
+        'targets': ("Saddle or cricket 26 to 50 SF",),
+        'quantity': 1.0,
+        'update': None,
+        'when': ('present', "Chimney flashing- large (32\" x 60\")"),
+        'add': {'unit': "EA", 'location_room': "Roof", 'category': "Roof"},
+    },
+]
+
+
+class PlanStep:
+    """One compiled adjustment rule: a flat record the plan executor reads directly."""
+
+    __slots__ = ('rule_id', 'name', 'targets', 'quantity_name', 'constant', 'round_digits', 'update',
+                 'require_change', 'guard', 'guard_args', 'skip_trace', 'skip_warning', 'add',
+                 'first_only', 'update_costs', 'reason', 'explanation', 'narrative',
+                 'narrative_template', 'metric_keys', 'descriptions', 'reduced_targets')
+
+    UPDATES = ('raise', 'max_unless_close', 'set_unless_close', 'set', 'round_quarter', 'round_third', None)
+    GUARDS = ('all_nonzero', 'any_nonzero', 'present', 'any_present', 'none_present', 'each_present')
+
+    def __init__(self, rule: Dict[str, Any], value_sources: Dict[str, frozenset]):
+        self.rule_id = rule['id']
+        self.name = rule.get('name', rule['id'])
+        self.targets = tuple(rule['targets'])
+        quantity = rule.get('quantity')
+        if isinstance(quantity, str):
+            if quantity not in value_sources:
+                raise ValueError(f"Rule '{self.rule_id}': unknown quantity '{quantity}'")
+            self.quantity_name, self.constant = quantity, None
+        else:
+            self.quantity_name, self.constant = None, quantity
+        self.round_digits = rule.get('round')
+        self.update = rule.get('update', 'raise')
+        if self.update not in self.UPDATES:
+            raise ValueError(f"Rule '{self.rule_id}': unknown update '{self.update}'")
+        self.require_change = rule.get('require_change', False)
+        when = rule.get('when')
+        self.guard = when[0] if when else None
+        self.guard_args = tuple(when[1:]) if when else ()
+        if self.guard is not None and self.guard not in self.GUARDS:
+            raise ValueError(f"Rule '{self.rule_id}': unknown guard '{self.guard}'")
+        if self.guard in ('all_nonzero', 'any_nonzero'):
+            for name in self.guard_args:
+                if name not in value_sources:
+                    raise ValueError(f"Rule '{self.rule_id}': unknown guard value '{name}'")
+        self.skip_trace = rule.get('skip_trace')
+        self.skip_warning = rule.get('skip_warning')
+        add = rule.get('add')
+        self.add = None if add is None else {'unit': "SQ", 'location_room': "Roof", 'category': "Roof", **add}
+        self.first_only = rule.get('first_only', False)
+        self.update_costs = rule.get('update_costs', False)
+        self.reason = rule.get('reason')
+        self.explanation = rule.get('explanation')
+        self.narrative = rule.get('narrative', False)
+        self.narrative_template = NARRATIVE_PREFIX + (self.explanation or self.reason or "")
+        if self.update is not None and self.reason is None:
+            raise ValueError(f"Rule '{self.rule_id}': adjusting rules need a reason")
+        # What the step reads: metric report keys (through its quantity and
+        # value guards) and line item descriptions (targets and presence guards)
+        value_guard = self.guard in ('all_nonzero', 'any_nonzero')
+        read_values = ([self.quantity_name] if self.quantity_name else []) + (list(self.guard_args) if value_guard else [])
+        self.metric_keys = frozenset().union(*(value_sources[name] for name in read_values))
+        self.descriptions = frozenset(desc.strip() for desc in
+                                      self.targets + (() if value_guard else self.guard_args))
+        # Targets whose raise joins a per-description max-reduction (set by the plan)
+        self.reduced_targets = frozenset()
+
+    def repeat_count(self, values: Dict[str, Any], find) -> int:
+        """How many times the step runs on this claim (0 when its guard fails)."""
+        guard = self.guard
+        if guard is None:
+            return 1
+        if guard == 'all_nonzero':
+            return int(all(values[name] != 0 for name in self.guard_args))
+        if guard == 'any_nonzero':
+            return int(any(values[name] != 0 for name in self.guard_args))
+        if guard == 'present':
+            return int(all(find(desc) for desc in self.guard_args))
+        if guard == 'any_present':
+            return int(any(find(desc) for desc in self.guard_args))
+        if guard == 'none_present':
+            return int(not any(find(desc) for desc in self.guard_args))
+        return sum(1 for desc in self.guard_args if find(desc))
+
+
+class AdjustmentPlan:
+    """ADJUSTMENT_RULES compiled into a flat execution plan.
+
+    Rules are validated and resolved into PlanStep records once per rule-set
+    version (a digest of the rule table); executing the plan is a loop over
+    those steps against the claim's metric values.
+
+    A description raised by several steps (the hip/ridge cap, steep charge and
+    starter maxima) is merged into a single max-reduction: each of those
+    steps only records its target as a candidate, and the item is adjusted
+    once, to the largest candidate, when the plan next touches it some other
+    way or finishes. Its adjustment record and audit entry keep the places
+    sequential evaluation gave them; the adjustment names the winning rule
+    and the audit entry the last explained raise.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], metrics=None, derived=None):
+        self.metrics = [tuple(metric) for metric in (metrics if metrics is not None else ROOF_METRICS)]
+        self.derived = [(name, tuple(sources), divisor)
+                        for name, sources, divisor in (derived if derived is not None else DERIVED_QUANTITIES)]
+        # Metric report keys behind every value
+        value_sources = {name: frozenset((key,)) for name, key in self.metrics}
+        for name, sources, _ in self.derived:
+            missing = [source for source in sources if source not in value_sources]
+            if missing:
+                raise ValueError(f"Derived quantity '{name}' uses unknown value(s): {', '.join(missing)}")
+            value_sources[name] = frozenset().union(*(value_sources[source] for source in sources))
+        self.value_sources = value_sources
+        self.rules = rules
+        self.steps = [PlanStep(rule, value_sources) for rule in rules]
+        raised: Dict[str, List[str]] = {}
+        for step in self.steps:
+            if step.update == 'raise' and not step.update_costs:
+                for desc in step.targets:
+                    raised.setdefault(desc, []).append(step.rule_id)
+        self.reductions = {desc: tuple(rule_ids) for desc, rule_ids in raised.items() if len(rule_ids) > 1}
+        for step in self.steps:
+            if step.update == 'raise' and not step.update_costs:
+                step.reduced_targets = frozenset(desc for desc in step.targets if desc in self.reductions)
+        self.descriptions = frozenset().union(*(step.descriptions for step in self.steps))
+        self.version = adjustment_rules_version(rules, self.metrics, self.derived)
+
+    def affected_steps(self, metric_keys=(), descriptions=()) -> List[PlanStep]:
+        """Steps that read any of the given metric report keys or line item descriptions."""
+        metric_keys = frozenset(metric_keys)
+        descriptions = frozenset(desc.strip() for desc in descriptions)
+        return [step for step in self.steps if step.metric_keys & metric_keys or step.descriptions & descriptions]
+
+    def evaluate_values(self, get_metric, roof_metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """Metric and derived quantity values for a claim."""
+        values = {name: get_metric(roof_metrics, key) for name, key in self.metrics}
+        for name, sources, divisor in self.derived:
+            value = values[sources[0]]
+            for source in sources[1:]:
+                value = value + values[source]
+            values[name] = value if divisor is None else value / divisor
+        return values
+
+    def evaluate_values_batch(self, get_metric, roof_metrics_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """evaluate_values for many claims at once, vectorized over the claims when NumPy is available.
+
+        Metrics are loaded into a claims x metrics matrix and every derived
+        quantity is computed as one column operation, adding sources in the
+        same order as evaluate_values. Results are identical to the scalar
+        path, value types included: a claim with a metric that is not a
+        plain int or float (or an int too large to be exact as a float) is
+        evaluated by evaluate_values instead. A claim whose values cannot be
+        evaluated gets None, leaving its error to the claim's own processing.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(roof_metrics_list)
+        rows, row_claims = [], []
+        for index, roof_metrics in enumerate(roof_metrics_list):
+            try:
+                if np is None:
+                    results[index] = self.evaluate_values(get_metric, roof_metrics)
+                    continue
+                row = [get_metric(roof_metrics, key) for _, key in self.metrics]
+            except Exception:
+                continue
+            if all(type(value) is float or (type(value) is int and -_EXACT_INT_LIMIT < value < _EXACT_INT_LIMIT)
+                   for value in row):
+                rows.append(row)
+                row_claims.append(index)
+            else:
+                try:
+                    results[index] = self.evaluate_values(get_metric, roof_metrics)
+                except Exception:
+                    pass
+        if not rows:
+            return results
+        matrix = np.array(rows, dtype=np.float64)
+        columns = {name: matrix[:, column] for column, (name, _) in enumerate(self.metrics)}
+        # Whether the scalar path would produce an int (sums of ints without a divisor)
+        is_int = {name: np.array([type(row[column]) is int for row in rows])
+                  for column, (name, _) in enumerate(self.metrics)}
+        derived = []
+        for name, sources, divisor in self.derived:
+            column = columns[sources[0]]
+            for source in sources[1:]:
+                column = column + columns[source]
+            if divisor is not None:
+                column = column / divisor
+                is_int[name] = np.zeros(len(rows), dtype=bool)
+            else:
+                is_int[name] = np.logical_and.reduce([is_int[source] for source in sources])
+            columns[name] = column
+            derived.append((name, sources, divisor, column.tolist(), is_int[name].tolist()))
+        for position, (index, row) in enumerate(zip(row_claims, rows)):
+            values = {name: value for (name, _), value in zip(self.metrics, row)}
+            for name, sources, divisor, column, ints in derived:
+                if divisor is None and len(sources) == 1:
+                    values[name] = values[sources[0]]
+                else:
+                    values[name] = int(column[position]) if ints[position] else column[position]
+            results[index] = values
+        return results
+
+    def execute(self, engine: 'RoofAdjustmentEngine', line_items: 'IndexedLineItems',
+                values: Dict[str, Any], context: 'ClaimContext') -> None:
+        """Run every step, in order, against an indexed line item list.
+
+        With context.performance set, each step's time and counts are
+        recorded under its rule id; a max-reduction's adjustment counts
+        for the rule whose candidate won.
+        """
+        performance = context.performance
+        # id(item) -> (item, desc, old_qty, quantity, step, adjustment record, audit entry, narrative candidate)
+        pending: Dict[int, tuple] = {}
+        for step in self.steps:
+            if performance is None:
+                self._run_step(step, engine, line_items, values, context, pending)
+                continue
+            started = time.monotonic_ns()
+            hit, adjustments, additions = self._run_step(step, engine, line_items, values, context, pending)
+            performance.record(step.rule_id, hit, adjustments, additions, time.monotonic_ns() - started)
+        for entry in pending.values():
+            self._apply_reduction(engine.trace, entry, performance)
+
+    def _run_step(self, step: PlanStep, engine: 'RoofAdjustmentEngine', line_items: 'IndexedLineItems',
+                  values: Dict[str, Any], context: 'ClaimContext', pending: Dict[int, tuple]) -> tuple:
+        """Run one step; returns (hit, adjustments, additions)."""
+        results = context.results
+        trace = engine.trace
+        find = line_items.find
+        trace.debug("\n📝 {}", step.name)
+        repeat = step.repeat_count(values, find)
+        if not repeat:
+            if step.skip_trace is not None:
+                trace.warning(step.skip_trace)
+            if step.skip_warning is not None:
+                results.add_warning(*step.skip_warning)
+            return False, 0, 0
+        quantity = step.constant if step.quantity_name is None else values[step.quantity_name]
+        if step.round_digits is not None:
+            quantity = round(quantity, step.round_digits)
+        adjustments = additions = 0
+        for _ in range(repeat):
+            for desc in step.targets:
+                item = find(desc)
+                if not item:
+                    if step.add is not None:
+                        trace.debug("  ❌ Not found: {} - ADDING NEW ITEM ({})", desc, quantity)
+                        engine.add_new_item(line_items, desc, quantity, context=context, **step.add)
+                        additions += 1
+                    else:
+                        trace.debug("  ❌ Not found: {}", desc)
+                    continue
+                if desc in step.reduced_targets:
+                    self._reduce(step, trace, pending, item, desc, quantity, results)
+                elif step.update is not None:
+                    if id(item) in pending:
+                        self._apply_reduction(trace, pending.pop(id(item)), context.performance)
+                    adjustments += self._adjust_item(step, engine, line_items, item, desc, quantity, results)
+                if step.first_only:
+                    break
+        return True, adjustments, additions
+
+    @staticmethod
+    def _reduce(step: PlanStep, trace: EngineTrace, pending: Dict[int, tuple], item: Dict[str, Any],
+                desc: str, quantity: Any, results: AdjustmentResult) -> None:
+        """Record a raise as a candidate of the item's max-reduction.
+
+        The item's adjustment record is placed where its first raising
+        candidate sits and completed when the reduction is applied. Its audit
+        entry is placed where the first candidate with an explanation sits
+        and records the last such candidate's raise, as sequential evaluation
+        would have. The last narrative-bearing candidate is kept alongside
+        the winner: its narrative applies even when a later candidate (e.g.
+        an unrounded max rule) wins.
+        """
+        entry = pending.get(id(item))
+        old_qty = float(item["quantity"]) if entry is None else entry[2]
+        current = old_qty if entry is None else entry[3]
+        trace.debug("  Found: {} - Current Qty: {}, Target: {}", desc, current, quantity)
+        if not current < quantity:
+            trace.debug("    ⏭️  No change needed (already sufficient)")
+            return
+        trace.debug("    ⬆️  Candidate: {} ({})", quantity, step.rule_id)
+        params = {'quantity': quantity}
+        if entry is None:
+            results.add_adjustment(desc, old_qty, quantity, RuleText(step.rule_id, step.reason, params))
+            adjustment, audit, narrated = results.adjustments[-1], None, None
+        else:
+            adjustment, audit, narrated = entry[5:]
+        if step.explanation is not None:
+            explanation = RuleText(step.rule_id, step.explanation, params)
+            if audit is None:
+                results.add_audit_entry_for_item(item, 'quantity', old_qty, quantity, explanation, step.name)
+                audit = results.audit_log[-1]
+            else:
+                audit.update(after=quantity, explanation=explanation, rule_applied=step.name)
+            if step.narrative:
+                narrated = (step, quantity)
+        pending[id(item)] = (item, desc, old_qty, quantity, step, adjustment, audit, narrated)
+
+    @staticmethod
+    def _apply_reduction(trace: EngineTrace, entry: tuple,
+                         performance: Optional['RulePerformance'] = None) -> None:
+        """Adjust an item once to the winning candidate of its max-reduction and complete its adjustment record."""
+        item, desc, old_qty, quantity, step, adjustment, _, narrated = entry
+        if performance is not None:
+            performance.count_adjustment(step.rule_id)
+        item["quantity"] = quantity
+        trace.debug("  ✅ ADJUSTED: {} {} → {} ({})", desc, old_qty, quantity, step.name)
+        adjustment['new_quantity'] = quantity
+        adjustment['reason'] = RuleText(step.rule_id, step.reason, {'quantity': quantity})
+        if narrated is not None:
+            # Text of the narrative-bearing candidate, with the quantity it raised to
+            narrator, narrated_qty = narrated
+            item["narrative"] = RuleText(narrator.rule_id, narrator.narrative_template, {'quantity': narrated_qty})
+
+    def _adjust_item(self, step: PlanStep, engine: 'RoofAdjustmentEngine', line_items: 'IndexedLineItems',
+                     item: Dict[str, Any], desc: str, quantity: Any, results: AdjustmentResult) -> bool:
+        """Apply a step's update to a found item; returns whether its quantity was adjusted."""
+        trace = engine.trace
+        update = step.update
+        old_qty = float(item["quantity"])
+        trace.debug("  Found: {} - Current Qty: {}, Target: {}", desc, old_qty, quantity)
+        if update == 'raise':
+            if not old_qty < quantity:
+                trace.debug("    ⏭️  No change needed (already sufficient)")
+                return False
+            new_qty = quantity
+        elif update == 'max_unless_close':
+            if math.isclose(old_qty, quantity):
+                trace.debug("    ⏭️  No change needed (already matches)")
+                return False
+            new_qty = max(old_qty, quantity)
+            if step.require_change and math.isclose(old_qty, new_qty):
+                trace.debug("    ⏭️  No change needed (quantity already sufficient)")
+                return False
+        elif update == 'set_unless_close':
+            if math.isclose(old_qty, quantity):
+                trace.debug("    ⏭️  No change needed (already matches)")
+                return False
+            new_qty = quantity
+        elif update == 'set':
+            new_qty = quantity
+        elif update == 'round_quarter':
+            if engine.is_multiple_of(old_qty % 1, 0.25):  # Check fractional part
+                return False
+            new_qty = math.ceil(old_qty * 4) / 4
+        else:  # round_third
+            frac = old_qty - math.floor(old_qty)
+            if math.isclose(frac, 0) or math.isclose(frac, 0.33, abs_tol=0.01) or math.isclose(frac, 0.67, abs_tol=0.01):
+                return False
+            new_qty = math.ceil(old_qty * 3) / 3
+        
+        item["quantity"] = new_qty
+        if step.update_costs:
+            engine.update_item_costs(item)
+            line_items.refresh(item)
+        trace.debug("    ✅ ADJUSTED: {} → {}", old_qty, new_qty)
+        params = {'quantity': quantity}
+        results.add_adjustment(desc, old_qty, item["quantity"], RuleText(step.rule_id, step.reason, params))
+        if step.explanation is not None:
+            if step.narrative:
+                # Narrative on the line item for frontend highlighting
+                item["narrative"] = RuleText(step.rule_id, step.narrative_template, params)
+            results.add_audit_entry_for_item(item, 'quantity', old_qty, item["quantity"],
+                                             RuleText(step.rule_id, step.explanation, params), step.name)
+        return True
+
+
+def adjustment_rules_version(rules: List[Dict[str, Any]], metrics=None, derived=None) -> str:
+    """Digest identifying a rule table together with the metrics and quantities it reads."""
+    metrics = [tuple(metric) for metric in (metrics if metrics is not None else ROOF_METRICS)]
+    derived = [(name, tuple(sources), divisor)
+               for name, sources, divisor in (derived if derived is not None else DERIVED_QUANTITIES)]
+    return hashlib.sha256(repr((metrics, derived, rules)).encode('utf-8')).hexdigest()[:16]
+
+
+# Ints below this stay exact as float64 sums of a few of them
+_EXACT_INT_LIMIT = 2 ** 48
+
+_ADJUSTMENT_PLANS: Dict[str, AdjustmentPlan] = {}
+_ADJUSTMENT_PLANS_LOCK = threading.Lock()
+
+
+def compile_adjustment_plan(rules: Optional[List[Dict[str, Any]]] = None) -> AdjustmentPlan:
+    """Compiled plan for a rule table (ADJUSTMENT_RULES by default), compiled once per rule-set version."""
+    if rules is None:
+        rules = ADJUSTMENT_RULES
+    version = adjustment_rules_version(rules)
+    with _ADJUSTMENT_PLANS_LOCK:
+        plan = _ADJUSTMENT_PLANS.get(version)
+        if plan is None:
+            plan = _ADJUSTMENT_PLANS[version] = AdjustmentPlan(rules)
+        return plan
+
+
+ADJUSTMENT_PLAN = compile_adjustment_plan()
+
+# Measurement report keys and the other spellings they arrive under. Every
+# spelling is matched by its words, so case, separators and camelCase do not
+# matter ("Total Roof Area", "total_roof_area", "totalRoofArea" and the web
+# route's "_total _roof _area" are the same key), and a trailing unit
+# ("(sq ft)", "_sqft", "Ft", "LF", ...) is ignored. Pitch areas are matched
+# generically for any pitch ("areaPitch7_12", "area_pitch_12_plus", ...).
+MEASUREMENT_KEY_ALIASES = {
+    "Total Roof Area": ("total_area", "roof_area"),
+    "Total Eaves Length": ("eaves_length", "eave_length", "total_eave_length", "eaves"),
+    "Total Rakes Length": ("rakes_length", "rake_length", "total_rake_length", "rakes"),
+    "Total Ridges/Hips Length": ("ridges_hips_length", "ridge_hip_length", "total_ridge_hip_length",
+                                 "ridges_and_hips_length"),
+    "Total Line Lengths (Ridges)": ("ridge_length", "ridges_length", "total_ridge_length",
+                                    "total_ridges_length", "ridges"),
+    "Total Line Lengths (Hips)": ("hip_length", "hips_length", "total_hip_length", "total_hips_length", "hips"),
+    "Total Line Lengths (Valleys)": (),
+    "Total Valleys Length": ("valleys_length", "valley_length", "total_valley_length", "valleys"),
+    "Total Step Flashing Length": ("step_flashing_length", "step_flashing"),
+    "Total Flashing Length": ("flashing_length", "flashing"),
+    "Number of Stories": ("stories", "number_stories", "num_stories"),
+    # Known but not read by any rule (RoofMeasurements carries them)
+    "Net Roof Area": ("net_area",),
+    "Gross Roof Area": ("gross_area",),
+}
+# The combined ridge/hip length the rules read, and the line lengths it is derived from
+RIDGES_HIPS_KEY = "Total Ridges/Hips Length"
+RIDGE_HIP_LINE_KEYS = ("Total Line Lengths (Ridges)", "Total Line Lengths (Hips)")
+# Words dropped from every key, and unit suffixes stripped from its end
+MEASUREMENT_KEY_FILLERS = ('for', 'and', 'of', 'the')
+MEASUREMENT_KEY_UNITS = (('sq', 'ft'), ('sq', 'feet'), ('square', 'feet'), ('sqft',), ('sf',),
+                         ('ft',), ('feet',), ('lf',))
+_KEY_CAMEL_BOUNDARY = re.compile(r'(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Za-z])(?=[0-9])')
+_KEY_WORD = re.compile(r'[a-z]+|[0-9]+')
+_PITCH_AREA_WORDS = re.compile(r'^area_pitch_([0-9]+)(?:_12)?(_plus)?$|^pitch_([0-9]+)(?:_12)?(_plus)?_area$')
+
+
+def _measurement_key_words(key: str) -> str:
+    """A measurement key reduced to its lowercase words, joined by '_'."""
+    words = _KEY_WORD.findall(_KEY_CAMEL_BOUNDARY.sub(' ', key.replace('+', ' plus ')).lower())
+    words = [word for word in words if word not in MEASUREMENT_KEY_FILLERS]
+    for unit in MEASUREMENT_KEY_UNITS:
+        if len(words) > len(unit) and tuple(words[-len(unit):]) == unit:
+            del words[-len(unit):]
+            break
+    return '_'.join(words)
+
+
+class MeasurementSchema:
+    """Maps measurement keys in any supported convention to the report's keys.
+
+    Compiled once from an alias table (MEASUREMENT_KEY_ALIASES plus the keys
+    the rules read); normalize() renames a measurement dict in one pass.
+    Lookups are memoized per raw key, since the same spellings recur on
+    every claim.
+    """
+
+    CACHE_SIZE = 4096
+
+    def __init__(self, aliases: Optional[Mapping[str, Any]] = None, metrics=None):
+        aliases = dict(MEASUREMENT_KEY_ALIASES if aliases is None else aliases)
+        for _, key in (metrics if metrics is not None else ROOF_METRICS):
+            aliases.setdefault(key, ())
+        words_to_key: Dict[str, str] = {}
+        for canonical, spellings in aliases.items():
+            for spelling in (canonical,) + tuple(spellings):
+                words = _measurement_key_words(spelling)
+                if words_to_key.setdefault(words, canonical) != canonical:
+                    raise ValueError(f"Measurement key alias '{spelling}' is ambiguous: "
+                                     f"'{words_to_key[words]}' or '{canonical}'")
+        self._words_to_key = words_to_key
+        self._cache: Dict[Any, Optional[str]] = {}
+
+    def canonical_key(self, key: Any) -> Optional[str]:
+        """The report key for key, or None if it is not recognized."""
+        try:
+            return self._cache[key]
+        except (KeyError, TypeError):
+            pass
+        canonical = None
+        if isinstance(key, str):
+            words = _measurement_key_words(key)
+            canonical = self._words_to_key.get(words)
+            if canonical is None:
+                match = _PITCH_AREA_WORDS.match(words)
+                if match is not None:
+                    pitch = match.group(1) or match.group(3)
+                    plus = match.group(2) or match.group(4)
+                    canonical = f"Area for Pitch {int(pitch)}/12{'+' if plus else ''} (sq ft)"
+            if len(self._cache) < self.CACHE_SIZE:
+                self._cache[key] = canonical
+        return canonical
+
+    def normalize(self, measurements: Mapping[str, Any], derive: bool = True) -> tuple:
+        """(measurements under report keys, unrecognized keys).
+
+        Unrecognized keys are kept as they are. A recognized key given a bare
+        value rather than the report's {"value": x} entry gets it wrapped.
+        When two keys map to the same report key, the report's own spelling
+        wins, then the first alias. When ridge or hip lengths arrive under
+        another convention's key (ridgeLength, hip_length, ...), as
+        RoofMeasurements gives them, a missing 'Total Ridges/Hips Length' is
+        derived as ridges + hips unless derive is False; reports in the
+        report's own keys are left as they are. measurements is returned
+        unchanged if it needs no renaming.
+        """
+        normalized: Dict[str, Any] = {}
+        unrecognized = []
+        renamed = False
+        aliased_lengths = False
+        for key, value in measurements.items():
+            canonical = self.canonical_key(key)
+            if canonical is None:
+                unrecognized.append(key)
+                normalized[key] = value
+                continue
+            if not isinstance(value, Mapping):
+                value = {"value": value}
+                renamed = True
+            if canonical != key:
+                renamed = True
+                aliased_lengths = aliased_lengths or canonical in RIDGE_HIP_LINE_KEYS
+                if canonical in normalized:
+                    continue
+            normalized[canonical] = value
+        if derive and aliased_lengths and self.derive_ridges_hips(normalized):
+            renamed = True
+        return (normalized if renamed else measurements), unrecognized
+
+    def aliases_ridge_hip_lengths(self, keys) -> bool:
+        """Whether any of keys gives a ridge or hip length under another convention's key."""
+        for key in keys:
+            canonical = self.canonical_key(key)
+            if canonical in RIDGE_HIP_LINE_KEYS and canonical != key:
+                return True
+        return False
+
+    @staticmethod
+    def derive_ridges_hips(normalized: Dict[str, Any]) -> bool:
+        """Add 'Total Ridges/Hips Length' as ridges + hips to normalized measurements that lack it.
+
+        Returns whether it was added (not when it is present, or when no
+        numeric ridge or hip length is).
+        """
+        if RIDGES_HIPS_KEY in normalized:
+            return False
+        lengths = [_coerce_number(normalized[key].get("value"))
+                   for key in RIDGE_HIP_LINE_KEYS if key in normalized]
+        lengths = [length for length in lengths if length is not None]
+        if not lengths or not all(isinstance(length, (int, float)) and not isinstance(length, bool)
+                                  for length in lengths):
+            return False
+        normalized[RIDGES_HIPS_KEY] = {"value": sum(lengths)}
+        return True
+
+
+MEASUREMENT_SCHEMA = MeasurementSchema()
+
+PITCH_AREA_KEY = re.compile(r"^Area for Pitch (\d+)/12(\+?) \(sq ft\)$")
+
+
+class RoofMetrics:
+    """A claim's roof measurements, parsed once for every consumer.
+
+    measurements are keyed by the report's own keys (see MeasurementSchema),
+    with the keys that could not be mapped in unrecognized_keys. values
+    holds the metric and derived quantity values the rules read
+    (AdjustmentPlan.evaluate_values); the rules, the result summary and the
+    debug trace all use them instead of reading the report again.
+
+    Pitch areas are also available as a pitch-indexed histogram with prefix
+    sums, built on first use, so the area of any pitch band is an O(1)
+    lookup. Every "Area for Pitch N/12 (sq ft)" key is picked up, whatever
+    N; an "N/12+" area counts as pitch N + 1 (steeper than N/12), and
+    non-numeric areas count as 0. Band areas are exact for whole-number
+    areas; the rule quantities keep the plan's own sums.
+    """
+
+    __slots__ = ('measurements', 'values', 'unrecognized_keys', '_min_pitch', '_prefix')
+
+    def __init__(self, measurements: Mapping[str, Any], values: Dict[str, Any], unrecognized_keys=()):
+        self.measurements = measurements
+        self.values = values
+        self.unrecognized_keys = list(unrecognized_keys)
+        self._min_pitch = 0
+        self._prefix: Optional[List[float]] = None
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+    def _build_histogram(self) -> List[float]:
+        areas: Dict[int, Any] = {}
+        for key, entry in self.measurements.items():
+            match = PITCH_AREA_KEY.match(key) if isinstance(key, str) else None
+            if match is None:
+                continue
+            pitch = int(match.group(1)) + (1 if match.group(2) else 0)
+            area = _coerce_number(entry.get("value", 0) if isinstance(entry, Mapping) else entry)
+            if isinstance(area, bool) or not isinstance(area, (int, float)):
+                area = 0
+            areas[pitch] = areas.get(pitch, 0) + area
+        self._min_pitch = min(areas, default=0)
+        prefix = [0]
+        for pitch in range(self._min_pitch, max(areas, default=-1) + 1):
+            prefix.append(prefix[-1] + areas.get(pitch, 0))
+        self._prefix = prefix
+        return prefix
+
+    @property
+    def pitch_areas(self) -> Dict[int, Any]:
+        """Area by pitch (N in N/12) for every pitch from the lowest to the highest reported."""
+        prefix = self._prefix if self._prefix is not None else self._build_histogram()
+        return {self._min_pitch + index: prefix[index + 1] - prefix[index] for index in range(len(prefix) - 1)}
+
+    def band_area(self, low: Optional[int] = None, high: Optional[int] = None) -> Any:
+        """Total area of pitches low/12 through high/12 inclusive (open-ended when None)."""
+        prefix = self._prefix if self._prefix is not None else self._build_histogram()
+        count = len(prefix) - 1
+        start = 0 if low is None else min(max(low - self._min_pitch, 0), count)
+        stop = count if high is None else min(max(high - self._min_pitch + 1, 0), count)
+        return prefix[stop] - prefix[start] if stop > start else 0
+
+
+class RoofMeasurements(Mapping):
+    """Compact roof measurement model with one numeric coercion pass at ingest.
+
+    Reads like the engine's measurement dict: a mapping of the report's
+    metric names to {"value": x} entries, including the combined
+    'Total Ridges/Hips Length' (ridges + hips unless given explicitly).
+    Metrics that were never given stay absent; unknown keys are kept in
+    extra so to_dict() round-trips the input of from_dict().
+    """
+
+    METRICS = (
+        ('total_area', 'Total Roof Area'),
+        ('net_area', 'Net Roof Area'),
+        ('gross_area', 'Gross Roof Area'),
+        ('total_eaves_length', 'Total Eaves Length'),
+        ('total_rakes_length', 'Total Rakes Length'),
+        ('total_ridges_length', 'Total Ridges Length'),
+        ('total_hips_length', 'Total Hips Length'),
+        ('total_ridges_hips_length', 'Total Ridges/Hips Length'),
+        ('total_valleys_length', 'Total Valleys Length'),
+        ('total_step_flashing_length', 'Total Step Flashing Length'),
+        ('total_flashing_length', 'Total Flashing Length'),
+        ('area_pitch_7_12', 'Area for Pitch 7/12 (sq ft)'),
+        ('area_pitch_8_12', 'Area for Pitch 8/12 (sq ft)'),
+        ('area_pitch_9_12', 'Area for Pitch 9/12 (sq ft)'),
+        ('area_pitch_10_12', 'Area for Pitch 10/12 (sq ft)'),
+        ('area_pitch_11_12', 'Area for Pitch 11/12 (sq ft)'),
+        ('area_pitch_12_12', 'Area for Pitch 12/12 (sq ft)'),
+        ('area_pitch_12_12_plus', 'Area for Pitch 12/12+ (sq ft)'),
+    )
+    _FIELD_BY_NAME = {name: field for field, name in METRICS}
+
+    __slots__ = tuple(field for field, _ in METRICS) + ('extra',)
+
+    def __init__(self, extra: Optional[Dict[str, Any]] = None, **metrics):
+        for field, _ in self.METRICS:
+            value = metrics.pop(field, None)
+            setattr(self, field, None if value is None else _coerce_number(value))
+        if metrics:
+            raise TypeError(f"Unknown roof measurement(s): {', '.join(sorted(metrics))}")
+        self.extra = dict(extra) if extra else {}
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> 'RoofMeasurements':
+        """Build from the engine's {"Metric Name": {"value": x}} dict shape."""
+        metrics, extra = {}, {}
+        for name, entry in data.items():
+            field = cls._FIELD_BY_NAME.get(name)
+            if field is not None and isinstance(entry, Mapping) and set(entry) == {'value'} \
+                    and entry['value'] is not None:
+                metrics[field] = entry['value']
+            else:
+                extra[name] = entry
+        return cls(extra=extra, **metrics)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The engine's dict shape; only metrics that were given are included."""
+        data = {name: {"value": getattr(self, field)}
+                for field, name in self.METRICS if getattr(self, field) is not None}
+        data.update(self.extra)
+        return data
+
+    def _value(self, name: str) -> Any:
+        field = self._FIELD_BY_NAME.get(name)
+        if field is None:
+            return None
+        value = getattr(self, field)
+        if value is None and field == 'total_ridges_hips_length':
+            if self.total_ridges_length is not None or self.total_hips_length is not None:
+                value = (self.total_ridges_length or 0) + (self.total_hips_length or 0)
+        return value
+
+    def __getitem__(self, name):
+        value = self._value(name)
+        if value is not None:
+            return {"value": value}
+        return self.extra[name]
+
+    def __iter__(self):
+        for _, name in self.METRICS:
+            if self._value(name) is not None:
+                yield name
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"RoofMeasurements({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state) -> None:
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+
+# Pinned so fingerprints stored by the disk and Redis caches stay stable across Python versions
+FINGERPRINT_PICKLE_PROTOCOL = 4
+
+# Part of every claim fingerprint: bump when engine code changes what process_claim returns
+RESULT_SCHEMA_VERSION = 2
+
+
+class ResultCache:
+    """Pluggable process_claim result cache, keyed by claim fingerprint.
+
+    get returns (result, stored_at) or None; set stores a result. Backends
+    must be safe to share between threads. This base class caches nothing.
+    worker_config returns the constructor arguments that rebuild the
+    backend in a process_claims process worker, or None if it cannot be.
+    """
+
+    name = 'none'
+
+    def get(self, fingerprint: str) -> Optional[tuple]:
+        return None
+
+    def set(self, fingerprint: str, result: Dict[str, Any]) -> None:
+        pass
+
+    def worker_config(self) -> Optional[Dict[str, Any]]:
+        return None
+
+
+class MemoryResultCache(ResultCache):
+    """In-process LRU of the most recent maxsize results.
+
+    Results are kept pickled, so a stored result shares nothing with the
+    caller's line items and every hit returns a fresh copy.
+    """
+
+    name = 'memory'
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def get(self, fingerprint: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                return None
+            self._entries.move_to_end(fingerprint)
+        data, stored_at = entry
+        return pickle.loads(data), stored_at
+
+    def set(self, fingerprint: str, result: Dict[str, Any]) -> None:
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[fingerprint] = (data, time.time())
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def worker_config(self) -> Optional[Dict[str, Any]]:
+        return {'maxsize': self.maxsize}  # Each process worker keeps its own LRU
+
+
+def _result_json_default(value: Any) -> Any:
+    if isinstance(value, RuleText):
+        return {'__rule_text__': [value.rule_id, value.template, value.params]}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _result_json_object(entry: Dict[str, Any]) -> Any:
+    if len(entry) == 1 and '__rule_text__' in entry:
+        return RuleText(*entry['__rule_text__'])
+    return entry
+
+
+def encode_cached_result(result: Dict[str, Any], stored_at: float) -> str:
+    """JSON form of a cached result (RuleText values kept unrendered) for the shared backends."""
+    return json.dumps({'stored_at': stored_at, 'result': result}, default=_result_json_default)
+
+
+def decode_cached_result(text: str) -> tuple:
+    data = json.loads(text, object_hook=_result_json_object)
+    return data['result'], data['stored_at']
+
+
+class DiskResultCache(ResultCache):
+    """Results stored as JSON files, one per fingerprint, under directory."""
+
+    name = 'disk'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, fingerprint + '.json')
+
+    def get(self, fingerprint: str) -> Optional[tuple]:
+        try:
+            with open(self._path(fingerprint), 'r', encoding='utf-8') as f:
+                return decode_cached_result(f.read())
+        except FileNotFoundError:
+            return None
+
+    def set(self, fingerprint: str, result: Dict[str, Any]) -> None:
+        path = self._path(fingerprint)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(encode_cached_result(result, time.time()))
+        os.replace(temp_path, path)  # Readers never see a partly written file
+
+    def worker_config(self) -> Optional[Dict[str, Any]]:
+        return {'directory': self.directory}
+
+
+class RedisResultCache(ResultCache):
+    """Results stored in Redis under prefix + fingerprint, expiring after ttl seconds if given.
+
+    Pass a redis client, or a url to connect with the redis package (an
+    optional dependency, only imported here). Only a cache built from a url
+    can be rebuilt in process workers.
+    """
+
+    name = 'redis'
+
+    def __init__(self, client=None, url: Optional[str] = None, prefix: str = 'roof-adjustment:result:',
+                 ttl: Optional[int] = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("RedisResultCache needs the 'redis' package (pip install redis)") from e
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        self.client = client
+        self.url = url
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, fingerprint: str) -> Optional[tuple]:
+        data = self.client.get(self.prefix + fingerprint)
+        if data is None:
+            return None
+        return decode_cached_result(data.decode('utf-8') if isinstance(data, bytes) else data)
+
+    def set(self, fingerprint: str, result: Dict[str, Any]) -> None:
+        self.client.set(self.prefix + fingerprint, encode_cached_result(result, time.time()), ex=self.ttl)
+
+    def worker_config(self) -> Optional[Dict[str, Any]]:
+        if self.url is None:
+            return None
+        return {'url': self.url, 'prefix': self.prefix, 'ttl': self.ttl}
+
+
+class RulePerformance:
+    """Per-rule firing counters and cumulative monotonic-clock time.
+
+    Keyed by rule id (plus the 'carrier_replacements' and
+    'unit_price_comparison' stages of apply_logic). A rule is evaluated
+    once per claim and hits when its condition holds; adjustments and
+    additions count the line items it changed and added.
+    """
+
+    FIELDS = ('evaluations', 'hits', 'adjustments', 'additions', 'nanoseconds')
+
+    __slots__ = ('rules',)
+
+    def __init__(self):
+        self.rules: Dict[str, List[int]] = {}  # rule id -> counters in FIELDS order
+
+    def _counters(self, rule_id: str) -> List[int]:
+        counters = self.rules.get(rule_id)
+        if counters is None:
+            counters = self.rules[rule_id] = [0] * len(self.FIELDS)
+        return counters
+
+    def record(self, rule_id: str, hit: bool, adjustments: int, additions: int, nanoseconds: int) -> None:
+        counters = self._counters(rule_id)
+        counters[0] += 1
+        counters[1] += bool(hit)
+        counters[2] += adjustments
+        counters[3] += additions
+        counters[4] += nanoseconds
+
+    def count_adjustment(self, rule_id: str) -> None:
+        self._counters(rule_id)[2] += 1
+
+    def merge(self, other: 'RulePerformance') -> None:
+        for rule_id, counters in other.rules.items():
+            totals = self._counters(rule_id)
+            for position, value in enumerate(counters):
+                totals[position] += value
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        return {rule_id: dict(zip(self.FIELDS, counters)) for rule_id, counters in self.rules.items()}
+
+
+class PerformanceRegistry:
+    """Process-wide aggregate of the RulePerformance of every instrumented claim.
+
+    A metrics exporter scrapes snapshot(); claims processed in 'process'
+    batch workers are aggregated in those worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = RulePerformance()
+        self._claims = 0
+        self._nanoseconds = 0
+
+    def add(self, performance: RulePerformance, nanoseconds: int) -> None:
+        with self._lock:
+            self._totals.merge(performance)
+            self._claims += 1
+            self._nanoseconds += nanoseconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'claims': self._claims, 'nanoseconds': self._nanoseconds, 'rules': self._totals.to_dict()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals = RulePerformance()
+            self._claims = 0
+            self._nanoseconds = 0
+
+
+RULE_PERFORMANCE = PerformanceRegistry()
+
+
+class ClaimContext:
+    """Per-invocation state for one claim: results, audit log and counters.
+
+    Created fresh by every process_claim call so a single engine never
+    carries state from one claim to the next. With performance=True the
+    rules record their RulePerformance on context.performance.
+    """
+
+    def __init__(self, performance: bool = False):
+        self.results = AdjustmentResult()
+        self.counters: Dict[str, int] = {}
+        self.metrics: Optional[RoofMetrics] = None  # set by apply_logic
+        self.performance: Optional[RulePerformance] = RulePerformance() if performance else None
+
+    @property
+    def audit_log(self) -> List[Dict[str, Any]]:
+        return self.results.audit_log
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+
+class RoofAdjustmentEngine:
+    """Main engine for processing roof adjustment rules.
 
+    Apart from the shared (immutable) catalog and compiled rules the engine
+    holds no state: every process_claim call works on its own ClaimContext,
+    so one warm engine can serve many claims, threads and invocations.
 
-class RoofAdjustmentEngine:
-    """Main engine for processing roof adjustment rules."""
+    With a catalog_manager the engine prices against the manager's current
+    catalog version, which may be swapped while the engine is in use; each
+    claim is pinned to the version it started with. price_policy chooses
+    among a description's catalog price rows (see PRICE_POLICIES). With a
+    fuzzy_threshold (0-1) descriptions that differ from the catalog in
+    punctuation, spacing or small typos match by similarity before the
+    containment fallback is tried (see CatalogMatcher).
+
+    With catalog_shards, a claim may name its carrier / region catalog by a
+    catalog_key; claims without one use the engine's own catalog.
+    """
     
-    def __init__(self):
-        self.results = AdjustmentResult()
-        self.roof_master_macro = self.load_roof_master_macro()
+    def __init__(self, catalog_path: Optional[str] = None, trace: Optional[EngineTrace] = None,
+                 rules: Optional[List[Dict[str, Any]]] = None, result_cache: Optional[ResultCache] = None,
+                 performance: bool = False, catalog_manager: Optional[CatalogManager] = None,
+                 price_policy: str = 'last', fuzzy_threshold: Optional[float] = None,
+                 catalog_shards: Optional[CatalogShards] = None):
+        if fuzzy_threshold is not None and not 0 < fuzzy_threshold <= 1:
+            raise ValueError("fuzzy_threshold must be between 0 (exclusive) and 1")
+        self.trace = trace if trace is not None else TRACE
+        self.price_policy = validate_price_policy(price_policy)
+        self.fuzzy_threshold = fuzzy_threshold
+        self.catalog_manager = catalog_manager
+        self.catalog_shards = catalog_shards
+        self._catalog_pin = threading.local()  # Catalog version of the claim running on this thread
+        # Default for process_claim(performance=...): per-rule timing and firing counters
+        self.performance = performance
+        # process_claim results by claim fingerprint; off unless a caching backend is passed
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+        self._catalog_version: tuple = (None, None)
+        self.adjustment_plan = ADJUSTMENT_PLAN if rules is None else compile_adjustment_plan(rules)
+        self.measurement_schema = MEASUREMENT_SCHEMA
+        self.catalog = (get_roof_master_catalog(catalog_path) if catalog_manager is None
+                        else catalog_manager.current().catalog)
+        self.roof_master_macro = self.catalog.entries
+        self.catalog_matcher = self.catalog.matcher
         
-    def load_roof_master_macro(self) -> Dict[str, Dict[str, Any]]:
-        """Load Roof Master Macro CSV file (3 columns: description, unit, unit_price)."""
-        macro_data = {}
+    def load_roof_master_macro(self) -> Mapping[str, Mapping[str, Any]]:
+        """Load Roof Master Macro CSV file (3 columns: description, unit, unit_price).
+
+        Returns the process-wide shared (read-only) catalog; the file is only
+        parsed again when it changes on disk.
+        """
+        return get_roof_master_catalog().entries
+
+    def catalog_for_key(self, catalog_key: Optional[str]) -> Optional[CatalogVersion]:
+        """The catalog version a claim with catalog_key is priced against (None: the engine's own catalog)."""
+        if catalog_key is None:
+            return self.active_catalog()
+        if self.catalog_shards is None:
+            raise ValueError(f"Catalog key '{catalog_key}' given but the engine has no catalog shards")
+        return self.catalog_shards.get(catalog_key)
+
+    def active_catalog(self) -> Optional[CatalogVersion]:
+        """The managed catalog version in use on this thread (None without a catalog manager)."""
+        pinned = getattr(self._catalog_pin, 'version', None)
+        if pinned is not None or self.catalog_manager is None:
+            return pinned
+        return self.catalog_manager.current()
+
+    def _worker_catalog_version(self) -> Optional[tuple]:
+        """(version, digest) of the managed catalog, for process workers to sync to (None without a manager)."""
+        active = self.active_catalog() if self.catalog_manager is not None else None
+        return None if active is None else (active.version, active.catalog.digest)
+
+    @contextlib.contextmanager
+    def using_catalog(self, version: Optional[CatalogVersion]):
+        """Pin this thread's lookups to a catalog version (None: no pin) for the duration of the block."""
+        previous = getattr(self._catalog_pin, 'version', None)
+        self._catalog_pin.version = version if version is not None else previous
         try:
-            # Try multiple paths for the CSV file
-            csv_paths = [
-                os.path.join(os.path.dirname(__file__), 'roof_master_macro.csv'),
-                os.path.join(os.path.dirname(__file__), '..', 'public', 'roof_master_macro.csv'),
-                os.path.join('public', 'roof_master_macro.csv'),
-                'roof_master_macro.csv'
-            ]
-            
-            csv_path = None
-            for path in csv_paths:
-                if os.path.exists(path):
-                    csv_path = path
-                    break
-            
-            if csv_path:
-                print(f"📂 Loading Roof Master Macro from: {csv_path}")
-                with open(csv_path, 'r', encoding='utf-8') as f:
-                    # Auto-detect delimiter (tab or comma)
-                    sample = f.read(1024)
-                    f.seek(0)
-                    sniffer = csv.Sniffer()
-                    try:
-                        dialect = sniffer.sniff(sample)
-                        csv_reader = csv.DictReader(f, dialect=dialect)
-                    except:
-                        # Fallback to comma delimiter
-                        csv_reader = csv.DictReader(f)
-                    
-                    # Verify required columns are present
-                    if csv_reader.fieldnames:
-                        # Normalize field names (case-insensitive, strip whitespace)
-                        fieldnames = [field.strip().lower().replace(' ', '_') for field in csv_reader.fieldnames]
-                        
-                        if 'description' not in fieldnames or 'unit' not in fieldnames or 'unit_price' not in fieldnames:
-                            print(f"⚠️ CSV file missing required columns. Expected: Description, Unit, Unit Price (or description, unit, unit_price)")
-                            print(f"   Found columns: {csv_reader.fieldnames}")
-                            return macro_data
-                    
-                    # Reset reader to process rows
-                    f.seek(0)
-                    try:
-                        csv_reader = csv.DictReader(f, dialect=dialect)
-                    except:
-                        csv_reader = csv.DictReader(f)
-                    
-                    for row in csv_reader:
-                        try:
-                            # Get values with case-insensitive keys (handle spaces in column names)
-                            description = None
-                            unit = None
-                            unit_price = None
-                            
-                            for key, value in row.items():
-                                key_normalized = key.strip().lower().replace(' ', '_')
-                                if key_normalized == 'description':
-                                    description = value.strip()
-                                elif key_normalized == 'unit':
-                                    unit = value.strip().upper()
-                                elif key_normalized == 'unit_price':
-                                    unit_price = float(value.strip())
-                            
-                            if description and unit and unit_price is not None and unit_price > 0:
-                                macro_data[description] = {
-                                    'unit_price': unit_price,
-                                    'rcv': unit_price,
-                                    'acv': unit_price,
-                                    'unit': unit
-                                }
-                        except (ValueError, KeyError) as e:
-                            print(f"⚠️ Skipping invalid row: {row} - Error: {e}")
-                            continue
-                
-                print(f"✅ Loaded {len(macro_data)} items from Roof Master Macro CSV")
-            else:
-                print(f"⚠️ Roof Master Macro CSV file not found in any of these locations:")
-                for path in csv_paths:
-                    print(f"   - {path}")
-        except Exception as e:
-            print(f"⚠️ Error loading Roof Master Macro CSV: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        return macro_data
+            yield version
+        finally:
+            self._catalog_pin.version = previous
+
+    def _current_matcher(self) -> CatalogMatcher:
+        """Matcher for the engine's catalog, recompiled if roof_master_macro was swapped out."""
+        active = self.active_catalog()
+        if active is not None:
+            return active.catalog.matcher
+        if self.catalog_matcher.catalog is not self.roof_master_macro:
+            self.catalog_matcher = CatalogMatcher(self.roof_master_macro)
+        return self.catalog_matcher
+
+    def _lookup_options(self) -> tuple:
+        """The engine settings that catalog lookups depend on."""
+        return self.price_policy, self.fuzzy_threshold
+
+    def _current_prices(self) -> Optional[List[Mapping[str, Any]]]:
+        """Entries the price policy selects, in matcher ordinal order (None: the matcher's own entries)."""
+        if self.price_policy == 'last':
+            return None
+        active = self.active_catalog()
+        if active is not None:
+            return active.catalog.prices(self.price_policy)
+        if self.roof_master_macro is self.catalog.entries:
+            return self.catalog.prices(self.price_policy)
+        return None  # A swapped-in plain mapping has one row per description
+
+    def catalog_version(self) -> str:
+        """Digest of the catalog the engine prices against (computed once per swapped-in roof_master_macro)."""
+        active = self.active_catalog()
+        if active is not None:
+            return active.catalog.digest or 'empty'
+        macro = self.roof_master_macro
+        if macro is self.catalog.entries:
+            return self.catalog.digest or 'empty'
+        cached_macro, version = self._catalog_version
+        if cached_macro is not macro:
+            content = repr(sorted((desc, sorted(dict(entry).items())) for desc, entry in macro.items()))
+            version = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            self._catalog_version = (macro, version)
+        return version
+
+    def claim_fingerprint(self, line_items: List[Dict[str, Any]], roof_measurements: Dict[str, Any],
+                          changed_only: bool = False, render_text: bool = True) -> str:
+        """Canonical digest of everything a process_claim result depends on.
+
+        Covers the line items, the measurements (after key normalization, in
+        key order), the catalog, rule-set and replacement-rule versions, the
+        price policy and fuzzy threshold, the result options and
+        RESULT_SCHEMA_VERSION.
+        Values are encoded with their exact types (1, 1.0 and True differ),
+        so equal fingerprints mean identical claims; line items whose keys
+        merely come in another order only cost a cache miss.
+        """
+        measurements, _ = self.measurement_schema.normalize(roof_measurements)
+        content = pickle.dumps((as_line_item_dicts(line_items), sorted(measurements.items()),
+                                self.catalog_version(), self._lookup_options(), self.adjustment_plan.version,
+                                COMPILED_REPLACEMENT_RULES.version, RESULT_SCHEMA_VERSION, changed_only, render_text),
+                               protocol=FINGERPRINT_PICKLE_PROTOCOL)
+        return hashlib.sha256(content).hexdigest()
 
     def lookup_unit_price(self, description: str) -> Dict[str, Any]:
         """Look up unit price and other details from Roof Master Macro with strict matching."""
-        # Try exact match first
-        if description in self.roof_master_macro:
-            return self.roof_master_macro[description]
-        
-        # Normalize description for better matching (remove extra dashes and spaces)
-        def normalize_desc(desc):
-            # Remove extra dashes and normalize spaces
-            import re
-            normalized = re.sub(r'\s*-\s*', ' ', desc)  # Replace " - " with " "
-            normalized = re.sub(r'\s+', ' ', normalized)  # Replace multiple spaces with single space
-            return normalized.strip().lower()
-        
-        normalized_input = normalize_desc(description)
-        
-        # Determine if the input is a removal or installation item
-        is_removal_input = description.lower().startswith('remove')
-        
-        # Try normalized partial matches, prioritizing same operation type
-        same_operation_matches = []
-        opposite_operation_matches = []
-        
-        for macro_desc, data in self.roof_master_macro.items():
-            normalized_macro = normalize_desc(macro_desc)
-            
-            # Check if normalized descriptions match or contain each other
-            if (normalized_input in normalized_macro or 
-                normalized_macro in normalized_input or
-                normalized_input == normalized_macro):
-                
-                is_removal_macro = macro_desc.lower().startswith('remove')
-                
-                # Prioritize same operation type (removal matches removal, installation matches installation)
-                if is_removal_input == is_removal_macro:
-                    same_operation_matches.append((macro_desc, data))
-                else:
-                    opposite_operation_matches.append((macro_desc, data))
-        
-        # Return same operation type match first, then opposite operation match
-        if same_operation_matches:
-            return same_operation_matches[0][1]  # Return first same operation match
-        elif opposite_operation_matches:
-            return opposite_operation_matches[0][1]  # Return first opposite operation match
-        
-        # Fallback to original partial matching (case-insensitive)
-        description_lower = description.lower()
-        for macro_desc, data in self.roof_master_macro.items():
-            if description_lower in macro_desc.lower() or macro_desc.lower() in description_lower:
-                return data
+        macro_data = self._current_matcher().lookup(description, self._current_prices(), self.fuzzy_threshold)
+        if macro_data is not None:
+            return macro_data
         
         # Return default values if no match found
         return {
@@ -258,10 +3570,41 @@ class RoofAdjustmentEngine:
             'unit': 'SQ'
         }
 
+
+    def match_description(self, description: str) -> Dict[str, Any]:
+        """How description resolves against the catalog: the catalog description, confidence (0-1) and method."""
+        matcher = self._current_matcher()
+        resolution = matcher.resolve(description, self.fuzzy_threshold)
+        if resolution is None:
+            return {'description': description, 'catalog_description': None, 'confidence': 0.0, 'method': None}
+        ordinal, confidence, method = resolution
+        return {'description': description, 'catalog_description': matcher.description(ordinal),
+                'confidence': confidence, 'method': method}
+
+    def _inexact_match(self, description: str) -> Optional[Dict[str, Any]]:
+        """match_description's catalog_description, confidence and method, or None for an exact match."""
+        match = self.match_description(description)
+        if match['method'] == 'exact':
+            return None
+        return {key: match[key] for key in ('catalog_description', 'confidence', 'method')}
+
     def get_metric(self, roof_metrics: Dict[str, Any], name: str) -> float:
         """Function to get metric value, default to 0 if not present."""
         return roof_metrics.get(name, {"value": 0})["value"]
 
+    def parse_metrics(self, roof_metrics: Dict[str, Any], values: Optional[Dict[str, Any]] = None) -> RoofMetrics:
+        """Parse a claim's roof measurements once, mapping their keys to the report's keys.
+
+        values are the metric values if already evaluated from the normalized
+        measurements. Keys that cannot be mapped are kept and reported.
+        """
+        measurements, unrecognized = self.measurement_schema.normalize(roof_metrics)
+        if unrecognized:
+            self.trace.warning("⚠️  Unrecognized roof measurement keys: {}", ', '.join(map(str, unrecognized)))
+        if values is None:
+            values = self.adjustment_plan.evaluate_values(self.get_metric, measurements)
+        return RoofMetrics(measurements, values, unrecognized)
+
     def update_item_costs(self, item: Dict[str, Any]) -> None:
         """Update RCV and ACV based on current quantity and unit price."""
         quantity = item.get("quantity", 0)
@@ -284,27 +3627,26 @@ class RoofAdjustmentEngine:
 
     def find_item(self, line_items: List[Dict[str, Any]], desc: str) -> Optional[Dict[str, Any]]:
         """Function to find item by description (exact match)."""
+        if isinstance(line_items, IndexedLineItems):
+            return line_items.find(desc)
         for item in line_items:
             if item.get("description", "").strip() == desc.strip():
                 return item
         return None
 
     def add_new_item(self, line_items: List[Dict[str, Any]], desc: str, qty: float, 
-                    unit: str = "SQ", location_room: str = "Roof", category: str = "Roof") -> Dict[str, Any]:
+                    unit: str = "SQ", location_room: str = "Roof", category: str = "Roof",
+                    context: Optional[ClaimContext] = None) -> Dict[str, Any]:
         """Function to add new item with unit prices from Roof Master Macro."""
-        # Safely extract numeric line numbers, filtering out non-numeric values
-        numeric_line_numbers = []
-        for item in line_items:
-            line_num = item.get("line_number", 0)
-            try:
-                # Try to convert to int, skip if it fails (e.g., 'N/A', None, etc.)
-                numeric_line_numbers.append(int(line_num))
-            except (ValueError, TypeError):
-                # Skip non-numeric line numbers
-                continue
-        
-        # If no numeric line numbers found, start from 1
-        max_line = max(numeric_line_numbers) + 1 if numeric_line_numbers else 1
+        if context is None:
+            context = ClaimContext()
+        if isinstance(line_items, IndexedLineItems):
+            max_line = line_items.next_line_number
+        else:
+            # Safely extract numeric line numbers, skipping 'N/A', None, etc.
+            numeric_line_numbers = [n for n in map(_numeric_line_number, line_items) if n is not None]
+            # If no numeric line numbers found, start from 1
+            max_line = max(numeric_line_numbers) + 1 if numeric_line_numbers else 1
         
         # Round quantity to 2 decimal places for practicality
         rounded_qty = round(qty, 2)
@@ -334,15 +3676,16 @@ class RoofAdjustmentEngine:
             "ACV": acv,
             "location_room": location_room,
             "category": category,
-            "page_number": max(int(item.get("page_number", 0)) for item in line_items)
+            "page_number": (line_items.max_page_number if isinstance(line_items, IndexedLineItems)
+                            else max(int(item.get("page_number", 0)) for item in line_items))
         }
         line_items.append(new_item)
-        print(f"    ✅ Added: {desc} - Qty: {rounded_qty} {macro_unit} @ ${unit_price:.2f}/{macro_unit} = ${rcv:.2f}")
-        print(f"       📊 Unit Price: ${unit_price:.2f}, RCV: ${rcv:.2f}, ACV: ${acv:.2f}")
-        self.results.add_addition(desc, qty, f"Added missing line item based on roof measurements")
+        self.trace.debug("    ✅ Added: {} - Qty: {} {} @ ${:.2f}/{} = ${:.2f}", desc, rounded_qty, macro_unit, unit_price, macro_unit, rcv)
+        self.trace.debug("       📊 Unit Price: ${:.2f}, RCV: ${:.2f}, ACV: ${:.2f}", unit_price, rcv, acv)
+        context.results.add_addition(desc, qty, f"Added missing line item based on roof measurements")
         
         # Add audit log entry for new item
-        self.results.add_audit_entry(
+        context.results.add_audit_entry(
             line_number=str(new_item['line_number']),
             description=desc,
             field='quantity',
@@ -350,1019 +3693,139 @@ class RoofAdjustmentEngine:
             after_value=rounded_qty,
             action='added',
             explanation=f"New line item added based on roof measurements and standard roofing practices",
-            rule_applied="Rule: Missing Line Item Addition"
+            rule_applied="Rule: Missing Line Item Addition",
+            catalog_match=self._inexact_match(desc)
         )
         
         return new_item
 
-    def apply_logic(self, line_items: List[Dict[str, Any]], roof_metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Main logic function that applies all the adjustment rules."""
-        
-        print(f"\n🔧 APPLYING BUSINESS RULES...")
-        
-        # Extract metrics
-        total_roof_area = self.get_metric(roof_metrics, "Total Roof Area")
-        total_eaves_length = self.get_metric(roof_metrics, "Total Eaves Length")
-        total_rakes_length = self.get_metric(roof_metrics, "Total Rakes Length")
-        area_pitch_1 = self.get_metric(roof_metrics, "Area for Pitch 1/12 (sq ft)")
-        area_pitch_2 = self.get_metric(roof_metrics, "Area for Pitch 2/12 (sq ft)")
-        area_pitch_3 = self.get_metric(roof_metrics, "Area for Pitch 3/12 (sq ft)")
-        area_pitch_4 = self.get_metric(roof_metrics, "Area for Pitch 4/12 (sq ft)")
-        area_pitch_5 = self.get_metric(roof_metrics, "Area for Pitch 5/12 (sq ft)")
-        area_pitch_6 = self.get_metric(roof_metrics, "Area for Pitch 6/12 (sq ft)")
-        area_pitch_7 = self.get_metric(roof_metrics, "Area for Pitch 7/12 (sq ft)")
-        area_pitch_8 = self.get_metric(roof_metrics, "Area for Pitch 8/12 (sq ft)")
-        area_pitch_9 = self.get_metric(roof_metrics, "Area for Pitch 9/12 (sq ft)")
-        area_pitch_10 = self.get_metric(roof_metrics, "Area for Pitch 10/12 (sq ft)")
-        area_pitch_11 = self.get_metric(roof_metrics, "Area for Pitch 11/12 (sq ft)")
-        area_pitch_12 = self.get_metric(roof_metrics, "Area for Pitch 12/12 (sq ft)")
-        area_pitch_12_plus = self.get_metric(roof_metrics, "Area for Pitch 12/12+ (sq ft)")
-        total_ridges_hips_length = self.get_metric(roof_metrics, "Total Ridges/Hips Length")
-        total_line_lengths_ridges = self.get_metric(roof_metrics, "Total Line Lengths (Ridges)")
-        total_valleys_length = self.get_metric(roof_metrics, "Total Valleys Length")
-        total_step_flashing_length = self.get_metric(roof_metrics, "Total Step Flashing Length")
-        total_flashing_length = self.get_metric(roof_metrics, "Total Flashing Length")
-
-        print(f"\n📊 EXTRACTED METRICS:")
-        print(f"  Total Roof Area: {total_roof_area}")
-        print(f"  Total Eaves Length: {total_eaves_length}")
-        print(f"  Total Rakes Length: {total_rakes_length}")
-        print(f"  Total Ridges/Hips Length: {total_ridges_hips_length}")
-        print(f"  Total Valleys Length: {total_valleys_length}")
-        print(f"  Total Step Flashing Length: {total_step_flashing_length}")
-        print(f"  Total Flashing Length: {total_flashing_length}")
-        print(f"\n  PITCH AREAS (ALL SLOPES):")
-        print(f"  Pitch 1/12: {area_pitch_1}")
-        print(f"  Pitch 2/12: {area_pitch_2}")
-        print(f"  Pitch 3/12: {area_pitch_3}")
-        print(f"  Pitch 4/12: {area_pitch_4}")
-        print(f"  Pitch 5/12: {area_pitch_5}")
-        print(f"  Pitch 6/12: {area_pitch_6}")
-        print(f"  Pitch 7/12: {area_pitch_7}")
-        print(f"  Pitch 8/12: {area_pitch_8}")
-        print(f"  Pitch 9/12: {area_pitch_9}")
-        print(f"  Pitch 10/12: {area_pitch_10}")
-        print(f"  Pitch 11/12: {area_pitch_11}")
-        print(f"  Pitch 12/12: {area_pitch_12}")
-        print(f"  Pitch 12/12+: {area_pitch_12_plus}")
-        
-        # Calculate totals
-        steep_7_9_total = area_pitch_7 + area_pitch_8 + area_pitch_9
-        steep_10_12_total = area_pitch_10 + area_pitch_11 + area_pitch_12
-        print(f"\n  📈 STEEP AREA TOTALS:")
-        print(f"  7/12-9/12: {steep_7_9_total} sq ft → {steep_7_9_total / 100:.2f} SQ")
-        print(f"  10/12-12/12: {steep_10_12_total} sq ft → {steep_10_12_total / 100:.2f} SQ")
-        print(f"  12/12+: {area_pitch_12_plus} sq ft → {area_pitch_12_plus / 100:.2f} SQ")
-
-        # Calculate common values
-        total_squares = total_roof_area / 100.0
-        starter_qty = (total_eaves_length + total_rakes_length) / 100.0
-        steep_7_9_qty = (area_pitch_7 + area_pitch_8 + area_pitch_9) / 100.0
-        steep_10_12_qty = (area_pitch_10 + area_pitch_11 + area_pitch_12) / 100.0
-        steep_12_plus_qty = area_pitch_12_plus / 100.0
-        ridges_hips_qty = total_ridges_hips_length / 100.0
-        ridges_qty = total_line_lengths_ridges / 100.0
-        valleys_qty = total_valleys_length / 100.0
-        step_flashing_qty = total_step_flashing_length / 100.0
-        flashing_qty = total_flashing_length / 100.0
-
-        print(f"\n🧮 CALCULATED VALUES:")
-        print(f"  Total Squares (Total Roof Area / 100): {total_squares}")
-        print(f"  Starter Quantity ((Eaves + Rakes) / 100): {starter_qty}")
-        print(f"  Steep 7-9 Quantity: {steep_7_9_qty}")
-        print(f"  Steep 10-12 Quantity: {steep_10_12_qty}")
-        print(f"  Steep 12+ Quantity: {steep_12_plus_qty}")
-        print(f"  Ridges/Hips Quantity: {ridges_hips_qty}")
-        print(f"  Ridges Quantity: {ridges_qty}")
-        print(f"  Valleys Quantity: {valleys_qty}")
-        print(f"  Step Flashing Quantity: {step_flashing_qty}")
-        print(f"  Flashing Quantity: {flashing_qty}")
-
-        # Rule 1-4: Adjust removal quantities to max with total_squares
-        print(f"\n📝 RULE 1-4: Shingle Removal Quantity Adjustments")
-        
-        if total_roof_area == 0 or total_squares == 0:
-            print(f"  ⚠️  WARNING: Total Roof Area is 0 - skipping shingle quantity adjustments!")
-            print(f"  This usually means roof measurements are missing or not loaded correctly.")
-            self.results.add_warning("Shingle Quantity Adjustments", 
-                                   "Total Roof Area is 0 - cannot adjust shingle quantities. Please verify roof measurements are loaded correctly.")
-        else:
-            # Use exact descriptions from Roof Master Macro CSV
-            removal_descriptions = [
-                "Remove Laminated - comp. shingle rfg. - w/out felt",
-                "Remove 3 tab - 25 yr. - comp. shingle roofing - w/out felt",
-                "Remove 3 tab - 25 yr. - composition shingle roofing - incl. felt",
-                "Remove Laminated - comp. shingle rfg. - w/ felt"
-            ]
-            
-            for desc in removal_descriptions:
-                item = self.find_item(line_items, desc)
-                if item:
-                    qty = float(item["quantity"])
-                    print(f"  Found: {desc} - Current Qty: {qty}, Target: {total_squares}")
-                    if not math.isclose(qty, total_squares):
-                        old_qty = qty
-                        new_qty = max(qty, total_squares)
-                        # Only proceed if the quantity actually changed
-                        if not math.isclose(old_qty, new_qty):
-                            item["quantity"] = new_qty
-                            print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                            self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                                      f"Quantity should equal Total Roof Area / 100 ({total_squares:.2f})")
-                            # Add narrative to the line item for frontend highlighting
-                            item["narrative"] = f"Field Changed: quantity |Explanation: Shingle removal quantity adjusted to match roof area calculation (Total Roof Area / 100 = {total_squares:.2f} SQ)"
-                            # Add audit log entry
-                            self.results.add_audit_entry_for_item(
-                                item, 'quantity', old_qty, item["quantity"],
-                                f"Shingle removal quantity adjusted to match roof area calculation (Total Roof Area / 100 = {total_squares:.2f} SQ)",
-                                "Rule 1-4: Shingle Removal Quantity Adjustments"
-                            )
-                        else:
-                            print(f"    ⏭️  No change needed (quantity already sufficient)")
-                    else:
-                        print(f"    ⏭️  No change needed (already matches)")
-                else:
-                    print(f"  ❌ Not found: {desc}")
+    def _apply_replacement(self, item: Dict[str, Any], macro_data: Mapping[str, Any]) -> None:
+        """Give a replaced item its Roof Master Macro price and unit, then recalculate its costs."""
+        item["unit_price"] = macro_data['unit_price']
+        item["unit"] = macro_data.get('unit', item.get("unit", "EA"))
+        self.update_item_costs(item)
 
-        # Rule 5-8: Adjust installation quantities to max with total_squares
-        print(f"\n📝 RULE 5-8: Shingle Installation Quantity Adjustments")
-        
-        if total_roof_area == 0 or total_squares == 0:
-            print(f"  ⚠️  WARNING: Total Roof Area is 0 - skipping shingle quantity adjustments!")
-        else:
-            # Use exact descriptions from Roof Master Macro CSV
-            installation_descriptions = [
-                "Laminated - comp. shingle rfg. - w/out felt",
-                "3 tab - 25 yr. - comp. shingle roofing - w/out felt",
-                "3 tab - 25 yr. - composition shingle roofing - incl. felt",
-                "Laminated - comp. shingle rfg. - w/ felt"
-            ]
-            
-            for desc in installation_descriptions:
-                item = self.find_item(line_items, desc)
-                if item:
-                    qty = float(item["quantity"])
-                    print(f"  Found: {desc} - Current Qty: {qty}, Target: {total_squares}")
-                    if not math.isclose(qty, total_squares):
-                        old_qty = qty
-                        item["quantity"] = max(qty, total_squares)
-                        print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                        self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                                  f"Quantity should equal Total Roof Area / 100 ({total_squares:.2f})")
-                        # Add narrative to the line item for frontend highlighting
-                        item["narrative"] = f"Field Changed: quantity |Explanation: Shingle installation quantity adjusted to match roof area calculation (Total Roof Area / 100 = {total_squares:.2f} SQ)"
-                        # Add audit log entry
-                        self.results.add_audit_entry_for_item(
-                            item, 'quantity', old_qty, item["quantity"],
-                            f"Shingle installation quantity adjusted to match roof area calculation (Total Roof Area / 100 = {total_squares:.2f} SQ)",
-                            "Rule 5-8: Shingle Installation Quantity Adjustments"
-                        )
-                    else:
-                        print(f"    ⏭️  No change needed (already matches)")
-                else:
-                    print(f"  ❌ Not found: {desc}")
+    def _check_unit_price(self, item: Dict[str, Any], results: AdjustmentResult) -> bool:
+        """Final price comparison for one item: raise its unit price to the Roof Master Macro price if higher."""
+        current_price = item.get("unit_price", 0)
+        description = item.get("description", "").strip()
 
-        # Rounding rules for laminated (0.25) - Use exact descriptions
-        for desc in [
-            "Remove Laminated - comp. shingle rfg. - w/out felt",
-            "Laminated - comp. shingle rfg. - w/out felt",
-            "Remove Laminated - comp. shingle rfg. - w/ felt",
-            "Laminated - comp. shingle rfg. - w/ felt"
-        ]:
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                if not self.is_multiple_of(qty % 1, 0.25):  # Check fractional part
-                    old_qty = qty
-                    item["quantity"] = math.ceil(qty * 4) / 4
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              "Laminated shingles should be rounded up to nearest 0.25")
-                    # Add narrative to the line item for frontend highlighting
-                    item["narrative"] = f"Field Changed: quantity |Explanation: Laminated shingle quantity rounded up to nearest 0.25 (standard roofing practice)"
-                    # Add audit log entry
-                    self.results.add_audit_entry_for_item(
-                        item, 'quantity', old_qty, item["quantity"],
-                        "Laminated shingle quantity rounded up to nearest 0.25 (standard roofing practice)",
-                        "Rule: Laminated Shingle Rounding"
-                    )
-
-        # Rounding rules for 3 tab (0.33) - Use exact descriptions
-        for desc in [
-            "Remove 3 tab - 25 yr. - comp. shingle roofing - w/out felt",
-            "3 tab - 25 yr. - comp. shingle roofing - w/out felt",
-            "Remove 3 tab - 25 yr. - composition shingle roofing - incl. felt",
-            "3 tab - 25 yr. - composition shingle roofing - incl. felt"
-        ]:
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                frac = qty - math.floor(qty)
-                if not (math.isclose(frac, 0) or math.isclose(frac, 0.33, abs_tol=0.01) or math.isclose(frac, 0.67, abs_tol=0.01)):
-                    old_qty = qty
-                    item["quantity"] = math.ceil(qty * 3) / 3
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              "3-tab shingles should be rounded up to nearest 0.33")
-                    # Add narrative to the line item for frontend highlighting
-                    item["narrative"] = f"Field Changed: quantity |Explanation: 3-tab shingle quantity rounded up to nearest 0.33 (standard roofing practice)"
-                    # Add audit log entry
-                    self.results.add_audit_entry_for_item(
-                        item, 'quantity', old_qty, item["quantity"],
-                        "3-tab shingle quantity rounded up to nearest 0.33 (standard roofing practice)",
-                        "Rule: 3-Tab Shingle Rounding"
-                    )
-
-        # Starter rules for removals - Use exact descriptions
-        for remove_desc in [
-            "Remove Laminated - comp. shingle rfg. - w/out felt",
-            "Remove 3 tab - 25 yr. - comp. shingle roofing - w/out felt"
-        ]:
-            if self.find_item(line_items, remove_desc):
-                for starter_desc in [
-                    "Asphalt starter - universal starter course",
-                    "Asphalt starter - peel and stick",
-                    "Asphalt starter - laminated double layer starter"
-                ]:
-                    item = self.find_item(line_items, starter_desc)
-                    if item:
-                        qty = float(item["quantity"])
-                        if qty < starter_qty:
-                            old_qty = qty
-                            item["quantity"] = starter_qty
-                            self.results.add_adjustment(starter_desc, old_qty, item["quantity"], 
-                                                      f"Starter strip quantity should equal (Total Eaves + Total Rakes) / 100 ({starter_qty:.2f})")
-                            # Add narrative to the line item for frontend highlighting
-                            item["narrative"] = f"Field Changed: quantity |Explanation: Starter strip quantity adjusted to match roof perimeter calculation ((Eaves + Rakes) / 100 = {starter_qty:.2f} SQ)"
-                            # Add audit log entry
-                            self.results.add_audit_entry_for_item(
-                                item, 'quantity', old_qty, item["quantity"],
-                                f"Starter strip quantity adjusted to match roof perimeter calculation ((Eaves + Rakes) / 100 = {starter_qty:.2f} SQ)",
-                                "Rule: Starter Strip Quantity Adjustments"
-                            )
-
-        # Steep rules for 7-9
-        print(f"\n🏔️ RULE: Steep Roof 7/12-9/12 Charges")
-        print(f"  Steep area total: {area_pitch_7 + area_pitch_8 + area_pitch_9} sq ft")
-        print(f"  Calculated quantity: {steep_7_9_qty:.4f}")
-        print(f"  Rounded quantity: {round(steep_7_9_qty, 2):.2f}")
-        
-        if area_pitch_7 != 0 or area_pitch_8 != 0 or area_pitch_9 != 0:
-            print(f"  ✅ Steep roof areas detected - applying rules")
-            rounded_qty = round(steep_7_9_qty, 2)
-            for desc, is_remove in [("Remove Additional charge for steep roof - 7/12 to 9/12 slope", True), ("Additional charge for steep roof - 7/12 to 9/12 slope", False)]:
-                item = self.find_item(line_items, desc)
-                if item:
-                    qty = float(item["quantity"])
-                    print(f"    Found: {desc} - Current: {qty}, Target: {rounded_qty}")
-                    if qty < rounded_qty:
-                        old_qty = qty
-                        item["quantity"] = rounded_qty
-                        print(f"      ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                        self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                                  f"Steep roof charge should equal (Area 7/12 + 8/12 + 9/12) / 100 ({rounded_qty:.2f})")
-                        # Add narrative to the line item for frontend highlighting
-                        item["narrative"] = f"Field Changed: quantity |Explanation: Steep roof charge adjusted to match steep roof area calculation (7/12-9/12 slopes = {rounded_qty:.2f} SQ)"
-                        # Add audit log entry
-                        self.results.add_audit_entry_for_item(
-                            item, 'quantity', old_qty, item["quantity"],
-                            f"Steep roof charge adjusted to match steep roof area calculation (7/12-9/12 slopes = {rounded_qty:.2f} SQ)",
-                            "Rule: Steep Roof 7/12-9/12 Charges"
-                        )
-                    else:
-                        print(f"      ⏭️  No change needed (already sufficient)")
-                else:
-                    print(f"    ❌ Not found: {desc} - ADDING NEW ITEM")
-                    print(f"      Adding with quantity: {rounded_qty:.2f} SQ")
-                    self.add_new_item(line_items, desc, rounded_qty)
-        else:
-            print(f"  ⏭️  No steep roof areas (7/12-9/12) - skipping rules")
-
-        # Steep rules for 10-12
-        if area_pitch_10 != 0 or area_pitch_11 != 0 or area_pitch_12 != 0:
-            for desc, is_remove in [("Remove Additional charge for steep roof - 10/12 - 12/12 slope", True), ("Additional charge for steep roof - 10/12 - 12/12 slope", False)]:
-                item = self.find_item(line_items, desc)
-                if item:
-                    qty = float(item["quantity"])
-                    if qty < steep_10_12_qty:
-                        old_qty = qty
-                        item["quantity"] = steep_10_12_qty
-                        self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                                  f"Steep roof charge should equal (Area 10/12 + 11/12 + 12/12) / 100 ({steep_10_12_qty:.2f})")
-                else:
-                    self.add_new_item(line_items, desc, steep_10_12_qty)
-
-        # Steep rules for 12+
-        if area_pitch_12_plus != 0:
-            for desc in ["Remove Additional charge for steep roof greater than 12/12 slope", "Additional charge for steep roof greater than 12/12 slope"]:
-                item = self.find_item(line_items, desc)
-                if item:
-                    qty = float(item["quantity"])
-                    if qty < steep_12_plus_qty:
-                        old_qty = qty
-                        item["quantity"] = max(qty, steep_12_plus_qty)
-                        self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                                  f"Steep roof charge should equal Area 12/12+ / 100 ({steep_12_plus_qty:.2f})")
-                else:
-                    self.add_new_item(line_items, desc, steep_12_plus_qty)
+        if not description:
+            return False
 
-        # Starter add if none present
-        starters = [
-            "Asphalt starter - universal starter course",
-            "Asphalt starter - peel and stick",
-            "Asphalt starter - laminated double layer starter"
-        ]
-        has_starter = any(self.find_item(line_items, s) for s in starters)
-        if not has_starter:
-            self.add_new_item(line_items, "Asphalt starter - universal starter course", starter_qty)
-        else:
-            for s in starters:
-                item = self.find_item(line_items, s)
-                if item and float(item["quantity"]) < starter_qty:
-                    old_qty = float(item["quantity"])
-                    item["quantity"] = starter_qty
-                    self.results.add_adjustment(s, old_qty, item["quantity"], 
-                                              f"Starter strip quantity should equal (Total Eaves + Total Rakes) / 100 ({starter_qty:.2f})")
-
-        # Ridge vent add if no hip/ridge - Use exact descriptions
-        hip_ridges = [
-            "Hip / Ridge cap - High profile - composition shingles",
-            "Hip / Ridge cap - Standard profile - composition shingles"
-        ]
-        has_hip_ridge = any(self.find_item(line_items, h) for h in hip_ridges)
-        if not has_hip_ridge:
-            item = self.find_item(line_items, "Continuous ridge vent - Detach & reset")
-            if item:
-                qty = float(item["quantity"])
-                if qty < ridges_hips_qty:
-                    old_qty = qty
-                    item["quantity"] = max(qty, ridges_hips_qty)
-                    self.results.add_adjustment("Continuous ridge vent - Detach & reset", old_qty, item["quantity"], 
-                                              f"Ridge vent quantity should equal Total Ridges/Hips Length / 100 ({ridges_hips_qty:.2f})")
+        # Look up unit price in Roof Master Macro
+        macro_data = self.lookup_unit_price(description)
+        macro_price = macro_data.get('unit_price', 0)
+
+        if macro_price > 0:
+            # Use the maximum of current price and macro price
+            new_price = max(current_price, macro_price)
+
+            if new_price > current_price:
+                old_price = current_price
+                item["unit_price"] = new_price
+
+                # Recalculate RCV since unit price changed
+                quantity = float(item.get("quantity", 0))
+                item["RCV"] = quantity * new_price
+
+                self.trace.debug("  ✅ PRICE INCREASED: '{}...'", description[:50])
+                self.trace.debug("     Unit Price: ${:.2f} → ${:.2f}", old_price, new_price)
+                self.trace.debug("     RCV: ${:.2f} → ${:.2f}", quantity * old_price, item['RCV'])
+
+                # Add audit log entry for unit price adjustment
+                results.add_audit_entry_for_item(
+                    item, 'unit_price', old_price, new_price,
+                    RuleText('unit_price', UNIT_PRICE_EXPLANATION, {'new_price': new_price}),
+                    "Final Unit Price Comparison",
+                    catalog_match=self._inexact_match(description)
+                )
+                return True
+            elif new_price == current_price:
+                self.trace.debug("  ⏭️  PRICE OK: '{}...' - Already at max price (${:.2f})", description[:50], current_price)
             else:
-                self.add_new_item(line_items, "Continuous ridge vent - Detach & reset", ridges_hips_qty, unit="LF")
+                self.trace.debug("  ⏭️  PRICE OK: '{}...' - Current price higher than macro (${:.2f} > ${:.2f})", description[:50], current_price, macro_price)
         else:
-            for h in hip_ridges:
-                item = self.find_item(line_items, h)
-                if item:
-                    qty = float(item["quantity"])
-                    if qty < ridges_hips_qty:
-                        old_qty = qty
-                        item["quantity"] = max(qty, ridges_hips_qty)
-                        self.results.add_adjustment(h, old_qty, item["quantity"], 
-                                                  f"Hip/Ridge cap quantity should equal Total Ridges/Hips Length / 100 ({ridges_hips_qty:.2f})")
-
-        # Max for steep if present
-        for desc, calc_qty in [
-            ("Remove Additional charge for steep roof - 7/12 to 9/12 slope", steep_7_9_qty),
-            ("Additional charge for steep roof - 7/12 to 9/12 slope", steep_7_9_qty),
-            ("Remove Additional charge for steep roof - 10/12 - 12/12 slope", steep_10_12_qty),
-            ("Additional charge for steep roof - 10/12 - 12/12 slope", steep_10_12_qty),
-            ("Remove Additional charge for steep roof greater than 12/12 slope", steep_12_plus_qty),
-            ("Additional charge for steep roof greater than 12/12 slope", steep_12_plus_qty)
-        ]:
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                if qty < calc_qty:
-                    old_qty = qty
-                    item["quantity"] = max(qty, calc_qty)
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Steep roof charge should equal calculated area / 100 ({calc_qty:.2f})")
-
-        # Continuous ridge vent - Use exact descriptions
-        for desc, calc_qty in [
-            ("Continuous ridge vent - aluminum", ridges_qty),
-            ("Continuous ridge vent - shingle-over style", ridges_qty)
-        ]:
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                if qty < calc_qty:
-                    old_qty = qty
-                    item["quantity"] = max(qty, calc_qty)
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Ridge vent quantity should equal Total Line Lengths (Ridges) / 100 ({calc_qty:.2f})")
-
-        # Hip/Ridge cap - Use exact descriptions
-        for desc, calc_qty in [
-            ("Hip / Ridge cap - High profile - composition shingles", ridges_hips_qty),
-            ("Hip / Ridge cap - cut from 3 tab - composition shingles", ridges_hips_qty),
-            ("Hip / Ridge cap - Standard profile - composition shingles", ridges_hips_qty)
-        ]:
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                if qty < calc_qty:
-                    old_qty = qty
-                    item["quantity"] = max(qty, calc_qty)
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Hip/Ridge cap quantity should equal Total Ridges/Hips Length / 100 ({calc_qty:.2f})")
-
-        # Drip edge
-        print(f"\n📏 RULE: Drip Edge Adjustments")
-        drip_edge_length = total_eaves_length + total_rakes_length  # Full length in LF, not divided by 100
-        print(f"  Calculated drip edge length: {drip_edge_length} LF (Eaves: {total_eaves_length} + Rakes: {total_rakes_length})")
-        
-        # Try multiple description variations
-        drip_edge_descriptions = [
-            "Drip edge/gutter apron",
-            "Drip edge",
-            "Drip Edge"
-        ]
+            self.trace.debug("  ❌ NO MATCH: '{}...' - Not found in Roof Master Macro", description[:50])
+        return False
+
+    def apply_logic(self, line_items: List[Dict[str, Any]], roof_metrics: Dict[str, Any],
+                    context: Optional[ClaimContext] = None,
+                    values: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Main logic function that applies all the adjustment rules.
+
+        Adjustments, additions, warnings and audit entries are recorded on
+        context (a fresh ClaimContext if none is given), along with the
+        parsed measurements (context.metrics). roof_metrics may be the raw
+        measurements or an already parsed RoofMetrics; values are the
+        claim's metric and derived quantity values if already evaluated
+        (see AdjustmentPlan.evaluate_values_batch).
+        """
+        if context is None:
+            context = ClaimContext()
+        results = context.results
         
-        found_drip_edge = False
-        for desc in drip_edge_descriptions:
-            item = self.find_item(line_items, desc)
-            if item:
-                found_drip_edge = True
-                qty = float(item["quantity"])
-                print(f"  Found: {desc} - Current Qty: {qty}, Target: {drip_edge_length}")
-                if not math.isclose(qty, drip_edge_length):
-                    old_qty = qty
-                    item["quantity"] = max(qty, drip_edge_length)
-                    print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Drip edge quantity should equal (Total Eaves + Total Rakes) = {drip_edge_length:.2f} LF")
-                    # Add audit log entry
-                    self.results.add_audit_entry_for_item(
-                        item, 'quantity', old_qty, item["quantity"],
-                        f"Drip edge quantity adjusted to match roof perimeter calculation (Eaves + Rakes = {drip_edge_length:.2f} LF)",
-                        "Rule: Drip Edge Adjustments"
-                    )
-                else:
-                    print(f"    ⏭️  No change needed (already matches)")
-                break
+        # Work on an indexed view so every description lookup is a dict lookup
+        source_line_items = line_items
+        line_items = IndexedLineItems.wrap(line_items)
         
-        if not found_drip_edge:
-            print(f"  ❌ Not found: Drip edge (tried all variations)")
-
-        # Step flashing
-        print(f"\n📏 RULE: Step Flashing Adjustments")
-        step_flashing_length = total_step_flashing_length  # Full length in LF
-        print(f"  Calculated step flashing length: {step_flashing_length} LF")
-        
-        desc = "Step flashing"
-        item = self.find_item(line_items, desc)
-        if item:
-            old_qty = float(item["quantity"])
-            print(f"  Found: {desc} - Current Qty: {old_qty}, Target: {step_flashing_length}")
-            if not math.isclose(old_qty, step_flashing_length):
-                item["quantity"] = step_flashing_length
-                print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                          f"Step flashing quantity should equal Total Step Flashing Length = {step_flashing_length:.2f} LF")
-            else:
-                print(f"    ⏭️  No change needed (already matches)")
-        else:
-            print(f"  ❌ Not found: {desc}")
-
-        # Aluminum sidewall
-        print(f"\n📏 RULE: Aluminum Flashing Adjustments")
-        aluminum_flashing_length = total_flashing_length  # Full length in LF
-        print(f"  Calculated aluminum flashing length: {aluminum_flashing_length} LF")
-        
-        desc = "Aluminum sidewall/endwall flashing - mill finish"
-        item = self.find_item(line_items, desc)
-        if item:
-            qty = float(item["quantity"])
-            print(f"  Found: {desc} - Current Qty: {qty}, Target: {aluminum_flashing_length}")
-            if qty < aluminum_flashing_length:
-                old_qty = qty
-                item["quantity"] = max(qty, aluminum_flashing_length)
-                print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                          f"Aluminum flashing quantity should equal Total Flashing Length = {aluminum_flashing_length:.2f} LF")
-            else:
-                print(f"    ⏭️  No change needed (already sufficient)")
-        else:
-            print(f"  ❌ Not found: {desc}")
-
-        # Continuous ridge vent shingle-over style additional - Use exact descriptions
-        if self.find_item(line_items, "Continuous ridge vent - shingle-over style"):
-            for desc, calc_qty in [
-                ("Hip / Ridge cap - High profile - composition shingles", ridges_hips_qty),
-                ("Hip / Ridge cap - cut from 3 tab - composition shingles", ridges_hips_qty),
-                ("Hip / Ridge cap - Standard profile - composition shingles", ridges_hips_qty)
-            ]:
-                item = self.find_item(line_items, desc)
-                if item:
-                    qty = float(item["quantity"])
-                    if qty < calc_qty:
-                        old_qty = qty
-                        item["quantity"] = max(qty, calc_qty)
-                        self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                                  f"Hip/Ridge cap quantity should equal Total Ridges/Hips Length / 100 ({calc_qty:.2f})")
-
-        # Continuous ridge vent aluminum additional - Use exact descriptions
-        if self.find_item(line_items, "Continuous ridge vent - aluminum"):
-            for desc, calc_qty in [
-                ("Hip / Ridge cap - High profile - composition shingles", ridges_hips_qty),
-                ("Hip / Ridge cap - cut from 3 tab - composition shingles", ridges_hips_qty),
-                ("Hip / Ridge cap - Standard profile - composition shingles", ridges_hips_qty)
-            ]:
-                item = self.find_item(line_items, desc)
-                if item:
-                    old_qty = float(item["quantity"])
-                    item["quantity"] = ridges_hips_qty  # Set directly as per some rules
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Hip/Ridge cap quantity should equal Total Ridges/Hips Length / 100 ({ridges_hips_qty:.2f})")
-
-        # Specific combinations - Use exact descriptions
-        if self.find_item(line_items, "Continuous ridge vent - shingle-over style") and self.find_item(line_items, "3 tab - 25 yr. - composition shingle roofing - incl. felt"):
-            desc = "Hip / Ridge cap - cut from 3 tab - composition shingles"
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                if qty < ridges_qty:
-                    old_qty = qty
-                    item["quantity"] = max(qty, ridges_qty)
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Hip/Ridge cap quantity should equal Total Line Lengths (Ridges) / 100 ({ridges_qty:.2f})")
-            else:
-                self.add_new_item(line_items, desc, ridges_qty)
-
-        if self.find_item(line_items, "Continuous ridge vent - shingle-over style") and self.find_item(line_items, "Remove Laminated - comp. shingle rfg. - w/out felt"):
-            desc = "Hip / Ridge cap - Standard profile - composition shingles"
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                if qty < ridges_qty:
-                    old_qty = qty
-                    item["quantity"] = max(qty, ridges_qty)
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Hip/Ridge cap quantity should equal Total Line Lengths (Ridges) / 100 ({ridges_qty:.2f})")
-            else:
-                self.add_new_item(line_items, desc, ridges_qty)
-
-        if self.find_item(line_items, "Continuous ridge vent - shingle-over style") and self.find_item(line_items, "Remove Laminated - comp. shingle rfg. - w/ felt"):
-            desc = "Hip / Ridge cap - Standard profile - composition shingles"
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                if qty < ridges_qty:
-                    old_qty = qty
-                    item["quantity"] = max(qty, ridges_qty)
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Hip/Ridge cap quantity should equal Total Line Lengths (Ridges) / 100 ({ridges_qty:.2f})")
-            else:
-                self.add_new_item(line_items, desc, ridges_qty)
-
-        # Valley metal
-        print(f"\n📏 RULE: Valley Metal Adjustments")
-        valley_length = total_valleys_length  # Full length in LF
-        print(f"  Calculated valley length: {valley_length} LF")
-        
-        for desc in ["Valley metal", "Valley metal - (W) profile"]:
-            item = self.find_item(line_items, desc)
-            if item:
-                qty = float(item["quantity"])
-                print(f"  Found: {desc} - Current Qty: {qty}, Target: {valley_length}")
-                if qty < valley_length:
-                    old_qty = qty
-                    item["quantity"] = max(qty, valley_length)
-                    print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Valley metal quantity should equal Total Valleys Length = {valley_length:.2f} LF")
-                else:
-                    print(f"    ⏭️  No change needed (already sufficient)")
-                break
-        else:
-            print(f"  ❌ Not found: Valley metal (tried all variations)")
-
-        # Roofing felt logic based on pitch areas
-        print(f"\n📄 RULE: Roofing Felt Adjustments Based on Pitch")
-        
-        # Calculate pitch area totals for different slope ranges
-        low_slope_area = area_pitch_1 + area_pitch_2 + area_pitch_3 + area_pitch_4
-        medium_slope_area = area_pitch_5 + area_pitch_6 + area_pitch_7 + area_pitch_8
-        steep_slope_area = area_pitch_9 + area_pitch_10 + area_pitch_11 + area_pitch_12 + area_pitch_12_plus
-        
-        print(f"  Low Slope (1/12-4/12): {low_slope_area} sq ft → {low_slope_area / 100:.2f} SQ")
-        print(f"  Medium Slope (5/12-8/12): {medium_slope_area} sq ft → {medium_slope_area / 100:.2f} SQ")
-        print(f"  Steep Slope (9/12+): {steep_slope_area} sq ft → {steep_slope_area / 100:.2f} SQ")
-        
-        # Rule 1: Low slope roofing felt (1/12 to 4/12)
-        if low_slope_area != 0:
-            desc = "Roofing felt - 15 lb. double coverage/low slope"
-            low_slope_qty = low_slope_area / 100.0
-            item = self.find_item(line_items, desc)
-            if item:
-                old_qty = float(item["quantity"])
-                print(f"  Found: {desc} - Current Qty: {old_qty}, Target: {low_slope_qty:.2f}")
-                if old_qty < low_slope_qty:
-                    item["quantity"] = max(old_qty, low_slope_qty)
-                    self.update_item_costs(item)
-                    print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Quantity should equal (Area 1/12 + 2/12 + 3/12 + 4/12) / 100 ({low_slope_qty:.2f})")
-                else:
-                    print(f"    ⏭️  No change needed (already sufficient)")
-            else:
-                print(f"  ❌ Not found: {desc} - ADDING NEW ITEM")
-                self.add_new_item(line_items, desc, low_slope_qty)
-        else:
-            print(f"  ⏭️  No low slope areas (1/12-4/12) - skipping low slope felt")
-        
-        # Rule 2: Medium slope roofing felt (5/12 to 8/12)
-        if medium_slope_area != 0:
-            desc = "Roofing felt - 15 lb."
-            medium_slope_qty = medium_slope_area / 100.0
-            item = self.find_item(line_items, desc)
-            if item:
-                old_qty = float(item["quantity"])
-                print(f"  Found: {desc} - Current Qty: {old_qty}, Target: {medium_slope_qty:.2f}")
-                if old_qty < medium_slope_qty:
-                    item["quantity"] = max(old_qty, medium_slope_qty)
-                    self.update_item_costs(item)
-                    print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Quantity should equal (Area 5/12 + 6/12 + 7/12 + 8/12) / 100 ({medium_slope_qty:.2f})")
-                else:
-                    print(f"    ⏭️  No change needed (already sufficient)")
-            else:
-                print(f"  ❌ Not found: {desc} - ADDING NEW ITEM")
-                self.add_new_item(line_items, desc, medium_slope_qty)
-        else:
-            print(f"  ⏭️  No medium slope areas (5/12-8/12) - skipping medium slope felt")
-        
-        # Rule 3: Steep slope roofing felt (9/12 and above)
-        if steep_slope_area != 0:
-            desc = "Roofing felt - 30 lb."
-            steep_slope_qty = steep_slope_area / 100.0
-            item = self.find_item(line_items, desc)
-            if item:
-                old_qty = float(item["quantity"])
-                print(f"  Found: {desc} - Current Qty: {old_qty}, Target: {steep_slope_qty:.2f}")
-                if old_qty < steep_slope_qty:
-                    item["quantity"] = max(old_qty, steep_slope_qty)
-                    self.update_item_costs(item)
-                    print(f"    ✅ ADJUSTED: {old_qty} → {item['quantity']}")
-                    self.results.add_adjustment(desc, old_qty, item["quantity"], 
-                                              f"Quantity should equal (Area 9/12 + 10/12 + 11/12 + 12/12 + 12/12+) / 100 ({steep_slope_qty:.2f})")
-                else:
-                    print(f"    ⏭️  No change needed (already sufficient)")
-            else:
-                print(f"  ❌ Not found: {desc} - ADDING NEW ITEM")
-                self.add_new_item(line_items, desc, steep_slope_qty)
-        else:
-            print(f"  ⏭️  No steep slope areas (9/12+) - skipping steep slope felt")
-
-        # Chimney saddle/cricket logic
-        print(f"\n🏠 RULE: Chimney Saddle/Cricket Logic")
+        self.trace.debug("\n🔧 APPLYING BUSINESS RULES...")
         
-        # Check for chimney flashing average (32" x 36")
-        chimney_avg = self.find_item(line_items, "Chimney flashing average (32\" x 36\")")
-        if chimney_avg:
-            print(f"  ✅ Found: Chimney flashing average (32\" x 36\")")
-            
-            # Check if saddle up to 25 SF is missing
-            saddle_25 = self.find_item(line_items, "Saddle or cricket up to 25 SF")
-            if not saddle_25:
-                print(f"    ❌ Missing: Saddle or cricket up to 25 SF - ADDING")
-                self.add_new_item(line_items, "Saddle or cricket up to 25 SF", 1.0, unit="EA", 
-                                location_room="Roof", category="Roof")
-            else:
-                print(f"    ✅ Already present: Saddle or cricket up to 25 SF")
-        else:
-            print(f"  ❌ Not found: Chimney flashing average (32\" x 36\")")
+        # Metric and derived quantity values the rules read
+        plan = self.adjustment_plan
+        metrics = (roof_metrics if isinstance(roof_metrics, RoofMetrics)
+                   else self.parse_metrics(roof_metrics, values))
+        context.metrics = metrics
+        values = metrics.values
         
-        # Check for chimney flashing large (32" x 60")
-        chimney_large = self.find_item(line_items, "Chimney flashing- large (32\" x 60\")")
-        if chimney_large:
-            print(f"  ✅ Found: Chimney flashing- large (32\" x 60\")")
-            
-            # Check if saddle 26 to 50 SF is missing
-            saddle_50 = self.find_item(line_items, "Saddle or cricket 26 to 50 SF")
-            if not saddle_50:
-                print(f"    ❌ Missing: Saddle or cricket 26 to 50 SF - ADDING")
-                self.add_new_item(line_items, "Saddle or cricket 26 to 50 SF", 1.0, unit="EA", 
-                                location_room="Roof", category="Roof")
-            else:
-                print(f"    ✅ Already present: Saddle or cricket 26 to 50 SF")
-        else:
-            print(f"  ❌ Not found: Chimney flashing- large (32\" x 60\")")
+        if self.trace.debug_enabled:
+            self.trace.debug("\n📊 EXTRACTED METRICS:")
+            for name, key in plan.metrics:
+                self.trace.debug("  {}: {}", key, values[name])
+            self.trace.debug("\n🧮 CALCULATED VALUES:")
+            for name, _, _ in plan.derived:
+                self.trace.debug("  {}: {}", name, values[name])
+        
+        # Quantity adjustment rules (ADJUSTMENT_RULES, compiled into the plan)
+        plan.execute(self, line_items, values, context)
+        performance = context.performance
+        if performance is not None:
+            started = time.monotonic_ns()
 
         # LINE ITEM REPLACEMENT RULES
         # Replace carrier estimate items with proper Roof Master Macro items
-        print(f"\n🔄 RULE: Line Item Replacements (Carrier → Roof Master)")
-        
-        # Define replacement rules: [carrier_patterns, roof_master_description]
-        replacement_rules = [
-            # Ridge vents
-            (["Detach & Reset Continuous ridge vent - shingle-over", "Install Continuous ridge vent - shingle-over style"], 
-             "Continuous ridge vent - shingle-over style"),
-            (["Detach & Reset Continuous ridge vent - aluminum", "Install Continuous ridge vent - aluminum"], 
-             "Continuous ridge vent - aluminum"),
-            
-            # Turtle vents
-            (["Detach & Reset Roof vent - turtle type - Plastic", "Install Roof vent - turtle type - Plastic"], 
-             "Roof vent - turtle type - Plastic"),
-            (["Detach & Reset Roof vent - turtle type - Metal", "Install Roof vent - turtle type - Metal"], 
-             "Roof vent - turtle type - Metal"),
-            
-            # Off ridge vents
-            (["Detach & Reset Roof vent - off ridge type - 8'", "Install Roof vent - off ridge type - 8'"], 
-             "Roof vent - off ridge type - 8'"),
-            (["Detach & Reset Roof vent - off ridge type - 6'", "Install Roof vent - off ridge type - 6'"], 
-             "Roof vent - off ridge type - 6'"),
-            (["Detach & Reset Roof vent - off ridge type - 4'", "Install Roof vent - off ridge type - 4'"], 
-             "Roof vent - off ridge type - 4'"),
-            (["Detach & Reset Roof vent - off ridge type - 2'", "Install Roof vent - off ridge type - 2'"], 
-             "Roof vent - off ridge type - 2'"),
-            
-            # Dormer and turbine vents
-            (["Detach & Reset Roof vent - dormer type - Metal", "Install Roof vent - dormer type - Metal"], 
-             "Roof vent - dormer type - Metal"),
-            (["Detach & Reset Roof vent - turbine type", "Install Roof vent - turbine type"], 
-             "Roof vent - turbine type"),
-            
-            # Power attic vents
-            (["Detach & Reset Roof mount power attic vent - Large", "Install Roof mount power attic vent - Large"], 
-             "Roof mount power attic vent - Large"),
-            (["Detach & Reset Roof mount power attic vent", "Install Roof mount power attic vent"], 
-             "Roof mount power attic vent"),
-            
-            # Exhaust caps
-            (["Detach & Reset Exhaust cap - through roof - up to 4\"", "Install Exhaust cap - through roof - up to 4\""], 
-             "Exhaust cap - through roof - up to 4\""),
-            (["Detach & Reset Exhaust cap - through roof - 6\" to 8\"", "Install Exhaust cap - through roof - 6\" to 8\""], 
-             "Exhaust cap - through roof - 6\" to 8\""),
-            
-            # Power attic vent covers
-            (["Detach & Reset Power attic vent cover only - metal", "Install Power attic vent cover only - metal"], 
-             "Power attic vent cover only - metal"),
-            (["Detach & Reset Power attic vent cover only - plastic", "Install Power attic vent cover only - plastic"], 
-             "Power attic vent cover only - plastic"),
-            
-            # Skylights - flat fixed
-            (["Detach & Reset Skylight - flat fixed, 9.1 - 10 sf", "Install Skylight - flat fixed, 9.1 - 10 sf"], 
-             "Skylight - flat fixed 9.1 - 10 sf"),
-            (["Detach & Reset Roof window (skylight), 12.1 - 15 sf", "Install Roof window (skylight), 12.1 - 15 sf"], 
-             "Roof window (skylight) 12.1 - 15 sf"),
-            
-            # Skylights - double dome fixed
-            (["Detach & Reset Skylight - double dome fixed, 6.6 - 9"], 
-             "Skylight - double dome fixed 6.6 - 9 sf"),
-            (["Detach & Reset Skylight - double dome fixed, 4 - 6.5"], 
-             "Skylight - double dome fixed 4 - 6.5 sf"),
-            (["Detach & Reset Skylight - double dome fixed, 9.1 -"], 
-             "Skylight - double dome fixed 9.1 - 12.5 sf"),
-            (["Detach & Reset Skylight - double dome fixed, 12.6 -"], 
-             "Skylight - double dome fixed 12.6 - 15.5 sf"),
-            
-            # Skylights - double dome venting
-            (["Detach & Reset Skylight - double dome venting, 6.6 -"], 
-             "Skylight - double dome venting 6.6 - 9 sf"),
-            (["Detach & Reset Skylight - double dome venting, 4 -"], 
-             "Skylight - double dome venting 4 - 6.5 sf"),
-            (["Detach & Reset Skylight - double dome venting, 9.1 -"], 
-             "Skylight - double dome venting 9.1 - 12.5 sf"),
-            (["Detach & Reset Skylight - double dome venting, 12."], 
-             "Skylight - double dome venting 12.6 - 15.5 sf"),
-            
-            # Skylights - single dome fixed
-            (["Detach & Reset Skylight - single dome fixed, 6.6 - 9"], 
-             "Skylight - single dome fixed 6.6 - 9 sf"),
-            (["Detach & Reset Skylight - single dome fixed, 4 - 6.5"], 
-             "Skylight - single dome fixed 4 - 6.5 sf"),
-            (["Detach & Reset Skylight - single dome fixed, 9.1 -"], 
-             "Skylight - single dome fixed 9.1 - 12.5 sf"),
-            (["Detach & Reset Skylight - single dome fixed, 12.6 -"], 
-             "Skylight - single dome fixed 12.6 - 15.5 sf"),
-            
-            # Skylights - single dome venting
-            (["Detach & Reset Skylight - single dome venting, 6.6 -"], 
-             "Skylight - single dome venting 6.6 - 9 sf"),
-            (["Detach & Reset Skylight - single dome venting, 4 - 6."], 
-             "Skylight - single dome venting 4 - 6.5 sf"),
-            (["Detach & Reset Skylight - single dome venting, 9.1 -"], 
-             "Skylight - single dome venting 9.1 - 12.5 sf"),
-            (["Detach & Reset Skylight - single dome venting, 12.6 -"], 
-             "Skylight - single dome venting 12.6 - 15.5 sf"),
-            
-            # Skylights - flat fixed variations
-            (["Detach & Reset Skylight - flat fixed, 6.1 - 9 sf", "Install Skylight - flat fixed, 6.1 - 9 sf"], 
-             "Skylight - flat fixed 6.1 - 9 sf"),
-            (["Detach & Reset Skylight - flat fixed, up to 6 sf", "Install Skylight - flat fixed, up to 6 sf"], 
-             "Skylight - flat fixed up to 6 sf"),
-            (["Detach & Reset Skylight - flat fixed, 10.1 - 12 sf", "Install Skylight - flat fixed, 10.1 - 12 sf"], 
-             "Skylight - flat fixed 10.1 - 12 sf"),
-            (["Detach & Reset Skylight - flat fixed, 12.1 - 15 sf", "Install Skylight - flat fixed, 12.1 - 15 sf"], 
-             "Skylight - flat fixed 12.1 - 15 sf"),
-            
-            # Roof windows (skylights)
-            (["Detach & Reset Roof window (skylight), 6.1 - 9 sf", "Install Roof window (skylight), 6.1 - 9 sf"], 
-             "Roof window (skylight) 6.1 - 9 sf"),
-            (["Detach & Reset Roof window (skylight), up to 6 sf", "Install Roof window (skylight), up to 6 sf"], 
-             "Roof window (skylight) up to 6 sf"),
-            (["Detach & Reset Roof window (skylight), 10.1 - 12 sf", "Install Roof window (skylight), 10.1 - 12 sf"], 
-             "Roof window (skylight) 10.1 - 12 sf"),
-            
-            # Gutter items
-            (["Detach & Reset Gutter guard/screen", "Install Gutter guard/screen"], 
-             "Gutter guard/screen"),
-            (["Install Gutter / downspout - Detach & reset"], 
-             "Gutter / downspout - Detach & reset"),
-            (["Install Drip edge/gutter apron"], 
-             "Drip edge/gutter apron"),
-            (["Install Drip edge"], 
-             "Drip edge"),
-            (["Install Drip edge - copper"], 
-             "Drip edge - copper"),
-            
-            # Flashing items
-            (["Install Counterflashing - Apron flashing"], 
-             "Counterflashing - Apron flashing"),
-            (["Install Valley metal"], 
-             "Valley metal"),
-            (["Install Valley metal - (W) profile"], 
-             "Valley metal - (W) profile"),
-            (["Install Furnace vent - rain cap and storm collar, 6\""], 
-             "Furnace vent - rain cap and storm collar 6\""),
-            (["Install Flashing - rain diverter"], 
-             "Flashing - rain diverter"),
-            (["Install Flashing - kick-out diverter"], 
-             "Flashing - kick-out diverter"),
-            (["Install Flashing - pipe jack - copper"], 
-             "Flashing - pipe jack - copper"),
-            (["Install Flashing - pipe jack - lead"], 
-             "Flashing - pipe jack - lead"),
-            (["Install Flashing - pipe jack - 6\""], 
-             "Flashing - pipe jack - 6\""),
-            (["Install Flashing - pipe jack - 8\""], 
-             "Flashing - pipe jack - 8\""),
-            (["Install Flashing - pipe jack - split boot"], 
-             "Flashing - pipe jack - split boot"),
-            (["Install Flashing - pipe jack"], 
-             "Flashing - pipe jack"),
-            
-            # Rain caps
-            (["Install Rain cap - 10\""], 
-             "Rain cap - 10\""),
-            (["Install Rain cap - 12\""], 
-             "Rain cap - 12\""),
-            (["Install Rain cap - 4\" to 5\""], 
-             "Rain cap - 4\" to 5\""),
-            (["Install Rain cap - 6\""], 
-             "Rain cap - 6\""),
-            (["Install Rain cap - 8\""], 
-             "Rain cap - 8\""),
-            
-            # Step flashing and aluminum
-            (["Install Step flashing"], 
-             "Step flashing"),
-            (["Install Aluminum sidewall/endwall flashing - mill"], 
-             "Aluminum sidewall/endwall flashing - mill finish"),
-            (["Install Flashing, 14\" wide"], 
-             "Flashing 14\" wide"),
-            (["Install Flashing, 14\" wide - copper"], 
-             "Flashing 14\" wide - copper"),
-            (["Install Flashing, 20\" wide"], 
-             "Flashing 20\" wide"),
-            
-            # Evaporative cooler
-            (["Install Evaporative cooler - Detach & reset"], 
-             "Evaporative cooler - Detach & reset"),
-            
-            # Chimney flashing
-            (["Install Chimney flashing - small (24\" x 24\")"], 
-             "Chimney flashing - small (24\" x 24\")"),
-            (["Install Saddle or cricket - up to 25 SF"], 
-             "Saddle or cricket - up to 25 SF"),
-            (["Install Saddle or cricket - 26 to 50 SF"], 
-             "Saddle or cricket - 26 to 50 SF"),
-            (["Install Chimney flashing - average (32\" x 36\")"], 
-             "Chimney flashing - average (32\" x 36\")"),
-            (["Install Chimney flashing - large (32\" x 60\")"], 
-             "Chimney flashing - large (32\" x 60\")"),
-            
-            # Skylight flashing kits
-            (["Install Skylight flashing kit - dome"], 
-             "Skylight flashing kit - dome"),
-            (["Install Skylight flashing kit - dome - High grade"], 
-             "Skylight flashing kit - dome - High grade"),
-            (["Install Skylight flashing kit - dome - Large - High"], 
-             "Skylight flashing kit - dome - Large - High grade"),
-            (["Install Skylight flashing kit - dome - Large"], 
-             "Skylight flashing kit - dome - Large"),
-            (["Install Roof window step flashing kit"], 
-             "Roof window step flashing kit"),
-            (["Install Roof window step flashing kit - Large"], 
-             "Roof window step flashing kit - Large"),
-            
-            # Additional skylight installations
-            (["Install Skylight - double dome fixed, 6.6 - 9 sf"], 
-             "Skylight - double dome fixed 6.6 - 9 sf"),
-            (["Install Skylight - double dome fixed, 4 - 6.5 sf"], 
-             "Skylight - double dome fixed 4 - 6.5 sf"),
-            (["Install Skylight - double dome fixed, 9.1 - 12.5 sf"], 
-             "Skylight - double dome fixed 9.1 - 12.5 sf"),
-            (["Install Skylight - double dome fixed, 12.6 - 15.5 sf"], 
-             "Skylight - double dome fixed 12.6 - 15.5 sf"),
-            (["Install Skylight - double dome venting, 6.6 - 9 sf"], 
-             "Skylight - double dome venting 6.6 - 9 sf"),
-            (["Install Skylight - double dome venting, 4 - 6.5 sf"], 
-             "Skylight - double dome venting 4 - 6.5 sf"),
-            (["Install Skylight - double dome venting, 9.1 - 12.5 sf"], 
-             "Skylight - double dome venting 9.1 - 12.5 sf"),
-            (["Install Skylight - double dome venting, 12.6 - 15.5"], 
-             "Skylight - double dome venting 12.6 - 15.5 sf"),
-            (["Install Skylight - single dome fixed, 6.6 - 9 sf"], 
-             "Skylight - single dome fixed 6.6 - 9 sf"),
-            (["Install Skylight - single dome fixed, 4 - 6.5 sf"], 
-             "Skylight - single dome fixed 4 - 6.5 sf"),
-            (["Install Skylight - single dome fixed, 9.1 - 12.5 sf"], 
-             "Skylight - single dome fixed 9.1 - 12.5 sf"),
-            (["Install Skylight - single dome fixed, 12.6 - 15.5 sf"], 
-             "Skylight - single dome fixed 12.6 - 15.5 sf"),
-            (["Install Skylight - single dome venting, 6.6 - 9 sf"], 
-             "Skylight - single dome venting 6.6 - 9 sf"),
-            (["Install Skylight - single dome venting, 4 - 6.5 sf"], 
-             "Skylight - single dome venting 4 - 6.5 sf"),
-            (["Install Skylight - single dome venting, 9.1 - 12.5 sf"], 
-             "Skylight - single dome venting 9.1 - 12.5 sf"),
-            (["Install Skylight - single dome venting, 12.6 - 15.5 sf"], 
-             "Skylight - single dome venting 12.6 - 15.5 sf"),
-            
-            # Chimney flashing
-            (["Install Chimney flashing - small (24\" x 24\")"], 
-             "R&R Chimney flashing - small (24\" x 24\")"),
-            (["Install Chimney flashing - average (32\" x 36\")"], 
-             "R&R Chimney flashing - average (32\" x 36\")"),
-            (["Install Chimney flashing - large (32\" x 60\")"], 
-             "R&R Chimney flashing - large (32\" x 60\")"),
+        self.trace.debug("\n🔄 RULE: Line Item Replacements (Carrier → Roof Master)")
+        
+        
+        # Apply replacement rules
+        replacements_made = 0
+        targets = COMPILED_REPLACEMENT_RULES.resolve_targets(self._current_matcher(), self.lookup_unit_price,
+                                                             self._lookup_options())
+        for item, roof_master_desc, macro_data in COMPILED_REPLACEMENT_RULES.dispatch(line_items, targets):
+            old_desc = item.get("description", "Unknown")
+            old_price = item.get("unit_price", 0)
             
-            # Saddle/cricket
-            (["Install Saddle or cricket - up to 25 SF"], 
-             "Saddle or cricket - up to 25 SF"),
-            (["Install Saddle or cricket - 26 to 50 SF"], 
-             "Saddle or cricket - 26 to 50 SF"),
+            # Replace with roof master description and pricing
+            line_items.set_description(item, roof_master_desc)
+            self._apply_replacement(item, macro_data)
+            line_items.refresh(item)
             
-            # Skylight flashing kits
-            (["Install Skylight flashing kit - dome"], 
-             "R&R Skylight flashing kit - dome"),
-            (["Install Skylight flashing kit - dome - High grade"], 
-             "R&R Skylight flashing kit - dome - High grade"),
-            (["Install Skylight flashing kit - dome - Large - High"], 
-             "R&R Skylight flashing kit - dome - Large - High grade"),
-            (["Install Skylight flashing kit - dome - Large"], 
-             "R&R Skylight flashing kit - dome - Large"),
-            (["Install Roof window step flashing kit"], 
-             "R&R Roof window step flashing kit"),
-            (["Install Roof window step flashing kit - Large"], 
-             "R&R Roof window step flashing kit - Large"),
+            self.trace.debug("  ✅ REPLACED: '{}'", old_desc)
+            self.trace.debug("     → '{}'", roof_master_desc)
+            self.trace.debug("     Unit Price: ${:.2f} → ${:.2f}", old_price, macro_data['unit_price'])
+            self.trace.debug("     Unit: {}", item['unit'])
             
-            # Gutter and drip edge
-            (["Install Gutter / downspout - Detach & reset"], 
-             "Gutter / downspout - Detach & reset"),
-            (["Install Drip edge/gutter apron"], 
-             "R&R Drip edge/gutter apron"),
-            (["Install Drip edge"], 
-             "R&R Drip edge"),
-            (["Install Drip edge - copper"], 
-             "R&R Drip edge - copper"),
-        ]
+            # Only create adjustment record if there's an actual quantity change
+            # For description/price-only changes, we don't need to log them as quantity adjustments
+            # since they don't affect the displayed quantities in the frontend
+            replacements_made += 1
         
-        # Apply replacement rules
-        replacements_made = 0
-        for carrier_patterns, roof_master_desc in replacement_rules:
-            for carrier_pattern in carrier_patterns:
-                # Find items matching carrier pattern (partial match to handle variations)
-                for item in line_items:
-                    item_desc = item.get("description", "").strip()
-                    
-                    # Check for exact match or close match
-                    if (item_desc == carrier_pattern or 
-                        carrier_pattern in item_desc or 
-                        item_desc in carrier_pattern):
-                        
-                        # Get the roof master macro data
-                        macro_data = self.lookup_unit_price(roof_master_desc)
-                        
-                        if macro_data['unit_price'] > 0:
-                            old_desc = item.get("description", "Unknown")
-                            old_price = item.get("unit_price", 0)
-                            
-                            # Replace with roof master description and pricing
-                            item["description"] = roof_master_desc
-                            item["unit_price"] = macro_data['unit_price']
-                            item["unit"] = macro_data.get('unit', item.get("unit", "EA"))
-                            
-                            # Recalculate costs
-                            self.update_item_costs(item)
-                            
-                            print(f"  ✅ REPLACED: '{old_desc}'")
-                            print(f"     → '{roof_master_desc}'")
-                            print(f"     Unit Price: ${old_price:.2f} → ${macro_data['unit_price']:.2f}")
-                            print(f"     Unit: {item['unit']}")
-                            
-                            # Only create adjustment record if there's an actual quantity change
-                            # For description/price-only changes, we don't need to log them as quantity adjustments
-                            # since they don't affect the displayed quantities in the frontend
-                            pass
-                            replacements_made += 1
-                            break  # Only replace first match for this pattern
-        
-        print(f"\n  📊 Total replacements made: {replacements_made}")
+        context.count('replacements_made', replacements_made)
+        if performance is not None:
+            performance.record('carrier_replacements', replacements_made > 0, replacements_made, 0,
+                               time.monotonic_ns() - started)
+            started = time.monotonic_ns()
+        self.trace.info("\n  📊 Total replacements made: {}", replacements_made)
         
         # Note: The following items from user's request are NOT in the current Roof Master Macro CSV:
         # - Items 106b-131b (various skylight items)
@@ -1375,102 +3838,71 @@ class RoofAdjustmentEngine:
         # These would need to be added to the roof_master_macro.csv file first
         
         if replacements_made == 0:
-            print(f"  ℹ️  No carrier estimate items found that match replacement patterns")
+            self.trace.debug("  ℹ️  No carrier estimate items found that match replacement patterns")
 
         # Final check: Compare unit prices against Roof Master Macro
-        print(f"\n💰 FINAL UNIT PRICE COMPARISON AGAINST ROOF MASTER MACRO")
+        self.trace.debug("\n💰 FINAL UNIT PRICE COMPARISON AGAINST ROOF MASTER MACRO")
         unit_price_adjustments = 0
         
         for item in line_items:
-            current_price = item.get("unit_price", 0)
-            description = item.get("description", "").strip()
-            
-            if not description:
-                continue
-                
-            # Look up unit price in Roof Master Macro
-            macro_data = self.lookup_unit_price(description)
-            macro_price = macro_data.get('unit_price', 0)
-            
-            if macro_price > 0:
-                # Use the maximum of current price and macro price
-                new_price = max(current_price, macro_price)
-                
-                if new_price > current_price:
-                    old_price = current_price
-                    item["unit_price"] = new_price
-                    
-                    # Recalculate RCV since unit price changed
-                    quantity = float(item.get("quantity", 0))
-                    item["RCV"] = quantity * new_price
-                    
-                    print(f"  ✅ PRICE INCREASED: '{description[:50]}...'")
-                    print(f"     Unit Price: ${old_price:.2f} → ${new_price:.2f}")
-                    print(f"     RCV: ${quantity * old_price:.2f} → ${item['RCV']:.2f}")
-                    
-                    # Add audit log entry for unit price adjustment
-                    self.results.add_audit_entry_for_item(
-                        item, 'unit_price', old_price, new_price,
-                        f"Unit price increased to match Roof Master Macro maximum (${new_price:.2f})",
-                        "Final Unit Price Comparison"
-                    )
-                    unit_price_adjustments += 1
-                elif new_price == current_price:
-                    print(f"  ⏭️  PRICE OK: '{description[:50]}...' - Already at max price (${current_price:.2f})")
-                else:
-                    print(f"  ⏭️  PRICE OK: '{description[:50]}...' - Current price higher than macro (${current_price:.2f} > ${macro_price:.2f})")
-            else:
-                print(f"  ❌ NO MATCH: '{description[:50]}...' - Not found in Roof Master Macro")
+            if self._check_unit_price(item, results):
+                line_items.refresh(item)
+                unit_price_adjustments += 1
         
-        print(f"\n📊 UNIT PRICE COMPARISON SUMMARY:")
-        print(f"  Total items checked: {len(line_items)}")
-        print(f"  Price adjustments made: {unit_price_adjustments}")
+        self.trace.debug("\n📊 UNIT PRICE COMPARISON SUMMARY:")
+        self.trace.debug("  Total items checked: {}", len(line_items))
+        context.count('unit_price_adjustments', unit_price_adjustments)
+        if performance is not None:
+            performance.record('unit_price_comparison', unit_price_adjustments > 0, unit_price_adjustments, 0,
+                               time.monotonic_ns() - started)
+        self.trace.info("  Price adjustments made: {}", unit_price_adjustments)
         
         if unit_price_adjustments > 0:
-            print(f"  💡 {unit_price_adjustments} line items had their unit prices increased to match Roof Master Macro maximums")
+            self.trace.debug("  💡 {} line items had their unit prices increased to match Roof Master Macro maximums", unit_price_adjustments)
         else:
-            print(f"  💡 All line items already have optimal unit prices")
+            self.trace.debug("  💡 All line items already have optimal unit prices")
 
+        if line_items is not source_line_items:
+            source_line_items[:] = line_items
+            return source_line_items
         return line_items
 
-    def process_claim(self, line_items: List[Dict[str, Any]], roof_measurements: Dict[str, Any]) -> Dict[str, Any]:
-        """Process the claim with all adjustment rules."""
-        
-        # DEBUG: Print detailed input information
-        print("\n" + "="*80)
-        print("🐍 PYTHON RULE ENGINE - DEBUG OUTPUT")
-        print("="*80)
+    def _trace_claim_input(self, line_items: List[Dict[str, Any]], roof_measurements: Dict[str, Any]) -> None:
+        """Debug dump of the claim input."""
+        self.trace.debug("\n" + "=" * 80)
+        self.trace.debug("🐍 PYTHON RULE ENGINE - DEBUG OUTPUT")
+        self.trace.debug("=" * 80)
         
-        print(f"\n📊 INPUT DATA SUMMARY:")
-        print(f"  Line Items Count: {len(line_items)}")
-        print(f"  Roof Measurements Keys: {len(roof_measurements.keys())}")
+        self.trace.debug("\n📊 INPUT DATA SUMMARY:")
+        self.trace.debug("  Line Items Count: {}", len(line_items))
+        self.trace.debug("  Roof Measurements Keys: {}", len(roof_measurements.keys()))
         
-        print(f"\n📋 LINE ITEMS DETAILS:")
-        print(f"  Total Line Items: {len(line_items)}")
+        self.trace.debug("\n📋 LINE ITEMS DETAILS:")
+        self.trace.debug("  Total Line Items: {}", len(line_items))
         for i, item in enumerate(line_items):  # Show ALL items
-            print(f"  Item {i+1}:")
-            print(f"    Line Number: {item.get('line_number', 'N/A')}")
-            print(f"    Description: {item.get('description', 'NO DESCRIPTION')}")
-            print(f"    Quantity: {item.get('quantity', 'N/A')}")
-            print(f"    Unit: {item.get('unit', 'N/A')}")
-            print(f"    Unit Price: ${item.get('unit_price', 'N/A')}")
-            print(f"    RCV: ${item.get('RCV', 'N/A')}")
-            print(f"    ACV: ${item.get('ACV', 'N/A')}")
-            print(f"    Location: {item.get('location_room', 'N/A')}")
-            print(f"    Category: {item.get('category', 'N/A')}")
-            print(f"    ---")
-        
-        print(f"\n🏠 ROOF MEASUREMENTS DETAILS:")
-        print(f"  Total Roof Measurements Available: {len(roof_measurements)}")
+            self.trace.debug("  Item {}:", i+1)
+            self.trace.debug("    Line Number: {}", item.get('line_number', 'N/A'))
+            self.trace.debug("    Description: {}", item.get('description', 'NO DESCRIPTION'))
+            self.trace.debug("    Quantity: {}", item.get('quantity', 'N/A'))
+            self.trace.debug("    Unit: {}", item.get('unit', 'N/A'))
+            self.trace.debug("    Unit Price: ${}", item.get('unit_price', 'N/A'))
+            self.trace.debug("    RCV: ${}", item.get('RCV', 'N/A'))
+            self.trace.debug("    ACV: ${}", item.get('ACV', 'N/A'))
+            self.trace.debug("    Location: {}", item.get('location_room', 'N/A'))
+            self.trace.debug("    Category: {}", item.get('category', 'N/A'))
+            self.trace.debug("    ---")
+        
+        self.trace.debug("\n🏠 ROOF MEASUREMENTS DETAILS:")
+        self.trace.debug("  Total Roof Measurements Available: {}", len(roof_measurements))
         
         # Show ALL roof measurements
         for key, value in roof_measurements.items():
             if isinstance(value, dict) and 'value' in value:
-                print(f"  {key}: {value['value']}")
+                self.trace.debug("  {}: {}", key, value['value'])
             else:
-                print(f"  {key}: {value}")
+                self.trace.debug("  {}: {}", key, value)
         
-        print(f"\n📐 KEY METRICS SUMMARY:")
+        self.trace.debug("\n📐 KEY METRICS SUMMARY:")
         key_metrics = [
             "Total Roof Area", "Total Eaves Length", "Total Rakes Length", 
             "Total Ridges/Hips Length", "Total Valleys Length",
@@ -1480,9 +3912,9 @@ class RoofAdjustmentEngine:
         
         for key in key_metrics:
             value = self.get_metric(roof_measurements, key)
-            print(f"  {key}: {value}")
+            self.trace.debug("  {}: {}", key, value)
         
-        print(f"\n📐 PITCH AREAS:")
+        self.trace.debug("\n📐 PITCH AREAS:")
         pitch_areas = [
             "Area for Pitch 1/12 (sq ft)", "Area for Pitch 2/12 (sq ft)", "Area for Pitch 3/12 (sq ft)",
             "Area for Pitch 4/12 (sq ft)", "Area for Pitch 5/12 (sq ft)", "Area for Pitch 6/12 (sq ft)", 
@@ -1493,91 +3925,729 @@ class RoofAdjustmentEngine:
         
         for pitch in pitch_areas:
             value = self.get_metric(roof_measurements, pitch)
-            print(f"  {pitch}: {value}")
+            self.trace.debug("  {}: {}", pitch, value)
         
-        print(f"\n🔍 RAW ROOF MEASUREMENTS STRUCTURE:")
-        print(f"  Type: {type(roof_measurements)}")
-        print(f"  All Keys: {list(roof_measurements.keys())}")
+        self.trace.debug("\n🔍 RAW ROOF MEASUREMENTS STRUCTURE:")
+        self.trace.debug("  Type: {}", type(roof_measurements))
+        self.trace.debug("  All Keys: {}", list(roof_measurements.keys()))
         if roof_measurements:
-            print(f"  Sample entries:")
+            self.trace.debug("  Sample entries:")
             for i, (key, value) in enumerate(list(roof_measurements.items())[:3]):
-                print(f"    '{key}' -> {value} (type: {type(value)})")
+                self.trace.debug("    '{}' -> {} (type: {})", key, value, type(value))
+
+    def _trace_claim_summary(self, adjusted_line_items: List[Dict[str, Any]], metrics: RoofMetrics,
+                             results: AdjustmentResult) -> None:
+        """Debug dump of the processing outcome."""
+        self.trace.debug("  Final line items count: {}", len(adjusted_line_items))
+        self.trace.debug("  Final totals: RCV ${:.2f}, ACV ${:.2f}", sum(_cost(item, "RCV") for item in adjusted_line_items),
+                         sum(_cost(item, "ACV") for item in adjusted_line_items))
+        self.trace.debug("  Adjustments made: {}", len(results.adjustments))
+        self.trace.debug("  Items added: {}", len(results.additions))
+        self.trace.debug("  Warnings: {}", len(results.warnings))
         
-        # Create a copy of line items for processing
-        adjusted_line_items = copy.deepcopy(line_items)
+        self.trace.debug("\n📊 FINAL DEBUG SUMMARY:")
+        self.trace.debug("  Total Roof Area Used: {} sq ft", metrics['total_roof_area'])
+        self.trace.debug("  Total Eaves Length Used: {} ft", metrics['total_eaves_length'])
+        self.trace.debug("  Total Rakes Length Used: {} ft", metrics['total_rakes_length'])
+        self.trace.debug("  Total Ridges/Hips Length Used: {} ft", metrics['total_ridges_hips_length'])
+        self.trace.debug("  Total Valleys Length Used: {} ft", metrics['total_valleys_length'])
         
-        print(f"\n⚙️ PROCESSING STARTED...")
-        print(f"  Processing {len(adjusted_line_items)} line items...")
-        print(f"  Roof measurements: {self.get_metric(roof_measurements, 'Total Roof Area')} sq ft total area")
+        # Show which adjustments were made
+        if results.adjustments:
+            self.trace.debug("\n🔧 ADJUSTMENTS MADE:")
+            for i, adj in enumerate(results.adjustments):
+                self.trace.debug("  {}. {}: {} → {}", i+1, adj['description'], adj['old_quantity'], adj['new_quantity'])
+                self.trace.debug("     Reason: {}", adj['reason'])
+        
+        # Show which items were added
+        if results.additions:
+            self.trace.debug("\n➕ ITEMS ADDED:")
+            for i, add in enumerate(results.additions):
+                self.trace.debug("  {}. {}: {} {}", i+1, add['description'], add['quantity'], add.get('unit', 'SQ'))
+                self.trace.debug("     Reason: {}", add['reason'])
         
-        # Apply all rules
-        adjusted_line_items = self.apply_logic(adjusted_line_items, roof_measurements)
+        # Show warnings
+        if results.warnings:
+            self.trace.debug("\n⚠️ WARNINGS:")
+            for i, warn in enumerate(results.warnings):
+                self.trace.debug("  {}. {}", i+1, warn['description'])
+                self.trace.debug("     Reason: {}", warn['reason'])
         
-        print(f"\n✅ PROCESSING COMPLETED!")
-        print(f"  Final line items count: {len(adjusted_line_items)}")
-        print(f"  Adjustments made: {len(self.results.adjustments)}")
-        print(f"  Items added: {len(self.results.additions)}")
-        print(f"  Warnings: {len(self.results.warnings)}")
+        self.trace.debug("\n" + "=" * 80)
+        self.trace.debug("🐍 PYTHON RULE ENGINE - DEBUG OUTPUT COMPLETE")
+        self.trace.debug("=" * 80)
+
+    def process_claim(self, line_items: List[Dict[str, Any]], roof_measurements: Dict[str, Any],
+                      changed_only: bool = False, render_text: bool = True,
+                      values: Optional[Dict[str, Any]] = None, use_cache: bool = True,
+                      performance: Optional[bool] = None, catalog_key: Optional[str] = None) -> Dict[str, Any]:
+        """Process the claim with all adjustment rules.
+
+        The input line items are never modified. Unmodified items are shared
+        between original_line_items and adjusted_line_items rather than copied;
+        with changed_only=True, adjusted_line_items holds only the modified and
+        added items.
+
+        With render_text=False, adjustment reasons, audit explanations and
+        item narratives are left as RuleText values (rule id and parameters)
+        for callers that only read the numbers; render_rule_texts() or
+        json.dumps(..., default=rule_text_json) produce the text later.
+        values are passed on to apply_logic.
+
+        Results are cached by claim_fingerprint in result_cache (no caching
+        unless the engine was given a backend such as MemoryResultCache). A claim
+        seen before is answered from the cache without running the rules;
+        the result then carries 'provenance' (source, backend, fingerprint,
+        stored_at). use_cache=False always processes the claim.
+
+        With performance=True (default: the engine's performance setting)
+        the result has a 'performance' section: the claim's total and, per
+        rule id, the evaluations, hits, adjustments, additions and
+        nanoseconds spent (see RulePerformance). The counts are also added
+        to the process-wide RULE_PERFORMANCE aggregate. A claim answered
+        from the cache reports its lookup time and no rules.
+
+        With a catalog manager the claim is priced against the catalog version
+        current when it starts, recorded as the result's 'catalog_version'.
+        A catalog_key prices it against that catalog of the engine's
+        catalog_shards instead; the result then also records 'catalog_key'.
+        """
+        if catalog_key is None and self.catalog_manager is None:
+            return self._process_claim(line_items, roof_measurements, changed_only, render_text, values,
+                                       use_cache, performance)
+        with self.using_catalog(self.catalog_for_key(catalog_key)) as version:
+            result = self._process_claim(line_items, roof_measurements, changed_only, render_text, values,
+                                         use_cache, performance)
+        result['catalog_version'] = version.version
+        if catalog_key is not None:
+            result['catalog_key'] = catalog_key
+        return result
+
+    def _process_claim(self, line_items: List[Dict[str, Any]], roof_measurements: Dict[str, Any],
+                       changed_only: bool, render_text: bool, values: Optional[Dict[str, Any]],
+                       use_cache: bool, performance: Optional[bool]) -> Dict[str, Any]:
+        if performance is None:
+            performance = self.performance
+        started = time.monotonic_ns() if performance else 0
+        fingerprint = self._cached_claim_fingerprint(line_items, roof_measurements, changed_only,
+                                                     render_text, use_cache)
+        if fingerprint is not None:
+            cached = self._result_cache_call('get', fingerprint)
+            if cached is not None:
+                result, stored_at = cached
+                self.trace.info("♻️  Claim {}... answered from the {} result cache", fingerprint[:12],
+                                self.result_cache.name)
+                result = {**result, 'provenance': {'source': 'cache', 'backend': self.result_cache.name,
+                                                   'fingerprint': fingerprint, 'stored_at': stored_at}}
+                if performance:
+                    result['performance'] = {'source': 'cache', 'nanoseconds': time.monotonic_ns() - started,
+                                             'rules': {}}
+                return result
         
-        print(f"\n📊 FINAL DEBUG SUMMARY:")
-        print(f"  Total Roof Area Used: {self.get_metric(roof_measurements, 'Total Roof Area')} sq ft")
-        print(f"  Total Eaves Length Used: {self.get_metric(roof_measurements, 'Total Eaves Length')} ft")
-        print(f"  Total Rakes Length Used: {self.get_metric(roof_measurements, 'Total Rakes Length')} ft")
-        print(f"  Total Ridges/Hips Length Used: {self.get_metric(roof_measurements, 'Total Ridges/Hips Length')} ft")
-        print(f"  Total Valleys Length Used: {self.get_metric(roof_measurements, 'Total Valleys Length')} ft")
+        # DEBUG: Dump detailed input information (only formatted when debug tracing is on)
+        if self.trace.debug_enabled:
+            self._trace_claim_input(line_items, roof_measurements)
         
-        # Show which adjustments were made
-        if self.results.adjustments:
-            print(f"\n🔧 ADJUSTMENTS MADE:")
-            for i, adj in enumerate(self.results.adjustments):
-                print(f"  {i+1}. {adj['description']}: {adj['old_quantity']} → {adj['new_quantity']}")
-                print(f"     Reason: {adj['reason']}")
+        # Copy-on-write view of the line items for processing
+        adjusted_line_items = CopyOnWriteLineItems(line_items)
         
-        # Show which items were added
-        if self.results.additions:
-            print(f"\n➕ ITEMS ADDED:")
-            for i, add in enumerate(self.results.additions):
-                print(f"  {i+1}. {add['description']}: {add['quantity']} {add.get('unit', 'SQ')}")
-                print(f"     Reason: {add['reason']}")
+        self.trace.debug("\n⚙️ PROCESSING STARTED...")
+        self.trace.debug("  Processing {} line items...", len(adjusted_line_items))
+        self.trace.debug("  Roof measurements: {} sq ft total area", self.get_metric(roof_measurements, 'Total Roof Area'))
         
-        # Show warnings
-        if self.results.warnings:
-            print(f"\n⚠️ WARNINGS:")
-            for i, warn in enumerate(self.results.warnings):
-                print(f"  {i+1}. {warn['description']}")
-                print(f"     Reason: {warn['reason']}")
+        # Apply all rules against a fresh per-call context
+        context = ClaimContext(performance)
+        adjusted_line_items = self.apply_logic(adjusted_line_items, roof_measurements, context, values)
+        results = context.results
         
-        print(f"\n" + "="*80)
-        print("🐍 PYTHON RULE ENGINE - DEBUG OUTPUT COMPLETE")
-        print("="*80)
+        self.trace.info("\n✅ PROCESSING COMPLETED!")
+        if self.trace.debug_enabled:
+            self._trace_claim_summary(adjusted_line_items, context.metrics, context.results)
         
-        return {
+        result = self._claim_result(as_line_item_dicts(line_items),
+                                    (adjusted_line_items.changed_items() if changed_only
+                                     else adjusted_line_items.materialize()),
+                                    results, context.metrics, render_text)
+        if fingerprint is not None:
+            self._result_cache_call('set', fingerprint, result)
+        if context.performance is not None:
+            nanoseconds = time.monotonic_ns() - started
+            RULE_PERFORMANCE.add(context.performance, nanoseconds)
+            result['performance'] = {'source': 'rules', 'nanoseconds': nanoseconds,
+                                     'rules': context.performance.to_dict()}
+        return result
+
+    def _cached_claim_fingerprint(self, line_items, roof_measurements, changed_only: bool, render_text: bool,
+                                  use_cache: bool) -> Optional[str]:
+        """The claim's fingerprint, or None when the cache is off or the claim cannot be fingerprinted."""
+        if not use_cache or type(self.result_cache) is ResultCache:
+            return None
+        try:
+            return self.claim_fingerprint(line_items, roof_measurements, changed_only, render_text)
+        except Exception:
+            return None  # Malformed input: let processing report it
+
+    def _result_cache_call(self, method: str, *args) -> Any:
+        """A result cache get/set; a failing backend is traced and treated as a miss."""
+        try:
+            return getattr(self.result_cache, method)(*args)
+        except Exception as e:
+            self.trace.warning("⚠️  {} result cache {} failed: {}", self.result_cache.name, method, e)
+            return None
+
+    def _claim_result(self, line_items: List[Dict[str, Any]], adjusted_line_items: List[Dict[str, Any]],
+                      results: AdjustmentResult, metrics: RoofMetrics,
+                      render_text: bool = True) -> Dict[str, Any]:
+        """The process_claim result dict."""
+        values = metrics.values
+        result = {
             'original_line_items': line_items,
             'adjusted_line_items': adjusted_line_items,
-            'audit_log': self.results.audit_log,  # Include audit log for frontend display
+            'audit_log': results.audit_log,  # Include audit log for frontend display
             'adjustment_results': {
-                'adjustments': self.results.adjustments,
-                'additions': self.results.additions,
-                'warnings': self.results.warnings,
-                'summary': self.results.summary
+                'adjustments': results.adjustments,
+                'additions': results.additions,
+                'warnings': results.warnings,
+                'summary': results.summary
             },
             'roof_measurements': {
-                'total_roof_area': self.get_metric(roof_measurements, 'Total Roof Area'),
-                'total_eaves_length': self.get_metric(roof_measurements, 'Total Eaves Length'),
-                'total_rakes_length': self.get_metric(roof_measurements, 'Total Rakes Length'),
-                'total_ridges_hips_length': self.get_metric(roof_measurements, 'Total Ridges/Hips Length'),
-                'total_valleys_length': self.get_metric(roof_measurements, 'Total Valleys Length'),
+                'total_roof_area': values['total_roof_area'],
+                'total_eaves_length': values['total_eaves_length'],
+                'total_rakes_length': values['total_rakes_length'],
+                'total_ridges_hips_length': values['total_ridges_hips_length'],
+                'total_valleys_length': values['total_valleys_length'],
                 'steep_roof_areas': {
-                    '7_12_to_9_12': self.get_metric(roof_measurements, 'Area for Pitch 7/12 (sq ft)') + 
-                                   self.get_metric(roof_measurements, 'Area for Pitch 8/12 (sq ft)') + 
-                                   self.get_metric(roof_measurements, 'Area for Pitch 9/12 (sq ft)'),
-                    '10_12_to_12_12': self.get_metric(roof_measurements, 'Area for Pitch 10/12 (sq ft)') + 
-                                     self.get_metric(roof_measurements, 'Area for Pitch 11/12 (sq ft)') + 
-                                     self.get_metric(roof_measurements, 'Area for Pitch 12/12 (sq ft)'),
-                    '12_12_plus': self.get_metric(roof_measurements, 'Area for Pitch 12/12+ (sq ft)')
+                    '7_12_to_9_12': values['steep_7_9_total'],
+                    '10_12_to_12_12': values['steep_10_12_total'],
+                    '12_12_plus': values['area_pitch_12_plus']
                 }
             }
         }
+        return render_rule_texts(result) if render_text else result
+
+    def open_claim(self, line_items: List[Dict[str, Any]], roof_measurements: Dict[str, Any],
+                   render_text: bool = True, catalog_key: Optional[str] = None) -> 'ClaimSession':
+        """Process a claim and keep its state for incremental re-evaluation of later edits."""
+        return ClaimSession(self, line_items, roof_measurements, render_text, catalog_key)
+
+    def what_if(self, line_items: List[Dict[str, Any]], roof_measurements: Dict[str, Any],
+                variants: List[Mapping[str, Any]]) -> Dict[str, Any]:
+        """Evaluate measurement variants of one claim, e.g. roof area +/-5% or eaves +/-10 LF.
+
+        Each variant maps measurement keys (in any convention the measurement
+        schema recognizes) to a change: a new value, or ('set', value),
+        ('add', delta) or ('scale', factor) applied to the claim's own value.
+        The claim is prepared once as a ClaimSession and every variant is an
+        incremental re-evaluation of it, so the catalog matches and
+        replacements, which do not depend on measurements, are reused.
+
+        Returns {'base': totals, 'variants': rows}: per variant its
+        measurements, totals and the items that differ from the base result.
+        A variant that fails gets an 'error' row and the next one continues.
+        """
+        session = self.open_claim(line_items, roof_measurements, render_text=False)
+        base_measurements = dict(session.roof_measurements)
+        base_items = session.result['adjusted_line_items']
+        base = _what_if_totals(session.result)
+        schema = self.measurement_schema
+        rows = []
+        active: set = set()
+        for index, variant in enumerate(variants):
+            row: Dict[str, Any] = {'variant': index}
+            try:
+                changes = {}
+                for key, change in variant.items():
+                    name = schema.canonical_key(key) or key
+                    changes[name] = _perturbed_value(self.get_metric(base_measurements, name), change)
+                update = {name: self.get_metric(base_measurements, name) for name in active - set(changes)}
+                update.update(changes)
+                session.update_metrics(update)
+                active = set(changes)
+            except Exception as e:
+                row['error'] = f"{type(e).__name__}: {e}"
+                rows.append(row)
+                continue
+            totals = _what_if_totals(session.result)
+            row['measurements'] = changes
+            row.update(totals)
+            row['rcv_change'] = totals['rcv_total'] - base['rcv_total']
+            row['acv_change'] = totals['acv_total'] - base['acv_total']
+            row['changed_items'] = _what_if_changed_items(base_items, session.result['adjusted_line_items'])
+            rows.append(row)
+        return {'base': base, 'variants': rows}
+
+    def process_claims(self, claims, executor: str = 'serial', max_workers: Optional[int] = None,
+                       chunk_size: int = 16, max_in_flight: Optional[int] = None,
+                       changed_only: bool = False, return_exceptions: bool = False,
+                       render_text: bool = True, vectorize: bool = False):
+        """Process many (line_items, roof_measurements[, catalog_key]) claims, yielding results in input order.
+
+        claims may be any iterable (including a generator); it is consumed
+        lazily. executor is 'serial', 'thread' or 'process'. Pooled executors
+        hand claims to workers in chunks of chunk_size and keep at most
+        max_in_flight chunks (default 2 per worker) submitted at once, so
+        memory stays bounded however long the batch is. Process workers each
+        build their engine once, from this engine's catalog path, trace level,
+        rules, performance setting, price policy, fuzzy threshold, catalog
+        shard directory (each worker keeps its own resident shards) and
+        result cache, rebuilt from its worker_config(); a cache that has none
+        raises ValueError. With a catalog_manager each worker keeps a manager
+        on the same source and syncs it to this manager's current version
+        before every chunk.
+
+        A claim that fails raises its exception when its turn comes, or with
+        return_exceptions=True the exception instance is yielded in its place.
+        changed_only and render_text are passed on to process_claim.
+
+        With vectorize=True the metric values of each chunk (chunk_size claims,
+        also in serial mode) are evaluated together by
+        AdjustmentPlan.evaluate_values_batch, using NumPy when it is installed.
+        """
+        if executor not in BATCH_EXECUTORS:
+            raise ValueError(f"Unknown executor '{executor}'. Expected one of: {', '.join(BATCH_EXECUTORS)}")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        
+        worker_cache = None
+        if executor == 'process' and type(self.result_cache) is not ResultCache:
+            config = self.result_cache.worker_config()
+            if config is None:
+                raise ValueError(f"{type(self.result_cache).__name__} cannot be rebuilt in process workers; "
+                                 f"use executor='thread' or a cache with a worker_config")
+            worker_cache = (type(self.result_cache), config)
+
+        if executor == 'serial':
+            claims = iter(claims)
+            while True:
+                chunk = list(itertools.islice(claims, chunk_size if vectorize else 1))
+                if not chunk:
+                    return
+                yield from _batch_outcomes(_process_claim_chunk(self, chunk, changed_only, render_text, vectorize),
+                                          return_exceptions)
+        
+        workers = max_workers or os.cpu_count() or 1
+        if max_in_flight is None:
+            max_in_flight = 2 * workers
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        
+        if executor == 'thread':
+            pool = ThreadPoolExecutor(max_workers=workers)
+            submit = lambda chunk: pool.submit(_process_claim_chunk, self, chunk, changed_only, render_text, vectorize)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                       initargs=(self.catalog.path, self.trace.level,
+                                                 None if self.adjustment_plan is ADJUSTMENT_PLAN
+                                                 else self.adjustment_plan.rules, self.performance,
+                                                 self.price_policy, self.fuzzy_threshold,
+                                                 None if self.catalog_shards is None
+                                                 else (self.catalog_shards.directory, self.catalog_shards.max_bytes),
+                                                 None if self.catalog_manager is None else self.catalog_manager.path,
+                                                 worker_cache))
+            submit = lambda chunk: pool.submit(_process_claim_chunk_in_worker, chunk, changed_only,
+                                                 render_text, vectorize, self._worker_catalog_version())
+        
+        self.trace.info("📦 Batch processing with {} {} workers (chunk size {}, {} chunks in flight)",
+                        workers, executor, chunk_size, max_in_flight)
+        pending = deque()
+        try:
+            claims = iter(claims)
+            while True:
+                chunk = list(itertools.islice(claims, chunk_size))
+                if not chunk:
+                    break
+                pending.append(submit(chunk))
+                if len(pending) >= max_in_flight:
+                    yield from _batch_outcomes(pending.popleft().result(), return_exceptions)
+            while pending:
+                yield from _batch_outcomes(pending.popleft().result(), return_exceptions)
+        finally:
+            # Abandoned or failed batch: drop queued chunks instead of finishing them
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+WHAT_IF_OPERATIONS = ('set', 'add', 'scale')
+
+
+def _perturbed_value(value: Any, change: Any) -> Any:
+    """A measurement value after a what-if change (a new value, or an (operation, operand) pair)."""
+    if not isinstance(change, (tuple, list)):
+        return change
+    operation, operand = change
+    if operation == 'set':
+        return operand
+    if operation == 'add':
+        return value + operand
+    if operation == 'scale':
+        return value * operand
+    raise ValueError(f"Unknown what-if operation '{operation}'. Expected one of: {', '.join(WHAT_IF_OPERATIONS)}")
+
+
+def _what_if_totals(result: Dict[str, Any]) -> Dict[str, Any]:
+    items = result['adjusted_line_items']
+    summary = result['adjustment_results']['summary']
+    return {
+        'rcv_total': sum(_cost(item, 'RCV') for item in items),
+        'acv_total': sum(_cost(item, 'ACV') for item in items),
+        'line_items': len(items),
+        'adjustments': summary['total_adjustments'],
+        'additions': summary['total_additions'],
+        'warnings': summary['total_warnings'],
+    }
+
+
+def _what_if_changed_items(base_items: List[Dict[str, Any]], items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compact rows for the items that differ from the base result, by position (None where absent)."""
+    changed = []
+    for position in range(max(len(base_items), len(items))):
+        base_item = base_items[position] if position < len(base_items) else None
+        item = items[position] if position < len(items) else None
+        if item is base_item or item == base_item:
+            continue
+        shown = item if item is not None else base_item
+        changed.append({
+            'position': position,
+            'line_number': shown.get('line_number'),
+            'description': shown.get('description'),
+            'base_quantity': None if base_item is None else base_item.get('quantity'),
+            'quantity': None if item is None else item.get('quantity'),
+            'base_RCV': None if base_item is None else base_item.get('RCV'),
+            'RCV': None if item is None else item.get('RCV'),
+        })
+    return changed
+
+
+def _entry_key(entry: Dict[str, Any]) -> tuple:
+    # Result entries are always built with the same key order (nested catalog_match dicts too)
+    return tuple((key, tuple(value.items()) if isinstance(value, dict) else value) for key, value in entry.items())
+
+
+def _list_delta(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Entries only in new ('added') and only in old ('removed'), as multisets."""
+    remaining: Dict[tuple, int] = {}
+    for entry in old:
+        key = _entry_key(entry)
+        remaining[key] = remaining.get(key, 0) + 1
+    added = []
+    for entry in new:
+        key = _entry_key(entry)
+        if remaining.get(key):
+            remaining[key] -= 1
+        else:
+            added.append(entry)
+    removed = []
+    for entry in old:
+        key = _entry_key(entry)
+        if remaining.get(key):
+            remaining[key] -= 1
+            removed.append(entry)
+    return {'added': added, 'removed': removed}
+
+
+class ClaimSession:
+    """A processed claim kept in memory so single edits can be re-evaluated cheaply.
+
+    Processing is split into the rule plan, which only ever looks at items
+    whose description some rule reads, and a per-item tail: carrier
+    replacement followed by the final unit price comparison. An edit
+    re-runs the plan only if a rule reads the edited metric or description,
+    or if line or page numbers changed (new items are numbered from them),
+    and then only over the rule-relevant items. The tail is redone only for
+    items whose plan output, replacement or own fields changed. The result
+    is always identical to process_claim on the edited inputs.
+
+    The session works on its own copies of the inputs; edits never touch the
+    caller's data and never change a result returned earlier. render_text
+    applies to the result and the deltas as in process_claim. With a catalog
+    manager or a catalog_key the session stays on the catalog version it was
+    opened with.
+    """
+
+    def __init__(self, engine: 'RoofAdjustmentEngine', line_items: List[Dict[str, Any]],
+                 roof_measurements: Dict[str, Any], render_text: bool = True,
+                 catalog_key: Optional[str] = None):
+        self.engine = engine
+        self.render_text = render_text
+        self.plan = engine.adjustment_plan
+        self.catalog_key = catalog_key
+        self.catalog_version = engine.catalog_for_key(catalog_key)
+        self.line_items = IndexedLineItems(dict(item) for item in as_line_item_dicts(line_items))
+        # Kept without the derived ridges/hips length, so it follows edits of either line length
+        self.roof_measurements = dict(engine.measurement_schema.normalize(roof_measurements, derive=False)[0])
+        self._derive_ridges_hips = engine.measurement_schema.aliases_ridge_hip_lengths(roof_measurements)
+        with engine.using_catalog(self.catalog_version):
+            self._metrics = engine.parse_metrics(self._rule_measurements())
+            self._values = self._metrics.values
+            self._plan_positions = self._rule_relevant_positions()
+            self._plan_state = self._evaluate_plan(self._values, self._plan_positions)
+            self._mapping = self._replacement_mapping(self._descriptions(self._plan_state))
+            self._tail = [self._evaluate_tail(position, self._plan_state, self._mapping)
+                          for position in range(len(self.line_items) + len(self._plan_state[2]))]
+            self.result = self._assemble()
+
+    def _rule_relevant_positions(self) -> List[int]:
+        descriptions = self.plan.descriptions
+        return [position for position, item in enumerate(self.line_items)
+                if _description_key(item) in descriptions]
+
+    def _evaluate_plan(self, values: Dict[str, Any], positions: List[int]) -> tuple:
+        """Run the rule plan over the items at positions; returns (post-plan changes by position, plan results, added items)."""
+        items = self.line_items
+        if items._invalid_pages or not items:
+            # New items would be numbered by scanning every page number: run over the whole claim
+            positions = range(len(items))
+        view = IndexedLineItems(LineItemOverlay(items[position]) for position in positions)
+        if len(view) < len(items):
+            view.seed_aggregates(items)
+        context = ClaimContext()
+        self.plan.execute(self.engine, view, values, context)
+        changes = {position: dict(overlay.changes)
+                   for position, overlay in zip(positions, view) if overlay.changes}
+        added = [dict(item) for item in view[len(positions):]]
+        return changes, context.results, added
+
+    def _descriptions(self, plan_state: tuple) -> List[str]:
+        return ([item.get("description", "") for item in self.line_items]
+                + [item.get("description", "") for item in plan_state[2]])
+
+    def _replacement_mapping(self, descriptions: List[str]) -> Dict[int, tuple]:
+        """Replacements the carrier rules make, by position: ((roof_master_desc, macro_data), ...)."""
+        proxies = IndexedLineItems({"description": desc} for desc in descriptions)
+        positions = {id(proxy): position for position, proxy in enumerate(proxies)}
+        engine = self.engine
+        targets = COMPILED_REPLACEMENT_RULES.resolve_targets(engine._current_matcher(), engine.lookup_unit_price,
+                                                             engine._lookup_options())
+        mapping: Dict[int, list] = {}
+        for proxy, roof_master_desc, macro_data in COMPILED_REPLACEMENT_RULES.dispatch(proxies, targets):
+            proxies.set_description(proxy, roof_master_desc)
+            mapping.setdefault(positions[id(proxy)], []).append((roof_master_desc, macro_data))
+        return {position: tuple(replacements) for position, replacements in mapping.items()}
+
+    def _evaluate_tail(self, position: int, plan_state: tuple, mapping: Dict[int, tuple]) -> tuple:
+        """(adjusted item, price audit entries, replacements, price adjusted) for one position."""
+        changes, _, added = plan_state
+        count = len(self.line_items)
+        if position < count:
+            item = LineItemOverlay(self.line_items[position])
+            if position in changes:
+                item.changes.update(changes[position])
+        else:
+            item = dict(added[position - count])
+        replacements = mapping.get(position, ())
+        for roof_master_desc, macro_data in replacements:
+            item["description"] = roof_master_desc
+            self.engine._apply_replacement(item, macro_data)
+        results = AdjustmentResult()
+        price_adjusted = self.engine._check_unit_price(item, results)
+        adjusted = item.to_dict() if isinstance(item, LineItemOverlay) else item
+        return adjusted, results.audit_log, len(replacements), price_adjusted
+
+    def _assemble(self) -> Dict[str, Any]:
+        plan_results = self._plan_state[1]
+        results = AdjustmentResult()
+        results.adjustments = list(plan_results.adjustments)
+        results.additions = list(plan_results.additions)
+        results.warnings = list(plan_results.warnings)
+        results.audit_log = list(plan_results.audit_log)
+        results.summary = dict(plan_results.summary)
+        for _, audit_entries, _, _ in self._tail:
+            results.audit_log.extend(audit_entries)
+        result = self.engine._claim_result(list(self.line_items), [adjusted for adjusted, _, _, _ in self._tail],
+                                           results, self._metrics, self.render_text)
+        if self.catalog_version is not None:
+            result['catalog_version'] = self.catalog_version.version
+        if self.catalog_key is not None:
+            result['catalog_key'] = self.catalog_key
+        return result
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        """The replacements_made / unit_price_adjustments counters of the current result."""
+        return {'replacements_made': sum(tail[2] for tail in self._tail),
+                'unit_price_adjustments': sum(1 for tail in self._tail if tail[3])}
+
+    def update_line_item(self, position: int, **fields) -> Dict[str, Any]:
+        """Change fields of the input line item at position and re-evaluate; returns the delta."""
+        old = self.line_items[position]
+        item = dict(old)
+        item.update(fields)
+        descriptions = {_description_key(old), _description_key(item)}
+        numbering = any(field in fields for field in ("line_number", "page_number"))
+        self.line_items.replace(position, item)
+        try:
+            return self._reevaluate({position}, (), descriptions, numbering,
+                                    description_changed=len(descriptions) > 1)
+        except Exception:
+            self.line_items.replace(position, old)
+            raise
+
+    def update_metric(self, name: str, value: Any) -> Dict[str, Any]:
+        """Set a roof measurement (e.g. 'Total Roof Area') to value and re-evaluate; returns the delta."""
+        return self.update_metrics({name: value})
+
+    def update_metrics(self, values: Mapping[str, Any]) -> Dict[str, Any]:
+        """Set several roof measurements at once and re-evaluate once; returns the delta."""
+        schema = self.engine.measurement_schema
+        missing = object()
+        previous = {}
+        derive_ridges_hips = self._derive_ridges_hips
+        self._derive_ridges_hips = derive_ridges_hips or schema.aliases_ridge_hip_lengths(values)
+        for name, value in values.items():
+            name = schema.canonical_key(name) or name
+            previous.setdefault(name, self.roof_measurements.get(name, missing))
+            self.roof_measurements[name] = {"value": value}
+        try:
+            metric_keys = tuple(previous)
+            if any(name in RIDGE_HIP_LINE_KEYS for name in previous):
+                metric_keys += (RIDGES_HIPS_KEY,)
+            return self._reevaluate(set(), metric_keys, (), False)
+        except Exception:
+            self._derive_ridges_hips = derive_ridges_hips
+            for name, old in previous.items():
+                if old is missing:
+                    del self.roof_measurements[name]
+                else:
+                    self.roof_measurements[name] = old
+            raise
+
+    def _rule_measurements(self) -> Dict[str, Any]:
+        """The session's measurements as process_claim would normalize them (see MeasurementSchema.normalize)."""
+        measurements = dict(self.roof_measurements)
+        if self._derive_ridges_hips:
+            self.engine.measurement_schema.derive_ridges_hips(measurements)
+        return measurements
+
+    def _reevaluate(self, positions: set, metric_keys, descriptions, numbering: bool,
+                    description_changed: bool = False) -> Dict[str, Any]:
+        with self.engine.using_catalog(self.catalog_version):
+            return self._reevaluate_pinned(positions, metric_keys, descriptions, numbering, description_changed)
+
+    def _reevaluate_pinned(self, positions: set, metric_keys, descriptions, numbering: bool,
+                           description_changed: bool) -> Dict[str, Any]:
+        engine = self.engine
+        affected = self.plan.affected_steps(metric_keys, descriptions)
+        metrics = engine.parse_metrics(self._rule_measurements()) if metric_keys else self._metrics
+        values = metrics.values
+        plan_positions = self._rule_relevant_positions() if description_changed else self._plan_positions
+        
+        plan_state = self._plan_state
+        dirty = set(positions)
+        plan_rerun = bool(affected or numbering)
+        if plan_rerun:
+            plan_state = self._evaluate_plan(values, plan_positions)
+            # Items the plan touched before or now, and every added item
+            dirty.update(self._plan_state[0], plan_state[0])
+            count = len(self.line_items)
+            dirty.update(range(count, count + max(len(plan_state[2]), len(self._plan_state[2]))))
+        
+        mapping = self._mapping
+        if description_changed or ([item.get("description", "") for item in plan_state[2]]
+                                   != [item.get("description", "") for item in self._plan_state[2]]):
+            mapping = self._replacement_mapping(self._descriptions(plan_state))
+            dirty.update(position for position in set(mapping) | set(self._mapping)
+                         if mapping.get(position) != self._mapping.get(position))
+        
+        total = len(self.line_items) + len(plan_state[2])
+        tail = self._tail[:total] + [None] * (total - len(self._tail))
+        for position in dirty:
+            if position < total:
+                tail[position] = self._evaluate_tail(position, plan_state, mapping)
+        
+        # Commit
+        previous_plan_state, previous_tail = self._plan_state, self._tail
+        self._metrics, self._values, self._plan_positions = metrics, values, plan_positions
+        self._plan_state, self._mapping, self._tail = plan_state, mapping, tail
+        self.result = self._assemble()
+        
+        # Only the plan and the re-evaluated items can contribute to the delta
+        old_plan_results, new_plan_results = previous_plan_state[1], plan_state[1]
+        old_audit = list(old_plan_results.audit_log) if plan_rerun else []
+        new_audit = list(new_plan_results.audit_log) if plan_rerun else []
+        changed, removed = [], [entry[0] for entry in previous_tail[total:]]
+        for position in sorted(dirty | set(range(total, len(previous_tail)))):
+            old_entry = previous_tail[position] if position < len(previous_tail) else None
+            new_entry = tail[position] if position < total else None
+            if old_entry is not None:
+                old_audit.extend(old_entry[1])
+            if new_entry is not None:
+                new_audit.extend(new_entry[1])
+                if old_entry is None or new_entry[0] != old_entry[0]:
+                    changed.append(new_entry[0])
+        adjustments = (_list_delta(old_plan_results.adjustments, new_plan_results.adjustments)
+                       if plan_rerun else {'added': [], 'removed': []})
+        audit_log = _list_delta(old_audit, new_audit)
+        if self.render_text:
+            for delta, field in ((adjustments, 'reason'), (audit_log, 'explanation')):
+                for key in ('added', 'removed'):
+                    delta[key] = _rendered_entries(delta[key], field)
+            changed = _rendered_entries(changed, 'narrative')
+            removed = _rendered_entries(removed, 'narrative')
+        return {
+            'result': self.result,
+            'affected_rules': [step.rule_id for step in affected],
+            'adjustments': adjustments,
+            'audit_log': audit_log,
+            'changed_line_items': changed,
+            'removed_line_items': removed,
+        }
+
+
+BATCH_EXECUTORS = ('serial', 'thread', 'process')
+
+# Engine owned by a process-pool worker, built once by _init_batch_worker
+_BATCH_WORKER_ENGINE: Optional[RoofAdjustmentEngine] = None
+
+
+def _init_batch_worker(catalog_path: Optional[str], trace_level: str,
+                       rules: Optional[List[Dict[str, Any]]] = None, performance: bool = False,
+                       price_policy: str = 'last', fuzzy_threshold: Optional[float] = None,
+                       catalog_shards: Optional[tuple] = None, catalog_manager_path: Optional[str] = None,
+                       result_cache: Optional[tuple] = None) -> None:
+    global _BATCH_WORKER_ENGINE
+    TRACE.set_level(trace_level)
+    _BATCH_WORKER_ENGINE = RoofAdjustmentEngine(catalog_path, rules=rules, performance=performance,
+                                                result_cache=None if result_cache is None
+                                                else result_cache[0](**result_cache[1]),
+                                                price_policy=price_policy, fuzzy_threshold=fuzzy_threshold,
+                                                catalog_shards=None if catalog_shards is None
+                                                else CatalogShards(*catalog_shards),
+                                                catalog_manager=None if catalog_manager_path is None
+                                                else CatalogManager(catalog_manager_path))
+
+
+def _process_claim_chunk(engine: RoofAdjustmentEngine, chunk: List[tuple], changed_only: bool,
+                         render_text: bool = True, vectorize: bool = False) -> List[Any]:
+    """Results for a chunk of claims, with a failing claim's exception in its slot."""
+    if vectorize:
+        chunk = [(claim[0], engine.measurement_schema.normalize(claim[1])[0], *claim[2:]) for claim in chunk]
+        values_list = engine.adjustment_plan.evaluate_values_batch(
+            engine.get_metric, [claim[1] for claim in chunk])
+    else:
+        values_list = [None] * len(chunk)
+    outcomes = []
+    for claim, values in zip(chunk, values_list):
+        try:
+            outcomes.append(engine.process_claim(claim[0], claim[1], changed_only, render_text, values,
+                                                 catalog_key=claim[2] if len(claim) > 2 else None))
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def _process_claim_chunk_in_worker(chunk: List[tuple], changed_only: bool, render_text: bool = True,
+                                   vectorize: bool = False, catalog_version: Optional[tuple] = None) -> List[Any]:
+    if catalog_version is not None:
+        _BATCH_WORKER_ENGINE.catalog_manager.sync(*catalog_version)
+    return _process_claim_chunk(_BATCH_WORKER_ENGINE, chunk, changed_only, render_text, vectorize)
+
+
+def _batch_outcomes(outcomes: List[Any], return_exceptions: bool):
+    for outcome in outcomes:
+        if isinstance(outcome, Exception) and not return_exceptions:
+            raise outcome
+        yield outcome
 
 
 def load_line_items(file_path: str) -> List[Dict[str, Any]]:
@@ -1594,7 +4664,7 @@ def load_line_items(file_path: str) -> List[Dict[str, Any]]:
             raise ValueError("Invalid line items format")
             
     except Exception as e:
-        print(f"Error loading line items: {e}")
+        TRACE.error("Error loading line items: {}", e)
         sys.exit(1)
 
 
@@ -1610,40 +4680,86 @@ def load_roof_measurements(file_path: str) -> Dict[str, Any]:
             raise ValueError("Invalid roof measurements format")
             
     except Exception as e:
-        print(f"Error loading roof measurements: {e}")
+        TRACE.error("Error loading roof measurements: {}", e)
         sys.exit(1)
 
 
 def load_combined_data(file_path: str) -> tuple:
     """Load combined data from JSON file."""
     try:
-        print(f"\n🔍 DEBUG: Loading data from {file_path}")
+        TRACE.debug("\n🔍 DEBUG: Loading data from {}", file_path)
         with open(file_path, 'r') as f:
             data = json.load(f)
         
-        print(f"📊 DEBUG: Raw data structure:")
-        print(f"  Type: {type(data)}")
-        print(f"  Keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}")
+        TRACE.debug("📊 DEBUG: Raw data structure:")
+        TRACE.debug("  Type: {}", type(data))
+        TRACE.debug("  Keys: {}", list(data.keys()) if isinstance(data, dict) else 'Not a dict')
         
         # Extract line items
         line_items_data = data.get('line_items', [])
         line_items = line_items_data
-        print(f"📋 DEBUG: Line items extracted: {len(line_items)} items")
+        TRACE.debug("📋 DEBUG: Line items extracted: {} items", len(line_items))
         
         # Extract roof measurements
         roof_data = data.get('roof_measurements', {})
         roof_measurements = roof_data
-        print(f"🏠 DEBUG: Roof measurements extracted: {len(roof_measurements)} keys")
+        TRACE.debug("🏠 DEBUG: Roof measurements extracted: {} keys", len(roof_measurements))
         
         return line_items, roof_measurements
         
     except Exception as e:
-        print(f"❌ ERROR loading combined data: {e}")
-        print(f"  File path: {file_path}")
-        print(f"  Error type: {type(e).__name__}")
+        TRACE.error("❌ ERROR loading combined data: {}", e)
+        TRACE.error("  File path: {}", file_path)
+        TRACE.error("  Error type: {}", type(e).__name__)
         sys.exit(1)
 
 
+def load_batch_claims(file_path: str):
+    """Lazily yield (line_items, roof_measurements, catalog_key) from a JSON Lines file of combined inputs."""
+    with open(file_path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{file_path}:{line_number}: invalid JSON ({e})") from e
+            yield data.get('line_items', []), data.get('roof_measurements', {}), data.get('catalog_key')
+
+
+def _cli_result_cache(args) -> Optional[ResultCache]:
+    return DiskResultCache(args.cache_dir) if getattr(args, 'cache_dir', None) else None
+
+
+def _cli_catalog_shards(args) -> Optional[CatalogShards]:
+    if not getattr(args, 'catalog_dir', None):
+        return None
+    return CatalogShards(args.catalog_dir, args.catalog_memory_mb * 1024 * 1024)
+
+
+def run_batch(args) -> int:
+    """CLI batch mode: one JSON result per input line, failures recorded as {'error': ...}."""
+    engine = RoofAdjustmentEngine(result_cache=_cli_result_cache(args), performance=args.performance,
+                                  price_policy=args.price_policy, fuzzy_threshold=args.fuzzy_threshold,
+                                  catalog_shards=_cli_catalog_shards(args))
+    out = open(args.output, 'w') if args.output else sys.stdout
+    failures = 0
+    try:
+        results = engine.process_claims(load_batch_claims(args.batch), executor=args.executor,
+                                        max_workers=args.workers, chunk_size=args.chunk_size,
+                                        return_exceptions=True, vectorize=args.vectorize)
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                failures += 1
+                TRACE.error("❌ Claim {} failed: {}: {}", index, type(result).__name__, result)
+                result = {'error': str(result), 'error_type': type(result).__name__}
+            out.write(json.dumps(result) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return failures
+
+
 def print_results(results: Dict[str, Any]):
     """Print formatted results."""
     
@@ -1707,51 +4823,101 @@ def print_results(results: Dict[str, Any]):
 
 def main():
     """Main function."""
-    print(f"\n🚀 PYTHON RULE ENGINE STARTING...")
-    print(f"  Python version: {sys.version}")
-    print(f"  Working directory: {os.getcwd()}")
-    
     parser = argparse.ArgumentParser(description='Insurance Claim Roof Adjustment Engine')
     parser.add_argument('--line-items', help='Path to line items JSON file')
     parser.add_argument('--roof-data', help='Path to roof measurements JSON file')
     parser.add_argument('--input', help='Path to combined input JSON file')
-    parser.add_argument('--output', help='Path to output JSON file (optional)')
+    parser.add_argument('--batch', help='Path to a JSON Lines file of combined inputs, one claim per line')
+    parser.add_argument('--executor', choices=list(BATCH_EXECUTORS), default='serial',
+                        help='How --batch claims are executed (default: serial)')
+    parser.add_argument('--workers', type=int, help='Worker count for thread/process batch execution')
+    parser.add_argument('--chunk-size', type=int, default=16, help='Claims handed to a worker at a time')
+    parser.add_argument('--vectorize', action='store_true',
+                        help='Evaluate metric values per chunk in one pass (uses NumPy if installed)')
+    parser.add_argument('--cache-dir', help='Directory for a persistent result cache (default: no caching)')
+    parser.add_argument('--price-policy', default='last',
+                        help="Price row for descriptions listed more than once: last, first, max, min, "
+                             "tier:<name> or region:<name> (default: last)")
+    parser.add_argument('--catalog-dir', help='Directory of per-carrier / per-region catalogs (<key>.csv)')
+    parser.add_argument('--catalog-key', help='Catalog of --catalog-dir to price the claim with '
+                                              '(batch lines give theirs as "catalog_key")')
+    parser.add_argument('--catalog-memory-mb', type=int, default=64,
+                        help='Memory budget for resident --catalog-dir catalogs (default: 64)')
+    parser.add_argument('--fuzzy-threshold', type=float,
+                        help='Match catalog descriptions by similarity at or above this score (0-1)')
+    parser.add_argument('--performance', action='store_true',
+                        help='Add per-rule timing and firing counters to each result')
+    parser.add_argument('--output', help='Path to output JSON file (optional; JSON Lines with --batch)')
+    parser.add_argument('--compile-catalog', metavar='CSV',
+                        help='Compile a Roof Master Macro CSV into its binary catalog artifact and exit')
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
+    parser.add_argument('--trace-level', choices=list(TRACE_LEVELS), default=TRACE.level,
+                        help='Trace level written to stderr (default: $ROOF_ENGINE_TRACE_LEVEL or warning)')
+    parser.add_argument('--trace-file', help='Also append trace records to this JSONL file')
     
     args = parser.parse_args()
     
-    print(f"\n📋 COMMAND LINE ARGUMENTS:")
-    print(f"  Input file: {args.input}")
-    print(f"  Line items file: {args.line_items}")
-    print(f"  Roof data file: {args.roof_data}")
-    print(f"  Output file: {args.output}")
-    print(f"  Verbose: {args.verbose}")
+    TRACE.set_level(args.trace_level)
+    if args.trace_file:
+        TRACE.sinks.append(JsonlTraceSink(args.trace_file))
+    
+    TRACE.info("\n🚀 PYTHON RULE ENGINE STARTING...")
+    TRACE.debug("  Python version: {}", sys.version)
+    TRACE.debug("  Working directory: {}", os.getcwd())
+    
+    TRACE.debug("\n📋 COMMAND LINE ARGUMENTS:")
+    TRACE.debug("  Input file: {}", args.input)
+    TRACE.debug("  Line items file: {}", args.line_items)
+    TRACE.debug("  Roof data file: {}", args.roof_data)
+    TRACE.debug("  Output file: {}", args.output)
+    TRACE.debug("  Verbose: {}", args.verbose)
+    
+    if args.compile_catalog:
+        try:
+            artifact_path = compile_catalog_artifact(args.compile_catalog, args.output)
+        except Exception as e:
+            TRACE.error("\n❌ FATAL ERROR: {}", e)
+            sys.exit(1)
+        TRACE.info("✅ Compiled catalog artifact: {}", artifact_path)
+        sys.exit(0)
+    
+    if args.batch:
+        try:
+            failures = run_batch(args)
+        except Exception as e:
+            TRACE.error("\n❌ FATAL ERROR: {}", e)
+            TRACE.exception("  Traceback:")
+            sys.exit(1)
+        TRACE.info("\n🎉 BATCH COMPLETED ({} failed claims)", failures)
+        sys.exit(1 if failures else 0)
     
     if not args.input and not (args.line_items and args.roof_data):
-        parser.error("Either --input or both --line-items and --roof-data must be specified")
+        parser.error("Either --input, --batch or both --line-items and --roof-data must be specified")
     
     try:
         # Load data
         if args.input:
-            print(f"\n📁 Loading combined data from: {args.input}")
+            TRACE.debug("\n📁 Loading combined data from: {}", args.input)
             line_items, roof_measurements = load_combined_data(args.input)
         else:
-            print(f"\n📁 Loading separate files:")
-            print(f"  Line items: {args.line_items}")
-            print(f"  Roof data: {args.roof_data}")
+            TRACE.debug("\n📁 Loading separate files:")
+            TRACE.debug("  Line items: {}", args.line_items)
+            TRACE.debug("  Roof data: {}", args.roof_data)
             line_items = load_line_items(args.line_items)
             roof_measurements = load_roof_measurements(args.roof_data)
         
-        print(f"\n✅ DATA LOADED SUCCESSFULLY")
-        print(f"  Line items: {len(line_items)}")
-        print(f"  Roof measurements: {len(roof_measurements)} keys")
+        TRACE.debug("\n✅ DATA LOADED SUCCESSFULLY")
+        TRACE.debug("  Line items: {}", len(line_items))
+        TRACE.debug("  Roof measurements: {} keys", len(roof_measurements))
         
         # Process claim
-        print(f"\n⚙️ STARTING CLAIM PROCESSING...")
-        engine = RoofAdjustmentEngine()
-        results = engine.process_claim(line_items, roof_measurements)
+        TRACE.info("\n⚙️ STARTING CLAIM PROCESSING...")
+        engine = RoofAdjustmentEngine(result_cache=_cli_result_cache(args), performance=args.performance,
+                                      price_policy=args.price_policy, fuzzy_threshold=args.fuzzy_threshold,
+                                      catalog_shards=_cli_catalog_shards(args))
+        results = engine.process_claim(line_items, roof_measurements, catalog_key=args.catalog_key)
         
-        print(f"\n🎉 PROCESSING COMPLETED SUCCESSFULLY!")
+        TRACE.info("\n🎉 PROCESSING COMPLETED SUCCESSFULLY!")
         
         # Print results
         if args.verbose:
@@ -1759,19 +4925,17 @@ def main():
         
         # Save results if output file specified
         if args.output:
-            print(f"\n💾 SAVING RESULTS TO: {args.output}")
+            TRACE.info("\n💾 SAVING RESULTS TO: {}", args.output)
             with open(args.output, 'w') as f:
                 json.dump(results, f, indent=2)
-            print(f"✅ Results saved successfully")
+            TRACE.info("✅ Results saved successfully")
         
         return results
         
     except Exception as e:
-        print(f"\n❌ FATAL ERROR: {e}")
-        print(f"  Error type: {type(e).__name__}")
-        import traceback
-        print(f"  Traceback:")
-        traceback.print_exc()
+        TRACE.error("\n❌ FATAL ERROR: {}", e)
+        TRACE.error("  Error type: {}", type(e).__name__)
+        TRACE.exception("  Traceback:")
         sys.exit(1)
 
 
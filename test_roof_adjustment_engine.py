@@ -0,0 +1,1003 @@
+#!/usr/bin/env python3
+"""
+Roof Adjustment Engine Tests
+Regression tests for the rule engine (run with pytest, or directly)
+"""
+
+import copy
+import json
+import os
+import pickle
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import roof_adjustment_engine as engine_module
+from roof_adjustment_engine import RoofAdjustmentEngine
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_DATA = os.path.join(HERE, 'sample_data.json')
+GOLDEN_CLAIMS = os.path.join(HERE, 'test_fixtures', 'golden_claims.json')
+STEEP_7_9 = "Additional charge for steep roof - 7/12 to 9/12 slope"
+RIDGE_VENT = "Continuous ridge vent - Detach & reset"
+CATALOG_CSV = """Description,Unit,Unit Price
+Laminated - comp. shingle rfg. - w/out felt,SQ,77.13
+Drip edge,LF,3.21
+Continuous ridge vent - Detach & reset,LF,9.5
+"""
+
+
+def make_engine(**kwargs):
+    """Engine with tracing off and, unless one is given, no result cache."""
+    kwargs.setdefault('result_cache', engine_module.ResultCache())
+    return RoofAdjustmentEngine(trace=engine_module.EngineTrace('off'), **kwargs)
+
+
+def find_item(line_items, description):
+    return next(item for item in line_items if item['description'] == description)
+
+
+def load_golden_claims():
+    with open(GOLDEN_CLAIMS) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('claim', load_golden_claims(), ids=lambda claim: f"{len(claim['line_items'])}-items")
+def test_golden_claims_match_baseline(claim):
+    """The compiled adjustment plan reproduces the hand-written apply_logic on recorded claims.
+
+    Expected values, audit logs included, were recorded from the engine
+    before the rule table existed. Audit timestamps and the later
+    catalog_match records are not compared.
+    """
+    result = make_engine().process_claim(claim['line_items'], claim['roof_measurements'])
+    results = result['adjustment_results']
+    expected = claim['expected']
+
+    assert result['adjusted_line_items'] == expected['adjusted_line_items']
+    assert results['additions'] == expected['additions']
+    assert results['adjustments'] == expected['adjustments']
+    assert results['warnings'] == expected['warnings']
+    assert result['roof_measurements'] == expected['roof_measurements']
+    audit_log = [{key: value for key, value in entry.items() if key not in ('timestamp', 'catalog_match')}
+                 for entry in result['audit_log']]
+    assert audit_log == expected['audit_log']
+
+
+def test_rule_table_compiles_once_per_version_and_drives_the_engine():
+    """Equal rule tables share one compiled plan; an engine follows the rule table it is given."""
+    rules = copy.deepcopy(engine_module.ADJUSTMENT_RULES)
+    assert engine_module.compile_adjustment_plan(rules) is engine_module.ADJUSTMENT_PLAN
+
+    line_items = [{'line_number': '1', 'description': 'Drip edge', 'quantity': 10.0, 'unit': 'LF',
+                   'unit_price': 3.21, 'RCV': 32.1, 'dep_percent': 0, 'ACV': 32.1, 'page_number': 1}]
+    roof_measurements = {"Total Eaves Length": {"value": 100}, "Total Rakes Length": {"value": 50}}
+    default = make_engine().process_claim(line_items, roof_measurements)
+    without_drip_edge = make_engine(rules=[rule for rule in rules if rule['id'] != 'drip_edge'])
+    custom = without_drip_edge.process_claim(line_items, roof_measurements)
+
+    # The carrier replacement rules rename the item afterwards, so it is read by position
+    assert default['adjusted_line_items'][0]['quantity'] == 150
+    assert custom['adjusted_line_items'][0]['quantity'] == 10.0
+    assert without_drip_edge.adjustment_plan.version != engine_module.ADJUSTMENT_PLAN.version
+
+    for bad_rule, message in [({'quantity': 'no_such_value'}, "unknown quantity"),
+                              ({'update': 'halve'}, "unknown update"),
+                              ({'when': ('sometimes',)}, "unknown guard")]:
+        with pytest.raises(ValueError, match=message):
+            engine_module.compile_adjustment_plan(
+                [{'id': 'bad', 'targets': ('Drip edge',), 'quantity': 1.0, 'reason': 'x', **bad_rule}])
+
+
+def fresh_result(engine, line_items, roof_measurements):
+    result = engine.process_claim(copy.deepcopy(line_items), roof_measurements)
+    result.pop('provenance', None)
+    return json.dumps(result, sort_keys=True)
+
+
+def test_find_item_index_matches_linear_scan():
+    """Indexed find_item returns the same item as a linear scan, through appends and description rewrites."""
+    rnd = random.Random(1)
+    engine = make_engine()
+    names = ['Drip edge', ' Drip edge ', RIDGE_VENT, STEEP_7_9, 'Ridge cap']
+    plain = [{'description': rnd.choice(names), 'line_number': str(number)} for number in range(40)]
+    indexed = engine_module.IndexedLineItems(plain)
+    for _ in range(100):
+        if rnd.random() < 0.5:
+            item = {'description': rnd.choice(names), 'line_number': str(len(plain))}
+            plain.append(item)
+            indexed.append(item)
+        else:
+            indexed.set_description(rnd.choice(indexed), rnd.choice(names))
+        for name in names + ['Missing item']:
+            assert engine.find_item(indexed, name) is engine.find_item(plain, name)
+
+
+def linear_lookup(catalog, description):
+    """The original lookup_unit_price: a scan of the whole catalog per lookup."""
+    if description in catalog:
+        return catalog[description]
+
+    def normalize_desc(desc):
+        return re.sub(r'\s+', ' ', re.sub(r'\s*-\s*', ' ', desc)).strip().lower()
+
+    normalized_input = normalize_desc(description)
+    is_removal_input = description.lower().startswith('remove')
+    same_operation, opposite_operation = [], []
+    for macro_desc, data in catalog.items():
+        normalized_macro = normalize_desc(macro_desc)
+        if normalized_input in normalized_macro or normalized_macro in normalized_input:
+            if is_removal_input == macro_desc.lower().startswith('remove'):
+                same_operation.append(data)
+            else:
+                opposite_operation.append(data)
+    if same_operation or opposite_operation:
+        return (same_operation or opposite_operation)[0]
+    description_lower = description.lower()
+    for macro_desc, data in catalog.items():
+        if description_lower in macro_desc.lower() or macro_desc.lower() in description_lower:
+            return data
+    return {'unit_price': 0.0, 'rcv': 0.0, 'acv': 0.0, 'unit': 'SQ'}
+
+
+def test_catalog_matcher_matches_linear_lookup():
+    """lookup_unit_price returns what the original full-catalog scan returns, in its priority order."""
+    rnd = random.Random(2)
+    engine = make_engine()
+    catalog = engine.catalog.entries
+    descriptions = list(catalog)
+    queries = ['', '-', 'zz no such item zz', 'REMOVE', 'felt']
+    for _ in range(400):
+        desc = rnd.choice(descriptions)
+        start = rnd.randrange(len(desc))
+        queries.extend([
+            desc[start:start + rnd.randint(1, 30)],
+            desc.upper(),
+            desc.replace(' - ', '-').replace(' ', '  '),
+            'Remove ' + desc,
+            desc + ' ' + rnd.choice(descriptions),
+            rnd.choice(['R&R ', 'Detach & reset ', '']) + desc.lower(),
+        ])
+    for query in queries:
+        assert dict(engine.lookup_unit_price(query)) == dict(linear_lookup(catalog, query)), query
+
+
+def test_catalog_registry_shares_catalogs_until_content_changes(tmp_path):
+    """A catalog file is parsed once, shared read-only, kept on a bare mtime change and reloaded on new content."""
+    csv_path = tmp_path / 'roof_master_macro.csv'
+    csv_path.write_text(CATALOG_CSV)
+    registry = engine_module.CatalogRegistry()
+    catalog = registry.get(str(csv_path))
+
+    assert registry.get(str(csv_path)) is catalog
+    with pytest.raises(TypeError):
+        catalog.entries['Drip edge'] = {'unit_price': 0.0}
+    with pytest.raises(TypeError):
+        catalog.entries['Drip edge']['unit_price'] = 0.0
+
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert registry.get(str(csv_path)) is catalog
+
+    csv_path.write_text(CATALOG_CSV.replace('Drip edge,LF,3.21', 'Drip edge,LF,4.5'))
+    reloaded = registry.get(str(csv_path))
+    assert reloaded is not catalog
+    assert reloaded.entries['Drip edge']['unit_price'] == 4.5
+    assert catalog.entries['Drip edge']['unit_price'] == 3.21
+
+
+def test_replacement_dispatch_matches_sequential_rules():
+    """The compiled carrier replacement dispatch replaces the same items as the original nested loops."""
+    rnd = random.Random(4)
+    engine = make_engine()
+    rules = engine_module.REPLACEMENT_RULES
+    patterns = [pattern for carrier_patterns, _ in rules for pattern in carrier_patterns]
+    targets = [target for _, target in rules]
+    compiled = engine_module.COMPILED_REPLACEMENT_RULES
+    resolved = compiled.resolve_targets(engine._current_matcher(), engine.lookup_unit_price, engine._lookup_options())
+    for _ in range(300):
+        descriptions = []
+        for _ in range(rnd.randint(1, 8)):
+            pattern = rnd.choice(patterns + targets)
+            start = rnd.randrange(len(pattern))
+            descriptions.append(rnd.choice([
+                pattern, f" {pattern} ", pattern[start:start + rnd.randint(3, 25)],
+                f"{pattern} - extra", 'Unrelated item', '']))
+        expected = [{'description': desc, 'quantity': 1.0, 'unit_price': 1.0} for desc in descriptions]
+        for carrier_patterns, roof_master_desc in rules:
+            for carrier_pattern in carrier_patterns:
+                for item in expected:
+                    item_desc = item['description'].strip()
+                    if carrier_pattern in item_desc or item_desc in carrier_pattern:
+                        macro_data = engine.lookup_unit_price(roof_master_desc)
+                        if macro_data['unit_price'] > 0:
+                            item['description'] = roof_master_desc
+                            engine._apply_replacement(item, macro_data)
+                            break
+
+        line_items = engine_module.IndexedLineItems(
+            {'description': desc, 'quantity': 1.0, 'unit_price': 1.0} for desc in descriptions)
+        for item, roof_master_desc, macro_data in compiled.dispatch(line_items, resolved):
+            line_items.set_description(item, roof_master_desc)
+            engine._apply_replacement(item, macro_data)
+        assert list(line_items) == expected, descriptions
+
+
+def test_process_claim_leaves_input_untouched_and_shares_unmodified_items():
+    """Input items are never written; untouched items are shared, and changed_only returns exactly the others."""
+    engine = make_engine()
+    shared_total = 0
+    for claim in load_golden_claims():
+        line_items = claim['line_items']
+        snapshot = copy.deepcopy(line_items)
+        result = engine.process_claim(line_items, claim['roof_measurements'])
+        changed = engine.process_claim(line_items, claim['roof_measurements'], changed_only=True)
+
+        assert line_items == snapshot
+        adjusted = result['adjusted_line_items']
+        shared = [any(item is original for original in line_items) for item in adjusted]
+        assert changed['adjusted_line_items'] == [item for item, is_shared in zip(adjusted, shared) if not is_shared]
+        shared_total += sum(shared)
+    assert shared_total > 0
+
+
+def test_line_item_overlay_copies_on_write():
+    """Writes and deletes stay in the overlay; the base dict is never modified."""
+    base = {'description': 'Drip edge', 'quantity': 10.0, 'unit': 'LF'}
+    overlay = engine_module.LineItemOverlay(base)
+    assert overlay.to_dict() is base
+
+    overlay['quantity'] = 12.5
+    overlay['narrative'] = 'raised'
+    del overlay['unit']
+
+    assert base == {'description': 'Drip edge', 'quantity': 10.0, 'unit': 'LF'}
+    assert overlay.to_dict() == {'description': 'Drip edge', 'quantity': 12.5, 'narrative': 'raised'}
+    assert 'unit' not in overlay and overlay.get('unit', 'EA') == 'EA'
+    assert len(overlay) == 3
+    with pytest.raises(KeyError):
+        del overlay['unit']
+
+
+class _Unformattable:
+    def __format__(self, spec):
+        raise AssertionError("trace argument formatted")
+
+
+def test_trace_formats_nothing_below_its_level(tmp_path, capsys):
+    """Disabled levels never format their arguments; enabled records reach every sink, and stdout stays clean."""
+    memory = engine_module.MemoryTraceSink()
+    jsonl_path = tmp_path / 'trace.jsonl'
+    trace = engine_module.EngineTrace('warning', [memory, engine_module.JsonlTraceSink(str(jsonl_path))])
+
+    trace.debug("dump {}", _Unformattable())
+    trace.info("dump {}", _Unformattable())
+    trace.warning("{} unrecognized keys", 2)
+    assert memory.messages == ["2 unrecognized keys"]
+    assert [json.loads(line)['message'] for line in jsonl_path.read_text().splitlines()] == ["2 unrecognized keys"]
+
+    claim = load_golden_claims()[0]
+    quiet = engine_module.MemoryTraceSink()
+    RoofAdjustmentEngine(trace=engine_module.EngineTrace('warning', [quiet]),
+                         result_cache=engine_module.ResultCache()).process_claim(claim['line_items'],
+                                                                                 claim['roof_measurements'])
+    verbose = engine_module.MemoryTraceSink()
+    RoofAdjustmentEngine(trace=engine_module.EngineTrace('debug', [verbose]),
+                         result_cache=engine_module.ResultCache()).process_claim(claim['line_items'],
+                                                                                 claim['roof_measurements'])
+    assert {record.level for record in quiet.records} <= {'warning', 'error'}
+    assert {record.level for record in verbose.records} >= {'debug', 'info'}
+    assert all(isinstance(message, str) for message in verbose.messages)
+    assert capsys.readouterr().out == ''
+
+
+def test_shared_engine_is_safe_across_threads_and_calls():
+    """One engine serves concurrent claims, and repeated calls do not accumulate results."""
+    engine = make_engine()
+    claims = [(claim['line_items'], claim['roof_measurements']) for claim in load_golden_claims()] * 8
+    expected = [fresh_result(make_engine(), *claim) for claim in claims]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda claim: fresh_result(engine, *claim), claims))
+
+    assert results == expected
+    assert fresh_result(engine, *claims[0]) == expected[0]
+
+
+def test_lazy_rule_texts_render_to_the_eager_result():
+    """render_text=False keeps RuleText values that render, on demand or in JSON, to the eager text."""
+    engine = make_engine()
+    saw_rule_text = False
+    for claim in load_golden_claims():
+        eager = engine.process_claim(claim['line_items'], claim['roof_measurements'])
+        lazy = engine.process_claim(claim['line_items'], claim['roof_measurements'], render_text=False)
+        reasons = [adjustment['reason'] for adjustment in lazy['adjustment_results']['adjustments']]
+        saw_rule_text |= any(isinstance(reason, engine_module.RuleText) for reason in reasons)
+
+        assert engine_module.render_rule_texts(lazy) == eager
+        assert json.dumps(lazy, default=engine_module.rule_text_json, sort_keys=True) == json.dumps(eager, sort_keys=True)
+        assert all(isinstance(reason, str) for reason in
+                   (adjustment['reason'] for adjustment in eager['adjustment_results']['adjustments']))
+    assert saw_rule_text
+
+
+def test_pitch_band_areas_match_direct_sums():
+    """band_area over any pitch range equals summing the reported pitch areas directly, for any pitch."""
+    rnd = random.Random(16)
+    engine = make_engine()
+    for _ in range(100):
+        areas = {}
+        roof_measurements = {"Total Roof Area": {"value": 3000}}
+        for pitch in rnd.sample(range(0, 21), rnd.randint(0, 8)):
+            area = rnd.choice([0, rnd.randint(1, 2000), 'n/a'])
+            plus = rnd.random() < 0.2
+            key = rnd.choice([f"Area for Pitch {pitch}/12{'+' if plus else ''} (sq ft)",
+                              f"areaPitch{pitch}_12{'_plus' if plus else ''}"])
+            roof_measurements[key] = {"value": area}
+            bucket = pitch + 1 if plus else pitch
+            areas[bucket] = areas.get(bucket, 0) + (area if isinstance(area, int) else 0)
+        # The histogram alone: the rules' own sums reject non-numeric areas, as before
+        metrics = engine_module.RoofMetrics(engine.measurement_schema.normalize(roof_measurements)[0], {})
+
+        assert {pitch: area for pitch, area in metrics.pitch_areas.items() if area} == \
+            {pitch: area for pitch, area in areas.items() if area}
+        for _ in range(10):
+            low, high = rnd.choice([None, rnd.randint(-2, 23)]), rnd.choice([None, rnd.randint(-2, 23)])
+            expected = sum(area for pitch, area in areas.items()
+                           if (low is None or pitch >= low) and (high is None or pitch <= high))
+            assert metrics.band_area(low, high) == expected, (roof_measurements, low, high)
+
+
+def test_claim_session_random_edits_match_full_run():
+    """After every random edit, a ClaimSession's result equals a fresh process_claim of the edited claim."""
+    rnd = random.Random(12)
+    engine = make_engine()
+    descriptions = sorted({desc for rule in engine_module.ADJUSTMENT_RULES for desc in rule['targets']})
+    metric_keys = [key for _, key in engine_module.ROOF_METRICS]
+    edits = 0
+    for claim in load_golden_claims():
+        line_items = copy.deepcopy(claim['line_items'])
+        roof_measurements = copy.deepcopy(claim['roof_measurements'])
+        if rnd.random() < 0.5:
+            # Ridge length in camelCase, so the combined length is derived from it
+            del roof_measurements["Total Ridges/Hips Length"]
+            roof_measurements['ridgeLength'] = roof_measurements.pop("Total Line Lengths (Ridges)", {"value": 30})
+        session = engine.open_claim(line_items, roof_measurements)
+        assert json.dumps(session.result, sort_keys=True) == fresh_result(engine, line_items, roof_measurements)
+        for _ in range(12):
+            if rnd.random() < 0.4:
+                key = rnd.choice(metric_keys)
+                value = rnd.choice([0, rnd.randint(0, 3000), round(rnd.uniform(0, 3000), 1)])
+                roof_measurements[key] = {"value": value}
+                delta = session.update_metric(key, value)
+            else:
+                position = rnd.randrange(len(line_items))
+                field, value = rnd.choice([
+                    ('quantity', round(rnd.uniform(0, 40), 2)),
+                    ('unit_price', round(rnd.uniform(0, 100), 2)),
+                    ('description', rnd.choice(descriptions)),
+                    ('line_number', str(rnd.randint(1, 80))),
+                    ('page_number', rnd.randint(1, 5)),
+                    ('dep_percent', rnd.choice([0, 5, 10])),
+                ])
+                line_items[position] = dict(line_items[position], **{field: value})
+                delta = session.update_line_item(position, **{field: value})
+            expected = fresh_result(engine, line_items, roof_measurements)
+            assert json.dumps(session.result, sort_keys=True) == expected
+            assert json.dumps(delta['result'], sort_keys=True) == expected
+            edits += 1
+    assert edits == 12 * len(load_golden_claims())
+
+
+def batch_outcomes(engine, claims, **kwargs):
+    outcomes = []
+    for outcome in engine.process_claims(copy.deepcopy(claims), return_exceptions=True, **kwargs):
+        if isinstance(outcome, Exception):
+            outcomes.append(repr(outcome))
+        else:
+            outcome.pop('provenance', None)
+            outcomes.append(json.dumps(outcome, sort_keys=True))
+    return outcomes
+
+
+def test_process_claims_executors_match_process_claim():
+    """Every executor yields process_claim's results in input order, failures in their slots."""
+    engine = make_engine()
+    claims = [(claim['line_items'], claim['roof_measurements']) for claim in load_golden_claims()]
+    claims.insert(3, (None, {}))
+    expected = []
+    for line_items, roof_measurements in claims:
+        try:
+            expected.append(fresh_result(make_engine(), line_items, roof_measurements))
+        except Exception as e:
+            expected.append(repr(e))
+
+    assert batch_outcomes(engine, claims) == expected
+    assert batch_outcomes(engine, claims, executor='thread', max_workers=3, chunk_size=2) == expected
+    assert batch_outcomes(engine, claims, executor='process', max_workers=2, chunk_size=3) == expected
+    with pytest.raises(TypeError):
+        list(engine.process_claims(claims))
+
+
+def test_process_claims_reads_claims_lazily():
+    """A pooled batch holds at most max_in_flight chunks, so an endless claim stream works."""
+    claim = load_golden_claims()[0]
+    consumed = 0
+
+    def endless_claims():
+        nonlocal consumed
+        while True:
+            consumed += 1
+            yield claim['line_items'], claim['roof_measurements']
+
+    results = make_engine().process_claims(endless_claims(), executor='thread', max_workers=2,
+                                           chunk_size=3, max_in_flight=2)
+    first = [next(results) for _ in range(7)]
+    results.close()
+
+    assert len(first) == 7
+    assert consumed <= len(first) + 3 * 2  # Claims yielded, plus at most max_in_flight chunks
+
+
+def vectorize_claims():
+    """Golden claims plus measurements of mixed value types (ints, floats, strings, None, huge ints)."""
+    rnd = random.Random(15)
+    metric_keys = [key for _, key in engine_module.ROOF_METRICS]
+    claims = [(claim['line_items'], claim['roof_measurements']) for claim in load_golden_claims()]
+    for line_items, _ in list(claims):
+        for _ in range(3):
+            roof_measurements = {key: {"value": rnd.choice([0, rnd.randint(0, 3000), rnd.uniform(0, 3000)])}
+                                 for key in metric_keys if rnd.random() < 0.8}
+            if rnd.random() < 0.3:
+                roof_measurements[rnd.choice(metric_keys)] = {"value": rnd.choice(['1200', None, 2 ** 60])}
+            claims.append((line_items, roof_measurements))
+    return claims
+
+
+def test_what_if_variants_match_fresh_runs():
+    """Each what-if row reports the totals of a fresh process_claim on the perturbed measurements."""
+    engine = make_engine()
+    variants = [{'Total Roof Area': ('scale', 1.05)}, {'totalEavesLength': ('add', 10)},
+                {'Total Roof Area': ('cube', 2)}, {'Total Roof Area': 0, 'Total Rakes Length': ('set', 40)}]
+    for claim in load_golden_claims():
+        roof_measurements = claim['roof_measurements']
+        table = engine.what_if(claim['line_items'], roof_measurements, variants)
+
+        assert table['variants'][2]['error'].startswith('ValueError')
+        for variant, row in zip(variants, table['variants']):
+            if 'error' in row:
+                continue
+            perturbed = dict(roof_measurements)
+            for key, value in row['measurements'].items():
+                perturbed[key] = {'value': value}
+            base_value = engine.get_metric(roof_measurements, 'Total Roof Area')
+            if 'Total Roof Area' in variant and variant['Total Roof Area'] != 0:
+                assert row['measurements']['Total Roof Area'] == base_value * 1.05
+            fresh = engine.process_claim(claim['line_items'], perturbed)
+            fresh_items = fresh['adjusted_line_items']
+            assert row['rcv_total'] == sum(float(item.get('RCV') or 0) for item in fresh_items)
+            assert row['acv_total'] == sum(float(item.get('ACV') or 0) for item in fresh_items)
+            assert row['line_items'] == len(fresh_items)
+            assert row['adjustments'] == fresh['adjustment_results']['summary']['total_adjustments']
+
+
+def test_vectorized_batch_matches_serial(monkeypatch):
+    """process_claims(vectorize=True) gives the serial results, with NumPy and without it."""
+    engine = make_engine()
+    claims = vectorize_claims()
+    serial = batch_outcomes(engine, claims)
+
+    assert batch_outcomes(engine, claims, vectorize=True, chunk_size=7) == serial
+    monkeypatch.setattr(engine_module, 'np', None)
+    assert batch_outcomes(engine, claims, vectorize=True, chunk_size=7) == serial
+
+
+class _ReloadingSink:
+    """Trace sink that swaps a new catalog in once, while a claim is being processed."""
+
+    def __init__(self, csv_path, manager):
+        self.csv_path, self.manager, self.reloaded = csv_path, manager, False
+
+    def emit(self, record):
+        if not self.reloaded and 'APPLYING BUSINESS RULES' in record.template:
+            self.csv_path.write_text(CATALOG_CSV.replace('Drip edge,LF,3.21', 'Drip edge,LF,13.21'))
+            self.reloaded = self.manager.reload()
+
+
+def test_catalog_manager_swaps_versions_without_disturbing_claims_in_flight(tmp_path):
+    """A reload mid-claim only affects later claims; unchanged or empty sources keep the current version."""
+    csv_path = tmp_path / 'roof_master_macro.csv'
+    csv_path.write_text(CATALOG_CSV)
+    manager = engine_module.CatalogManager(str(csv_path), registry=engine_module.CatalogRegistry())
+    sink = _ReloadingSink(csv_path, manager)
+    engine = RoofAdjustmentEngine(trace=engine_module.EngineTrace('debug', [sink]),
+                                  result_cache=engine_module.ResultCache(), catalog_manager=manager)
+    line_items = [{'line_number': '1', 'description': 'Drip edge', 'quantity': 10.0, 'unit': 'LF',
+                   'unit_price': 1.0, 'RCV': 10.0, 'dep_percent': 0, 'ACV': 10.0, 'page_number': 1}]
+
+    assert not manager.reload()
+    in_flight = engine.process_claim(line_items, {"Total Roof Area": {"value": 1500}})
+    later = engine.process_claim(line_items, {"Total Roof Area": {"value": 1500}})
+
+    assert sink.reloaded and manager.version == 2
+    assert (in_flight['catalog_version'], in_flight['adjusted_line_items'][0]['unit_price']) == (1, 3.21)
+    assert (later['catalog_version'], later['adjusted_line_items'][0]['unit_price']) == (2, 13.21)
+
+    csv_path.write_text("Description,Unit,Unit Price\n")
+    assert not manager.reload()
+    assert manager.version == 2
+
+
+def test_process_workers_follow_catalog_manager(tmp_path):
+    """Process workers price against the manager's current version and pick up a reload mid-batch."""
+    csv_path = tmp_path / 'roof_master_macro.csv'
+    csv_path.write_text(CATALOG_CSV)
+    manager = engine_module.CatalogManager(str(csv_path), registry=engine_module.CatalogRegistry())
+    engine = make_engine(catalog_manager=manager)
+    line_items = [{'line_number': '1', 'description': 'Drip edge', 'quantity': 10.0, 'unit': 'LF',
+                   'unit_price': 1.0, 'RCV': 10.0, 'dep_percent': 0, 'ACV': 10.0, 'page_number': 1}]
+
+    def claims():
+        yield line_items, {"Total Roof Area": {"value": 1500}}
+        csv_path.write_text(CATALOG_CSV.replace('Drip edge,LF,3.21', 'Drip edge,LF,13.21'))
+        assert manager.reload()
+        yield line_items, {"Total Roof Area": {"value": 1500}}
+
+    results = list(engine.process_claims(claims(), executor='process', max_workers=1,
+                                         chunk_size=1, max_in_flight=1))
+
+    assert [result['catalog_version'] for result in results] == [1, 2]
+    assert [result['adjusted_line_items'][0]['unit_price'] for result in results] == [3.21, 13.21]
+
+
+def test_process_workers_use_the_engine_result_cache(tmp_path):
+    """Process workers rebuild a disk cache from its directory; a cache they cannot rebuild is refused."""
+    cache_dir = tmp_path / 'results'
+    engine = make_engine(result_cache=engine_module.DiskResultCache(str(cache_dir)))
+    claims = [(claim['line_items'], claim['roof_measurements']) for claim in load_golden_claims()[:3]]
+
+    first = list(engine.process_claims(claims, executor='process', max_workers=2, chunk_size=1))
+    assert len(os.listdir(cache_dir)) == 3
+    second = list(engine.process_claims(claims, executor='process', max_workers=2, chunk_size=1))
+    assert [result['provenance']['source'] for result in second] == ['cache'] * 3
+    assert [result['adjusted_line_items'] for result in second] == [result['adjusted_line_items'] for result in first]
+
+    engine.result_cache = engine_module.RedisResultCache(client=object())
+    with pytest.raises(ValueError, match='process workers'):
+        next(engine.process_claims(claims, executor='process'))
+
+
+def test_steep_max_reduction_keeps_narrative():
+    """The unrounded max rule wins the raise, but the steep rule's narrative and explanation stay."""
+    roof_measurements = {
+        "Area for Pitch 7/12 (sq ft)": {"value": 1596},
+        "Area for Pitch 8/12 (sq ft)": {"value": 2041.4},
+        "Area for Pitch 9/12 (sq ft)": {"value": 3448},
+    }
+    line_items = [{
+        "line_number": "1", "description": STEEP_7_9, "quantity": 10.0, "unit": "SQ",
+        "unit_price": 17.45, "RCV": 174.5, "ACV": 174.5, "page_number": 1,
+        "dep_percent": 0, "depreciation_amount": 0,
+    }]
+    result = make_engine().process_claim(line_items, roof_measurements)
+
+    item = find_item(result['adjusted_line_items'], STEEP_7_9)
+    assert item['quantity'] == 70.854
+    assert item['narrative'] == ("Field Changed: quantity |Explanation: Steep roof charge adjusted to match "
+                                 "steep roof area calculation (7/12-9/12 slopes = 70.85 SQ)")
+    audit = [entry for entry in result['audit_log']
+             if entry['description'] == STEEP_7_9 and entry['field'] == 'quantity']
+    assert len(audit) == 1
+    assert audit[0]['after'] == 70.85
+    assert audit[0]['rule_applied'] == "Rule: Steep Roof 7/12-9/12 Charges"
+    assert audit[0]['explanation'].endswith("(7/12-9/12 slopes = 70.85 SQ)")
+
+
+def test_camel_case_measurements_derive_ridges_hips_length():
+    """sample_data.json gives ridgeLength/hipLength only; the combined length is their sum."""
+    with open(SAMPLE_DATA) as f:
+        sample = json.load(f)
+    result = make_engine().process_claim(sample['line_items'], sample['roof_measurements'])
+
+    assert result['roof_measurements']['total_ridges_hips_length'] == 60.0
+    assert find_item(result['adjusted_line_items'], RIDGE_VENT)['quantity'] == 0.6
+
+    measurements, _ = engine_module.MEASUREMENT_SCHEMA.normalize(sample['roof_measurements'])
+    assert measurements["Total Ridges/Hips Length"] == {"value": 60}
+    model = engine_module.RoofMeasurements.from_dict(measurements)
+    assert model["Total Ridges/Hips Length"] == {"value": 60.0}
+
+
+def test_report_keys_without_combined_length_keep_baseline_output():
+    """A report in the report's own keys lacking 'Total Ridges/Hips Length' prices it as 0, as baseline did."""
+    engine = make_engine()
+    for claim in load_golden_claims():
+        roof_measurements = dict(claim['roof_measurements'])
+        del roof_measurements["Total Ridges/Hips Length"]
+        roof_measurements["Total Line Lengths (Ridges)"] = {"value": 80}
+        roof_measurements["Total Line Lengths (Hips)"] = {"value": 45}
+        result = engine.process_claim(claim['line_items'], roof_measurements)
+        explicit = engine.process_claim(claim['line_items'],
+                                        dict(roof_measurements, **{"Total Ridges/Hips Length": {"value": 0}}))
+
+        assert result['roof_measurements']['total_ridges_hips_length'] == 0
+        assert result == explicit
+
+
+def test_max_reductions_keep_sequential_record_order():
+    """Merged raises are recorded where their first candidate ran, ahead of later rules, with baseline's audit."""
+    line_items = [{"line_number": "1", "description": "Drip edge", "quantity": 9.24, "unit": "LF",
+                   "unit_price": 4.04, "RCV": 37.33, "dep_percent": 70, "depreciation_amount": 0, "ACV": 37.33}]
+    roof_measurements = {
+        "Total Roof Area": {"value": 408.7}, "Total Eaves Length": {"value": 65.94},
+        "Total Rakes Length": {"value": 195.0}, "Area for Pitch 1/12 (sq ft)": {"value": 1081.0},
+        "Area for Pitch 4/12 (sq ft)": {"value": 29.2}, "Area for Pitch 5/12 (sq ft)": {"value": 2176.21},
+        "Area for Pitch 6/12 (sq ft)": {"value": 592.94}, "Area for Pitch 7/12 (sq ft)": {"value": 2724.25},
+        "Area for Pitch 8/12 (sq ft)": {"value": 2115.0}, "Area for Pitch 9/12 (sq ft)": {"value": 1697.9},
+        "Area for Pitch 10/12 (sq ft)": {"value": 2424.0}, "Area for Pitch 12/12 (sq ft)": {"value": 691.64},
+        "Total Line Lengths (Ridges)": {"value": 156.0}, "Total Valleys Length": {"value": 111.0},
+        "Total Flashing Length": {"value": 118.26}, "Total Line Lengths (Hips)": {"value": 180.07},
+    }
+    result = make_engine().process_claim(line_items, roof_measurements)
+
+    assert [(entry['description'], entry['old_quantity'], entry['new_quantity'])
+            for entry in result['adjustment_results']['adjustments']] == [
+        ("Remove Additional charge for steep roof - 7/12 to 9/12 slope", 65.37, 65.3715),
+        (STEEP_7_9, 65.37, 65.3715),
+        ("Drip edge", 9.24, 260.94),
+    ]
+    assert [entry['rule_applied'] for entry in result['audit_log']] == (
+        ['Rule: Missing Line Item Addition'] * 6 + ['Rule: Drip Edge Adjustments']
+        + ['Rule: Missing Line Item Addition'] * 3)
+
+
+EXPLOIT_CALLS = []
+
+
+def _record_exploit(marker):
+    EXPLOIT_CALLS.append(marker)
+
+
+class _ArtifactExploit:
+    def __reduce__(self):
+        return (_record_exploit, ('loaded',))
+
+
+def test_indexed_line_items_keep_maxima_through_mutations():
+    """After appends, in-place edits, replacements and deletions, the maxima and lookups equal a fresh index."""
+    rnd = random.Random(9)
+    items = engine_module.IndexedLineItems(
+        {'line_number': str(number), 'description': f'Item {number % 5}', 'page_number': rnd.randint(1, 4)}
+        for number in range(1, 9))
+    for step in range(200):
+        operation = rnd.choice(['append', 'edit', 'replace', 'delete', 'describe'])
+        if operation == 'append' or len(items) < 2:
+            items.append({'line_number': rnd.choice([str(rnd.randint(1, 60)), 'N/A']),
+                          'description': f'Item {rnd.randint(0, 6)}', 'page_number': rnd.randint(1, 6)})
+        elif operation == 'edit':
+            item = rnd.choice(items)
+            item['line_number'], item['page_number'] = str(rnd.randint(1, 60)), rnd.randint(1, 6)
+            items.refresh(item)
+        elif operation == 'replace':
+            items.replace(rnd.randrange(len(items)), {'line_number': str(rnd.randint(1, 60)),
+                                                      'description': f'Item {rnd.randint(0, 6)}',
+                                                      'page_number': rnd.randint(1, 6)})
+        elif operation == 'delete':
+            del items[rnd.randrange(len(items))]
+        else:
+            items.set_description(rnd.choice(items), f'Item {rnd.randint(0, 6)}')
+        fresh = engine_module.IndexedLineItems(list(items))
+        assert items.next_line_number == fresh.next_line_number
+        assert items.max_page_number == fresh.max_page_number
+        for number in range(7):
+            assert items.find(f'Item {number}') is fresh.find(f'Item {number}')
+
+
+def test_performance_counters_cover_every_rule():
+    """performance=True reports every rule once per claim, matches the result's additions and feeds the aggregate."""
+    engine = make_engine()
+    rule_ids = {step.rule_id for step in engine.adjustment_plan.steps}
+    for claim in load_golden_claims():
+        before = engine_module.RULE_PERFORMANCE.snapshot()
+        plain = engine.process_claim(claim['line_items'], claim['roof_measurements'])
+        result = engine.process_claim(claim['line_items'], claim['roof_measurements'], performance=True)
+        after = engine_module.RULE_PERFORMANCE.snapshot()
+        rules = result.pop('performance')['rules']
+
+        assert result == plain
+        assert rule_ids | {'carrier_replacements', 'unit_price_comparison'} <= set(rules)
+        assert all(counters['evaluations'] == 1 and 0 <= counters['hits'] <= 1 and counters['nanoseconds'] >= 0
+                   for counters in rules.values())
+        assert sum(counters['additions'] for counters in rules.values()) == len(plain['adjustment_results']['additions'])
+        assert after['claims'] == before['claims'] + 1
+        for rule_id, counters in rules.items():
+            previous = before['rules'].get(rule_id, {'evaluations': 0, 'hits': 0})
+            assert after['rules'][rule_id]['evaluations'] == previous['evaluations'] + 1
+            assert after['rules'][rule_id]['hits'] == previous['hits'] + counters['hits']
+
+
+TIERED_CATALOG_CSV = """Description,Unit,Unit Price,Tier,Region
+Drip edge,LF,3.21,standard,north
+Drip edge,LF,2.5,economy,south
+Drip edge,LF,4.1,premium,north
+Ridge cap,LF,5.0,,
+"""
+
+
+@pytest.mark.parametrize('policy, price', [
+    ('last', 4.1), ('first', 3.21), ('max', 4.1), ('min', 2.5),
+    ('tier:economy', 2.5), ('tier:standard', 3.21), ('region:south', 2.5), ('region:north', 4.1),
+    ('region:west', 4.1),
+])
+def test_price_policy_selects_among_duplicate_rows(tmp_path, policy, price):
+    """Every price row of a duplicated description is kept; the policy picks the one lookups and the price pass use."""
+    csv_path = tmp_path / 'roof_master_macro.csv'
+    csv_path.write_text(TIERED_CATALOG_CSV)
+    engine = make_engine(catalog_path=str(csv_path), price_policy=policy)
+    line_items = [{'line_number': '1', 'description': 'Drip edge', 'quantity': 10.0, 'unit': 'LF',
+                   'unit_price': 1.0, 'RCV': 10.0, 'dep_percent': 0, 'ACV': 10.0, 'page_number': 1}]
+
+    assert engine.lookup_unit_price('Drip edge')['unit_price'] == price
+    assert engine.lookup_unit_price('Ridge cap')['unit_price'] == 5.0
+    result = engine.process_claim(line_items, {"Total Roof Area": {"value": 1500}})
+    assert result['adjusted_line_items'][0]['unit_price'] == price
+
+
+def test_unknown_price_policy_is_rejected():
+    """Policies other than the named ones, tier:<name> and region:<name> raise ValueError."""
+    for policy in ('median', 'tier:', 'carrier:acme'):
+        with pytest.raises(ValueError, match='Unknown price policy'):
+            make_engine(price_policy=policy)
+
+
+def test_catalog_artifact_round_trip_and_refuses_code(tmp_path):
+    """Artifacts load back to the same catalog, and one that references a callable is refused unrun."""
+    csv_path = tmp_path / 'roof_master_macro.csv'
+    csv_path.write_text(CATALOG_CSV)
+    artifact_path = engine_module.compile_catalog_artifact(str(csv_path))
+    with open(artifact_path, 'rb') as f:
+        data = f.read()
+    catalog = engine_module.RoofMasterCatalog.load_artifact(data)
+    assert dict(catalog.entries) == dict(engine_module.RoofMasterCatalog.from_rows(
+        engine_module.parse_roof_master_rows(CATALOG_CSV)).entries)
+
+    header = engine_module.CATALOG_ARTIFACT_MAGIC + bytes([engine_module.CATALOG_ARTIFACT_FORMAT])
+    hostile = header + pickle.dumps((None, {}, _ArtifactExploit(), None, None))
+    with pytest.raises(pickle.UnpicklingError):
+        engine_module.RoofMasterCatalog.load_artifact(hostile)
+    assert EXPLOIT_CALLS == []
+
+
+def test_catalog_shards_load_outside_lock(tmp_path, monkeypatch):
+    """Shard loads run without the residency lock held, and concurrent loads of a key share one version."""
+    (tmp_path / 'acme.csv').write_text(CATALOG_CSV)
+    shards = engine_module.CatalogShards(str(tmp_path))
+    build = engine_module.CatalogRegistry.build
+    lock_held = []
+
+    def checked_build(key, content, digest):
+        lock_held.append(shards._lock.locked())
+        return build(key, content, digest)
+
+    monkeypatch.setattr(engine_module.CatalogRegistry, 'build', staticmethod(checked_build))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        versions = list(executor.map(shards.get, ['acme'] * 32))
+
+    assert lock_held and not any(lock_held)
+    assert len({id(version) for version in versions}) == 1
+    assert versions[0].version == 1
+    stats = shards.stats()
+    assert stats['resident'] == ['acme']
+    assert stats['resident_bytes'] == versions[0].catalog.footprint()
+
+
+def test_catalog_shards_price_claims_by_key_and_evict_least_recent(tmp_path):
+    """Claims are priced against their catalog_key's shard; shards beyond max_bytes are evicted in LRU order."""
+    (tmp_path / 'beta').mkdir()
+    for key, price in [('acme', '4.21'), ('beta/tx', '5.21'), ('gamma', '6.21')]:
+        (tmp_path / f'{key}.csv').write_text(CATALOG_CSV.replace('3.21', price))
+    footprint = engine_module.CatalogShards(str(tmp_path)).get('acme').catalog.footprint()
+    shards = engine_module.CatalogShards(str(tmp_path), max_bytes=2 * footprint)
+    engine = make_engine(catalog_shards=shards)
+    line_items = [{'line_number': '1', 'description': 'Drip edge', 'quantity': 10.0, 'unit': 'LF',
+                   'unit_price': 1.0, 'RCV': 10.0, 'dep_percent': 0, 'ACV': 10.0, 'page_number': 1}]
+    claims = [(line_items, {}, key) for key in ('acme', 'beta/tx', 'gamma', None)]
+
+    results = list(engine.process_claims(claims))
+
+    assert [result['adjusted_line_items'][0]['unit_price'] for result in results[:3]] == [4.21, 5.21, 6.21]
+    assert 'catalog_version' not in results[3]
+    stats = shards.stats()
+    assert stats['resident'] == ['beta/tx', 'gamma'] and stats['evictions'] == 1
+    assert stats['resident_bytes'] <= shards.max_bytes
+
+    assert shards.get('acme').version == 1  # Same content after eviction: same version
+    (tmp_path / 'acme.csv').write_text(CATALOG_CSV.replace('3.21', '7.21'))
+    assert shards.get('acme').version == 2
+    with pytest.raises(ValueError):
+        shards.get('../acme')
+    with pytest.raises(FileNotFoundError):
+        shards.get('delta')
+
+
+def test_inexact_catalog_matches_are_recorded_in_the_audit_log(tmp_path):
+    """A price found by fuzzy matching records the catalog row, confidence and method; exact matches record nothing."""
+    csv_path = tmp_path / 'roof_master_macro.csv'
+    csv_path.write_text(CATALOG_CSV)
+    engine = make_engine(catalog_path=str(csv_path), fuzzy_threshold=0.8)
+    line_items = [
+        {'line_number': '1', 'description': 'Drip edges', 'quantity': 10.0, 'unit': 'LF',
+         'unit_price': 1.0, 'RCV': 10.0, 'dep_percent': 0, 'ACV': 10.0, 'page_number': 1},
+        {'line_number': '2', 'description': RIDGE_VENT, 'quantity': 10.0, 'unit': 'LF',
+         'unit_price': 1.0, 'RCV': 10.0, 'dep_percent': 0, 'ACV': 10.0, 'page_number': 1},
+    ]
+    result = engine.process_claim(line_items, {})
+    price_entries = {entry['description']: entry for entry in result['audit_log'] if entry['field'] == 'unit_price'}
+
+    match = engine.match_description('Drip edges')
+    assert price_entries['Drip edges']['catalog_match'] == {
+        'catalog_description': 'Drip edge', 'confidence': match['confidence'], 'method': 'fuzzy'}
+    assert price_entries['Drip edges']['after'] == 3.21
+    assert 'catalog_match' not in price_entries[RIDGE_VENT]
+
+
+def test_fuzzy_matcher_methods_threshold_and_cache(monkeypatch):
+    """Exact, normalized and fuzzy matches report their method; a weak match falls back; the cache stays bounded."""
+    catalog = {"Drip edge": {'unit': 'LF', 'unit_price': 3.21},
+               "Remove Drip edge": {'unit': 'LF', 'unit_price': 0.5},
+               "Ice & water barrier": {'unit': 'SF', 'unit_price': 1.85}}
+    matcher = engine_module.CatalogMatcher(catalog)
+
+    def describe(description, threshold):
+        ordinal, _, method = matcher.resolve(description, threshold)
+        return matcher.description(ordinal), method
+
+    assert describe("Drip edge", 0.8) == ("Drip edge", 'exact')
+    assert describe("DRIP  EDGE", 0.8) == ("Drip edge", 'normalized')
+    assert describe("Drip edgee", 0.8) == ("Drip edge", 'fuzzy')
+    assert describe("Remove drip edgee", 0.8) == ("Remove Drip edge", 'fuzzy')
+    assert describe("Ice and water barrier", 0.8) == ("Ice & water barrier", 'fuzzy')
+    assert describe("Drip edgee", None) == ("Drip edge", 'contains')
+    assert matcher.resolve("Gutter guard", 0.8) is None
+    assert describe("Drip edge - 2 story", 0.95) == ("Drip edge", 'contains')
+    assert matcher.resolve("Drip edgee", 0.8)[1] < 1.0
+
+    monkeypatch.setattr(engine_module.CatalogMatcher, 'MAX_CACHED_LOOKUPS', 16)
+    for number in range(100):
+        matcher.resolve(f"Drip edge {number}", 0.8)
+    assert len(matcher._cache) == 16
+
+
+class _CountingPosting(set):
+    """Trigram posting that counts the ordinals read from it."""
+
+    reads = 0
+
+    def __iter__(self):
+        for ordinal in super().__iter__():
+            _CountingPosting.reads += 1
+            yield ordinal
+
+
+def test_fuzzy_match_reads_bounded_postings(monkeypatch):
+    """Fuzzy matching counts at most FUZZY_MAX_POSTINGS postings, rarest trigrams first, and still finds the close row."""
+    catalog = {f"Shingle starter strip - variant {number}": {'unit': 'LF', 'unit_price': 1.0}
+               for number in range(3000)}
+    catalog["Ice & water barrier membrane"] = {'unit': 'SF', 'unit_price': 1.85}
+    matcher = engine_module.CatalogMatcher(catalog)
+    index = matcher._normalized_index
+    index._postings = {gram: _CountingPosting(posting) for gram, posting in index._postings.items()}
+    monkeypatch.setattr(engine_module.CatalogMatcher, 'FUZZY_MAX_POSTINGS', 500)
+
+    resolution = matcher.resolve("Ice and water barier membrane - shingle", fuzzy_threshold=0.6)
+
+    assert _CountingPosting.reads <= 500
+    assert matcher.description(resolution[0]) == "Ice & water barrier membrane"
+    assert resolution[2] == 'fuzzy'
+
+
+def test_line_item_round_trip_keeps_number_types():
+    """Ints stay ints and floats stay floats; only numeric strings are parsed."""
+    data = {'line_number': '1', 'description': STEEP_7_9, 'quantity': 3, 'unit_price': 17.45,
+            'RCV': '52.35', 'dep_percent': 0, 'page_number': 1, 'note': 'kept'}
+    round_trip = engine_module.LineItem.from_dict(data).to_dict()
+
+    assert round_trip == {**data, 'RCV': 52.35}
+    assert type(round_trip['quantity']) is int
+    assert type(round_trip['dep_percent']) is int
+
+
+@pytest.mark.parametrize('field, value, expected', [
+    ('page_number', 3.0, 3),
+    ('page_number', '3', 3),
+    ('page_number', '3.0', 3),
+    ('page_number', 3.5, 3.5),
+    ('page_number', '3.5', '3.5'),
+    ('page_number', 'iv', 'iv'),
+    ('quantity', '2.5', 2.5),
+    ('quantity', 'nan', 'nan'),
+    ('quantity', 'inf', 'inf'),
+    ('quantity', '-Infinity', '-Infinity'),
+])
+def test_line_item_coercion_keeps_values_it_cannot_convert_exactly(field, value, expected):
+    """Only integral page numbers become ints, and non-finite numeric strings stay strings."""
+    coerced = engine_module.LineItem.from_dict({'description': 'Drip edge', field: value})[field]
+
+    assert coerced == expected
+    assert type(coerced) is type(expected)
+
+
+def test_roof_measurements_keys_are_recognized():
+    """Every key RoofMeasurements.to_dict() emits maps to a report key, Net/Gross Roof Area included."""
+    model = engine_module.RoofMeasurements(
+        total_area=2500, net_area=2400, gross_area=2600, total_eaves_length=120,
+        total_rakes_length=80, total_ridges_length=40, total_hips_length=20, area_pitch_8_12=1200)
+    metrics = make_engine().parse_metrics(model.to_dict())
+
+    assert metrics.unrecognized_keys == []
+    assert metrics['total_ridges_hips_length'] == 60
+
+
+def test_engine_does_not_cache_results_by_default():
+    """Without a result_cache, every claim is processed; caching is opt-in."""
+    claim = load_golden_claims()[0]
+    engine = RoofAdjustmentEngine(trace=engine_module.EngineTrace('off'))
+    engine.process_claim(copy.deepcopy(claim['line_items']), claim['roof_measurements'])
+    result = engine.process_claim(copy.deepcopy(claim['line_items']), claim['roof_measurements'])
+
+    assert type(engine.result_cache) is engine_module.ResultCache
+    assert 'provenance' not in result
+
+
+@pytest.mark.parametrize('backend', ['memory', 'disk'])
+def test_result_cache_answers_repeated_claims(tmp_path, backend):
+    """A repeated claim is answered from the cache with the same result; copies and misses behave."""
+    cache = (engine_module.MemoryResultCache(maxsize=2) if backend == 'memory'
+             else engine_module.DiskResultCache(str(tmp_path / 'results')))
+    engine = make_engine(result_cache=cache)
+    claims = load_golden_claims()
+    claim = claims[0]
+
+    for render_text in (True, False):
+        first = engine.process_claim(claim['line_items'], claim['roof_measurements'], render_text=render_text)
+        hit = engine.process_claim(claim['line_items'], claim['roof_measurements'], render_text=render_text)
+        provenance = hit.pop('provenance')
+        assert 'provenance' not in first
+        assert provenance['source'] == 'cache' and provenance['backend'] == backend
+        assert hit == first
+
+    hit['adjusted_line_items'].clear()
+    again = engine.process_claim(claim['line_items'], claim['roof_measurements'])
+    assert again['adjusted_line_items']
+
+    edited = copy.deepcopy(claim['line_items'])
+    edited[0]['quantity'] = 999.0
+    assert 'provenance' not in engine.process_claim(edited, claim['roof_measurements'])
+    assert 'provenance' not in engine.process_claim(claim['line_items'], claim['roof_measurements'],
+                                                    use_cache=False)
+    if backend == 'memory':
+        for other in claims[1:3]:
+            engine.process_claim(other['line_items'], other['roof_measurements'])
+        assert 'provenance' not in engine.process_claim(claim['line_items'], claim['roof_measurements'])
+
+
+def test_fingerprint_covers_replacement_rules_and_schema_version(monkeypatch):
+    """Changing the carrier replacement rules or the result schema version changes a claim's fingerprint."""
+    claim = load_golden_claims()[0]
+    engine = make_engine()
+    fingerprint = engine.claim_fingerprint(claim['line_items'], claim['roof_measurements'])
+
+    monkeypatch.setattr(engine_module, 'RESULT_SCHEMA_VERSION', engine_module.RESULT_SCHEMA_VERSION + 1)
+    assert engine.claim_fingerprint(claim['line_items'], claim['roof_measurements']) != fingerprint
+    monkeypatch.undo()
+
+    rules = engine_module.REPLACEMENT_RULES + [(['Tear off shingles'], 'Remove Laminated - comp. shingle rfg. - w/out felt')]
+    monkeypatch.setattr(engine_module, 'COMPILED_REPLACEMENT_RULES', engine_module.CompiledReplacementRules(rules))
+    assert engine.claim_fingerprint(claim['line_items'], claim['roof_measurements']) != fingerprint
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(pytest.main([__file__, "-q"]))